@@ -25,4 +25,14 @@ python -m grpc_tools.protoc \
 --grpc_python_out="${OUT_DIR}" \
 "$SRC_DIR"/*.proto
 echo "generated → $OUT_DIR"
-done
\ No newline at end of file
+done
+
+# Event schemas (messages only) for services.common.codec
+EVENT_PROTOS=(envelope/v1/envelope.proto forex/v1/forex.proto ledger/v1/ledger.proto profile/v1/profile.proto)
+OUT_DIR="$ROOT_DIR/services/common/generated"
+mkdir -p "$OUT_DIR"
+python -m grpc_tools.protoc \
+-I "$PROTO_DIR" \
+--python_out="${OUT_DIR}" \
+"${EVENT_PROTOS[@]/#/$PROTO_DIR/}"
+echo "generated → $OUT_DIR"
@@ -6,6 +6,7 @@ from .auth import (
     decode_token,
     get_current_user,
     get_current_user_optional,
+    require_authenticated,
     require_roles,
     require_all_roles,
     require_client_role,
@@ -15,6 +16,7 @@ from .auth import (
     require_finance,
     require_auditor,
 )
+from .profiles import ProfileLoader
 from .userinfo import extract_user_info
 
 __all__ = [
@@ -24,6 +26,7 @@ __all__ = [
     # User authentication dependencies
     "get_current_user",
     "get_current_user_optional",
+    "require_authenticated",
     # Role-based access control
     "require_roles",
     "require_all_roles",
@@ -34,4 +37,6 @@ __all__ = [
     "require_ops",
     "require_finance",
     "require_auditor",
+    # Service clients
+    "ProfileLoader",
 ]
@@ -12,12 +12,17 @@ import os
 from typing import Optional, Dict, Any, List
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
-import httpx
 from functools import lru_cache
 import logging
 
-logger = logging.getLogger(__name__)
+# jose (with its crypto backends) and httpx are imported on first use; see prewarm()
+from .coldstart import record_first_auth
+from .db import enter_reporting_mode
+from .logs import sample
+from .ratelimit import RateLimit, enforce as enforce_rate_limit
+
+# Decode failures and denials repeat per request under attack; emit a sample of each
+logger = sample(logging.getLogger(__name__))
 
 # Security scheme for Bearer token
 security = HTTPBearer()
@@ -39,10 +44,13 @@ def get_wso2_public_key() -> str:
     Raises:
         HTTPException: If unable to fetch public key
     """
+    import httpx
+    from jose.jwk import construct
+
     jwks_url = f"{WSO2_IS_URL}/oauth2/jwks"
     
     try:
-        logger.info(f"Fetching JWKS from: {jwks_url}")
+        logger.info("Fetching JWKS from: %s", jwks_url)
         response = httpx.get(jwks_url, timeout=10.0, verify=False)  # TLS verification handled by truststore
         response.raise_for_status()
         jwks = response.json()
@@ -54,14 +62,13 @@ def get_wso2_public_key() -> str:
         key_data = jwks["keys"][0]
         
         # Convert JWK to PEM format
-        from jose.jwk import construct
         public_key = construct(key_data).to_pem().decode('utf-8')
         
         logger.info("Successfully fetched and cached WSO2 IS public key (PCI-DSS compliant)")
         return public_key
         
     except Exception as e:
-        logger.error(f"Failed to fetch WSO2 IS public key: {str(e)}")
+        logger.error("Failed to fetch WSO2 IS public key: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Unable to fetch authentication configuration: {str(e)}"
@@ -82,6 +89,8 @@ def decode_token(token: str) -> Dict[str, Any]:
     Raises:
         HTTPException: If token is invalid, expired, or malformed
     """
+    from jose import jwt, JWTError
+
     try:
         public_key = get_wso2_public_key()
         
@@ -100,7 +109,7 @@ def decode_token(token: str) -> Dict[str, Any]:
             }
         )
         
-        logger.debug(f"Token decoded successfully for subject: {payload.get('sub')}")
+        logger.debug("Token decoded successfully for subject: %s", payload.get("sub"))
         return payload
         
     except jwt.ExpiredSignatureError:
@@ -111,14 +120,14 @@ def decode_token(token: str) -> Dict[str, Any]:
             headers={"WWW-Authenticate": "Bearer"},
         )
     except jwt.JWTClaimsError as e:
-        logger.warning(f"Invalid token claims: {str(e)}")
+        logger.warning("Invalid token claims: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Invalid token claims: {str(e)}",
             headers={"WWW-Authenticate": "Bearer"},
         )
     except JWTError as e:
-        logger.error(f"JWT validation error: {str(e)}")
+        logger.error("JWT validation error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
@@ -178,16 +187,43 @@ async def get_current_user(
         "raw_payload": payload,  # For debugging and audit trails
     }
     
-    logger.debug(f"Authenticated user: {user_info.get('username') or user_info.get('client_id')}")
+    logger.debug("Authenticated user: %s", user_info["username"] or user_info["client_id"])
+    record_first_auth()
     return user_info
 
 
-def require_roles(required_roles: List[str]):
+def prewarm() -> bool:
+    """
+    Do the first request's auth work ahead of traffic: import jose and fetch the JWKS key.
+
+    Called by ``services.common.serve`` in the master before forking, so
+    workers share the loaded modules and the cached key. A failed fetch is
+    retried by the first request, as without prewarming.
+
+    Returns:
+        Whether the signing key is cached
+    """
+    from jose import jwt  # noqa: F401
+
+    try:
+        get_wso2_public_key()
+    except HTTPException:
+        return False
+    return True
+
+
+def require_roles(required_roles: List[str], reporting: bool = False, limit: Optional[RateLimit] = None):
     """
     Dependency factory to require specific realm roles.
     
+    Admitted requests are charged to the client's rate-limit bucket
+    (``services.common.ratelimit``); 429 once it is empty.
+    
     Args:
         required_roles: List of role names that user must have (OR logic)
+        reporting: Serve the request's ``connection()`` reads as follower
+            reads on the reporting pool (see ``services.common.db``)
+        limit: Limit for this dependency instead of the per-role ``RATE_LIMITS``
         
     Returns:
         FastAPI dependency function
@@ -202,14 +238,16 @@ def require_roles(required_roles: List[str]):
         
         if not any(role in user_roles for role in required_roles):
             logger.warning(
-                f"Access denied for {user.get('username')}: "
-                f"requires {required_roles}, has {user_roles}"
+                "Access denied for %s: requires %s, has %s", user.get("username"), required_roles, user_roles
             )
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Required role(s): {', '.join(required_roles)}"
             )
         
+        enforce_rate_limit(user, user_roles, limit)
+        if reporting:
+            enter_reporting_mode()
         return user
     
     return check_roles
@@ -230,10 +268,7 @@ def require_all_roles(required_roles: List[str]):
         
         if not all(role in user_roles for role in required_roles):
             missing_roles = [r for r in required_roles if r not in user_roles]
-            logger.warning(
-                f"Access denied for {user.get('username')}: "
-                f"missing roles {missing_roles}"
-            )
+            logger.warning("Access denied for %s: missing roles %s", user.get("username"), missing_roles)
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Missing required role(s): {', '.join(missing_roles)}"
@@ -259,10 +294,7 @@ def require_client_role(client_id: str, role: str):
         client_roles = user.get("client_roles", {}).get(client_id, [])
         
         if role not in client_roles:
-            logger.warning(
-                f"Access denied for {user.get('username')}: "
-                f"requires {client_id}.{role}"
-            )
+            logger.warning("Access denied for %s: requires %s.%s", user.get("username"), client_id, role)
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Required client role: {client_id}.{role}"
@@ -277,8 +309,16 @@ def require_client_role(client_id: str, role: str):
 require_admin = require_roles(["admin"])
 require_user = require_roles(["user"])
 require_ops = require_roles(["ops_user"])
-require_finance = require_roles(["finance"])
-require_auditor = require_roles(["auditor"])
+
+# Reporting roles read from followers so their queries stay off the payment path
+require_finance = require_roles(["finance"], reporting=True)
+require_auditor = require_roles(["auditor"], reporting=True)
+
+
+async def require_authenticated(user: Dict[str, Any] = Depends(get_current_user)) -> Dict[str, Any]:
+    """Any valid token, rate limited by the caller's roles (``*`` default if none match)."""
+    enforce_rate_limit(user, user.get("realm_roles", []))
+    return user
 
 
 # Optional: Make authentication optional
@@ -0,0 +1,97 @@
+"""
+Size and throughput of binary events versus the JSON they replace.
+
+Encodes ledger postings and rate ticks both ways and reports bytes per event
+and encode / full-decode / header-only-decode rates.
+
+Usage (inside any service container, after ``make proto``):
+    python -m services.common.bench_codec [events] [repeats]
+"""
+import json
+import random
+import sys
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Tuple
+
+from google.protobuf import json_format
+
+from .codec import CONTENT_TYPE, LedgerPosting, RateTick, decode, encode
+
+_BINARY_HEADERS = [("content-type", CONTENT_TYPE.encode())]
+_JSON_HEADERS = [("event-id", b"0"), ("event-type", b"x")]
+
+
+def _postings(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    events = []
+    for _ in range(n):
+        amount = rng.randint(1, 10 ** 9)
+        events.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "reference": f"PAY-{rng.randint(0, 10 ** 12):012d}",
+            "lines": [
+                {"account": f"wallet-{rng.randint(0, 10 ** 6)}", "amount": -amount, "currency": "EUR"},
+                {"account": f"wallet-{rng.randint(0, 10 ** 6)}", "amount": amount, "currency": "EUR"},
+            ],
+            "posted_at_ms": 1_790_000_000_000 + rng.randint(0, 10 ** 9),
+        })
+    return events
+
+
+def _ticks(n: int, rng: random.Random) -> List[Dict[str, Any]]:
+    pairs = [("EUR", "USD"), ("USD", "JPY"), ("GBP", "USD"), ("USD", "KWD")]
+    return [
+        {"base": base, "quote": quote, "scaled_rate": rng.randint(10 ** 7, 2 * 10 ** 10),
+         "ts_micros": 1_790_000_000_000_000 + i}
+        for i, (base, quote) in enumerate(rng.choice(pairs) for _ in range(n))
+    ]
+
+
+def _best(fn: Callable[[], Any], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _bench(name: str, event_type: str, dicts: List[Dict[str, Any]], message_type: Any,
+           repeats: int) -> Dict[str, Tuple[float, ...]]:
+    messages = [json_format.ParseDict(d, message_type()) for d in dicts]
+    as_json = [json.dumps(d, separators=(",", ":")).encode() for d in dicts]
+    as_binary = [encode(m, event_type, "0") for m in messages]
+    n = len(messages)
+
+    results = {
+        "json": (
+            sum(map(len, as_json)) / n,
+            n / _best(lambda: [json.dumps(d, separators=(",", ":")).encode() for d in dicts], repeats),
+            n / _best(lambda: [decode(v, _JSON_HEADERS).payload for v in as_json], repeats),
+            n / _best(lambda: [decode(v, _JSON_HEADERS).event_type for v in as_json], repeats),
+        ),
+        "protobuf": (
+            sum(map(len, as_binary)) / n,
+            n / _best(lambda: [encode(m, event_type, "0") for m in messages], repeats),
+            n / _best(lambda: [decode(v, _BINARY_HEADERS).payload for v in as_binary], repeats),
+            n / _best(lambda: [decode(v, _BINARY_HEADERS).event_type for v in as_binary], repeats),
+        ),
+    }
+    print(f"{name} (events={n} repeats={repeats})")
+    print(f"  {'':9} {'bytes/evt':>10} {'encode/s':>12} {'decode/s':>12} {'header/s':>12}")
+    for encoding, (size, enc, dec, hdr) in results.items():
+        print(f"  {encoding:9} {size:10.1f} {enc:12,.0f} {dec:12,.0f} {hdr:12,.0f}")
+    json_size, binary_size = results["json"][0], results["protobuf"][0]
+    print(f"  size: protobuf is {binary_size / json_size:.0%} of JSON")
+    return results
+
+
+def main(events: int = 100_000, repeats: int = 3) -> None:
+    rng = random.Random(42)
+    _bench("ledger.posting", "ledger.posting", _postings(events, rng), LedgerPosting, repeats)
+    _bench("forex.rate_tick", "forex.rate_tick", _ticks(events, rng), RateTick, repeats)
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
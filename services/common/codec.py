@@ -0,0 +1,274 @@
+"""
+Binary event encoding for Redpanda topics.
+
+An event is a protobuf ``envelope.v1.Envelope``: a small ``EventHeader``
+(event id and type, schema id, key, timestamp, attributes) followed by the
+payload message serialized as bytes. The payload type is named by the
+header's ``schema_id`` - the ids in ``SCHEMAS`` are the registry, and like
+field numbers they are never reused or repointed.
+
+Decoding is lazy: ``decode`` only wraps the record. ``Event.header`` parses
+the envelope, leaving the payload as opaque bytes, so routers and filters
+never build payload objects or look up schemas; ``Event.payload`` parses it
+on first access, with the message class taken from the process-wide
+``SchemaCache``.
+
+Compatibility:
+
+* payload schemas evolve the protobuf way (add fields under new numbers,
+  never change or reuse one); an incompatible change gets a new message and
+  a new schema id;
+* binary events carry a ``content-type: application/x-protobuf`` header;
+  records without it are the JSON events published before, and ``decode``
+  exposes them through the same ``Event`` interface;
+* producers keep writing JSON until ``EVENT_ENCODING=protobuf`` is set, so
+  consumers can be upgraded first; JSON events keep 64-bit integers as
+  numbers, as the JSON producers wrote them.
+
+Only ``profile.changed`` is produced through this module today. The ledger
+posting and rate tick schemas hold their ids for the ledger and forex
+producers (neither publishes to Redpanda yet) and are what
+``bench_codec.py`` measures.
+
+Malformed envelopes and payloads raise ``ValueError``. Stubs are produced
+by ``make proto`` into ``services/common/generated`` (not committed); images
+that import this module compile them at build time (see
+``profile/Dockerfile``).
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Type
+
+from google.protobuf import json_format, message_factory
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.descriptor_pool import Default as _default_pool
+from google.protobuf.message import DecodeError, Message
+
+# Importing the stubs registers every payload type in the default descriptor pool
+try:
+    from .generated.envelope.v1.envelope_pb2 import Envelope, EventHeader
+    from .generated.forex.v1.forex_pb2 import RateTick
+    from .generated.ledger.v1.ledger_pb2 import LedgerPosting, PostingLine
+    from .generated.profile.v1.profile_pb2 import ProfileChanged
+except ImportError as exc:
+    raise ImportError(
+        f"Event schema stubs are missing ({exc}); run `make proto` or build the image with the protos context"
+    ) from exc
+
+EVENT_ENCODING = os.getenv("EVENT_ENCODING", "json").lower()
+CONTENT_TYPE = "application/x-protobuf"
+
+# schema id -> fully qualified payload message name
+SCHEMAS: Dict[int, str] = {
+    1: "ledger.v1.LedgerPosting",
+    2: "forex.v1.RateTick",
+    3: "profile.v1.ProfileChanged",
+}
+
+
+class UnknownSchema(LookupError):
+    """The payload's schema id is not known to this process."""
+
+
+class SchemaCache:
+    """Schema id <-> message class, resolved from the descriptor pool once per id."""
+
+    def __init__(self, schemas: Mapping[int, str] = SCHEMAS) -> None:
+        self._names: Dict[int, str] = dict(schemas)
+        self._ids: Dict[str, int] = {name: schema_id for schema_id, name in self._names.items()}
+        self._classes: Dict[int, Type[Message]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, schema_id: int, full_name: str) -> None:
+        with self._lock:
+            known = self._names.get(schema_id)
+            if known is not None and known != full_name:
+                raise ValueError(f"Schema id {schema_id} already names {known}")
+            self._names[schema_id] = full_name
+            self._ids[full_name] = schema_id
+
+    def schema_id(self, message: Message) -> int:
+        full_name = message.DESCRIPTOR.full_name
+        try:
+            return self._ids[full_name]
+        except KeyError:
+            raise UnknownSchema(f"{full_name} has no schema id") from None
+
+    def message_class(self, schema_id: int) -> Type[Message]:
+        cls = self._classes.get(schema_id)
+        if cls is not None:
+            return cls
+        name = self._names.get(schema_id)
+        if name is None:
+            raise UnknownSchema(f"Unknown schema id {schema_id}")
+        try:
+            cls = message_factory.GetMessageClass(_default_pool().FindMessageTypeByName(name))
+        except KeyError:
+            raise UnknownSchema(f"Schema {schema_id} ({name}) is not loaded") from None
+        self._classes[schema_id] = cls
+        return cls
+
+
+schemas = SchemaCache()
+
+
+def encode(
+    message: Message,
+    event_type: str,
+    event_id: str = "",
+    key: Optional[str] = None,
+    attributes: Optional[Mapping[str, str]] = None,
+    cache: SchemaCache = schemas,
+) -> bytes:
+    """Serialize ``message`` into an envelope."""
+    envelope = Envelope()
+    header = envelope.header
+    header.event_id = event_id
+    header.event_type = event_type
+    header.schema_id = cache.schema_id(message)
+    header.occurred_at_ms = int(time.time() * 1000)
+    if key:
+        header.key = key
+    if attributes:
+        header.attributes.update(attributes)
+    envelope.payload = message.SerializeToString()
+    return envelope.SerializeToString()
+
+
+def pack(
+    message: Message,
+    event_type: str,
+    event_id: str = "",
+    key: Optional[str] = None,
+    encoding: str = EVENT_ENCODING,
+) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Encode ``message`` for publishing in the configured encoding.
+
+    Returns:
+        ``(value, headers)``; ``headers`` holds the content type for binary events
+    """
+    if encoding == "protobuf":
+        return encode(message, event_type, event_id, key), {"content-type": CONTENT_TYPE}
+    body = json_format.MessageToDict(message, preserving_proto_field_name=True)
+    _int64_as_numbers(message.DESCRIPTOR, body)
+    return json.dumps(body, separators=(",", ":")).encode(), {}
+
+
+_INT64_TYPES = frozenset({
+    FieldDescriptor.TYPE_INT64, FieldDescriptor.TYPE_SINT64, FieldDescriptor.TYPE_SFIXED64,
+    FieldDescriptor.TYPE_UINT64, FieldDescriptor.TYPE_FIXED64,
+})
+
+
+def _int64_as_numbers(descriptor: Descriptor, body: Dict[str, Any]) -> None:
+    """
+    Turn the 64-bit integers ``MessageToDict`` renders as strings back into
+    numbers, in place, so JSON events keep the types the JSON producers used.
+    """
+    for field in descriptor.fields:
+        value = body.get(field.name)
+        if value is None:
+            continue
+        if field.message_type is not None and field.message_type.GetOptions().map_entry:
+            # Maps come out as JSON objects; only their values can be int64 or messages
+            field = field.message_type.fields_by_name["value"]
+            if field.message_type is not None:
+                _each_message(field.message_type, value.values())
+            elif field.type in _INT64_TYPES:
+                value.update((key, int(item)) for key, item in value.items())
+        elif field.message_type is not None:
+            _each_message(field.message_type, value if isinstance(value, list) else [value])
+        elif field.type in _INT64_TYPES:
+            body[field.name] = [int(item) for item in value] if isinstance(value, list) else int(value)
+
+
+def _each_message(descriptor: Descriptor, bodies: Any) -> None:
+    # Well-known types have their own JSON forms
+    if not descriptor.full_name.startswith("google.protobuf."):
+        for body in bodies:
+            _int64_as_numbers(descriptor, body)
+
+
+def _parse(cls: Type[Message], data: bytes) -> Message:
+    try:
+        return cls.FromString(data)
+    except DecodeError as exc:
+        raise ValueError(f"Malformed {cls.DESCRIPTOR.full_name}: {exc}") from None
+
+
+class Event:
+    """A decoded (or not yet decoded) event; JSON and binary records look the same."""
+
+    __slots__ = ("value", "headers", "_cache", "_binary", "_envelope", "_header", "_payload")
+
+    def __init__(self, value: bytes, headers: Sequence[Tuple[str, Any]] = (), cache: SchemaCache = schemas) -> None:
+        self.value = value
+        self.headers = headers
+        self._cache = cache
+        self._binary: Optional[bool] = None
+        self._envelope: Optional[Envelope] = None
+        self._header: Optional[EventHeader] = None
+        self._payload: Any = None
+
+    def _kafka_header(self, name: str) -> str:
+        for key, value in self.headers:
+            if key == name:
+                return value.decode() if isinstance(value, bytes) else value
+        return ""
+
+    @property
+    def binary(self) -> bool:
+        if self._binary is None:
+            self._binary = self._kafka_header("content-type").startswith(CONTENT_TYPE)
+        return self._binary
+
+    @property
+    def header(self) -> EventHeader:
+        """Routing metadata; the payload bytes are not decoded."""
+        if self._header is None:
+            if self.binary:
+                # Parsing the envelope leaves the payload as opaque bytes
+                self._envelope = _parse(Envelope, self.value)
+                self._header = self._envelope.header
+            else:
+                self._header = EventHeader(
+                    event_id=self._kafka_header("event-id"),
+                    event_type=self._kafka_header("event-type"),
+                )
+        return self._header
+
+    @property
+    def event_type(self) -> str:
+        return self.header.event_type
+
+    @property
+    def payload(self) -> Any:
+        """The payload message (binary events) or dict (JSON events), parsed on first access."""
+        if self._payload is None:
+            if self.binary:
+                schema_id = self.header.schema_id
+                self._payload = _parse(self._cache.message_class(schema_id), self._envelope.payload)
+            else:
+                self._payload = json.loads(self.value)
+        return self._payload
+
+    def get(self, field: str, default: Any = None) -> Any:
+        """One payload field, whichever the encoding."""
+        payload = self.payload
+        if isinstance(payload, Message):
+            return getattr(payload, field, default)
+        return payload.get(field, default)
+
+
+def decode(value: bytes, headers: Sequence[Tuple[str, Any]] = (), cache: SchemaCache = schemas) -> Event:
+    """Wrap a record value and its Kafka headers; nothing is parsed yet."""
+    return Event(value, headers, cache)
+
+
+def decode_record(record: Any, cache: SchemaCache = schemas) -> Event:
+    """``decode`` for a consumer record (aiokafka or ``memory_broker``)."""
+    return decode(record.value, record.headers or (), cache)
+
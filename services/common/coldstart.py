@@ -0,0 +1,103 @@
+"""
+Cold-start accounting: import-time breakdown and time to first authenticated request.
+
+``startup_stats()`` reports, for this process:
+
+* ``loaded_seconds`` - from process start until the application module
+  was imported (set by ``serve``);
+* ``first_auth_seconds`` - from process start to the first request that
+  passed token validation, i.e. the time a new pod needs before it serves
+  real traffic (JWKS fetch and lazy imports included).
+
+Process start is read from ``/proc`` so the clock starts when the container
+does, not when this module is imported. Workers forked by ``serve`` inherit
+the master's start time.
+
+``import_profile("main")`` runs ``python -X importtime`` on a module in a
+child process and returns the slowest imports, for finding what to defer.
+"""
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _process_started_at() -> float:
+    """Wall-clock start of this process (Linux), else now."""
+    try:
+        with open("/proc/self/stat") as stat:
+            # Field 22, counted after the parenthesised command name
+            start_ticks = int(stat.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as proc_stat:
+            boot = next(int(line.split()[1]) for line in proc_stat if line.startswith("btime "))
+        return boot + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+STARTED_AT = _process_started_at()
+
+_stats: Dict[str, Optional[float]] = {"loaded_seconds": None, "first_auth_seconds": None}
+
+
+def record_loaded() -> None:
+    _stats["loaded_seconds"] = max(0.0, time.time() - STARTED_AT)
+
+
+def record_first_auth() -> None:
+    """Note the first successfully authenticated request; later calls are a dict lookup."""
+    if _stats["first_auth_seconds"] is not None:
+        return
+    elapsed = max(0.0, time.time() - STARTED_AT)
+    _stats["first_auth_seconds"] = elapsed
+    logger.info("Time to first authenticated request: %.3fs (pid %d)", elapsed, os.getpid())
+
+
+def startup_stats() -> Dict[str, Any]:
+    return {"started_at": STARTED_AT, "pid": os.getpid(), **_stats}
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def import_profile(module: str, top: Optional[int] = 20, by: str = "self_us") -> List[ImportTime]:
+    """
+    The ``top`` slowest imports when importing ``module`` in a fresh interpreter.
+
+    Args:
+        module: Module to import (run with this process's ``sys.path`` and cwd)
+        top: Number of entries to return (``None`` for all)
+        by: ``"self_us"`` or ``"cumulative_us"``
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, sys.path))}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, timeout=120,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append(ImportTime(name.strip(), int(self_us), int(cumulative_us)))
+    if result.returncode != 0:
+        logger.warning("Import profile of %s failed: %s", module, result.stderr.strip().splitlines()[-1:])
+    entries.sort(key=lambda entry: getattr(entry, by), reverse=True)
+    return entries[:top]
+
+
+def log_import_profile(module: str, top: int = 20) -> None:
+    """Log the slowest imports of ``module`` by self time."""
+    entries = import_profile(module, top=None)
+    total = max((entry.cumulative_us for entry in entries), default=0)
+    logger.info("Import profile of %s (total %.0fms), slowest by self time:", module, total / 1000)
+    for entry in entries[:top]:
+        logger.info("  %8.1fms self %8.1fms cumulative  %s",
+                    entry.self_us / 1000, entry.cumulative_us / 1000, entry.module)
@@ -0,0 +1,299 @@
+"""
+Shared Redpanda consumer loop.
+
+One ``BatchConsumer`` per process and consumer group replaces hand-written
+poll loops:
+
+* records are fetched in batches (``getmany``) and handed to the handler one
+  partition-batch at a time - in offset order within a partition, partitions
+  in parallel (bounded by ``concurrency``);
+* plain (sync) handlers run on the default thread pool;
+* offsets are committed only after the handler finished the batch;
+* a partition whose backlog exceeds ``max_buffered`` records is paused and
+  resumed once it drains below half of that, so a slow handler never makes
+  the process buffer unbounded data (and never stops polling, which would
+  trigger a rebalance);
+* on rebalance, revoked partitions finish their in-flight batch and commit
+  before they are released;
+* a failing poll (broker unreachable, fetch error) is logged and retried
+  with backoff instead of killing the loop;
+* ``metrics()`` reports lag, backlog and throughput per partition, plus
+  ``healthy`` - false while polls keep failing or if the poller stopped.
+
+``client`` can be any object with the aiokafka consumer surface used here;
+``services.common.memory_broker`` provides one for tests.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Union
+
+try:
+    from aiokafka.abc import ConsumerRebalanceListener as _ListenerBase
+except ImportError:  # aiokafka is optional for in-process (test) brokers
+    _ListenerBase = object
+
+logger = logging.getLogger(__name__)
+
+KAFKA_BROKERS = os.getenv("KAFKA_BROKERS", "")
+CONSUMER_MAX_BATCH = int(os.getenv("CONSUMER_MAX_BATCH", "500"))
+CONSUMER_POLL_MS = int(os.getenv("CONSUMER_POLL_MS", "200"))
+CONSUMER_MAX_BUFFERED = int(os.getenv("CONSUMER_MAX_BUFFERED", "5000"))
+CONSUMER_CONCURRENCY = int(os.getenv("CONSUMER_CONCURRENCY", "8"))
+CONSUMER_DRAIN_SECONDS = float(os.getenv("CONSUMER_DRAIN_SECONDS", "10"))
+# Unhealthy once no poll has succeeded for this long
+CONSUMER_STALL_SECONDS = float(os.getenv("CONSUMER_STALL_SECONDS", "30"))
+
+Handler = Callable[[List[Any]], Union[None, Awaitable[None]]]
+
+
+class _Partition:
+    """Backlog and counters of one assigned partition."""
+
+    def __init__(self, tp: Any) -> None:
+        self.tp = tp
+        self.backlog: Deque[Any] = deque()
+        self.worker: Optional[asyncio.Task] = None
+        self.wakeup = asyncio.Event()
+        self.committed: Optional[int] = None
+        self.processed: Optional[int] = None  # next offset to process
+        self.paused = False
+        self.busy = False
+        self.records = 0
+        self.errors = 0
+        self.handler_seconds = 0.0
+
+
+class BatchConsumer:
+    """
+    Batched, per-partition-ordered consumer with commit-after-process and backpressure.
+
+    Args:
+        topics: Topics to subscribe to
+        handler: ``handler(records)`` for one in-order batch of a single partition
+        group_id: Consumer group; ``None`` reads without a group (no commits)
+        client: Pre-built consumer (tests); otherwise an ``AIOKafkaConsumer``
+        on_error: ``"retry"`` re-delivers a failed batch after a pause;
+            ``"skip"`` logs it and moves on
+    """
+
+    def __init__(
+        self,
+        topics: Sequence[str],
+        handler: Handler,
+        group_id: Optional[str],
+        brokers: str = KAFKA_BROKERS,
+        client: Any = None,
+        max_batch: int = CONSUMER_MAX_BATCH,
+        max_buffered: int = CONSUMER_MAX_BUFFERED,
+        concurrency: int = CONSUMER_CONCURRENCY,
+        auto_offset_reset: str = "earliest",
+        on_error: str = "retry",
+    ) -> None:
+        if on_error not in ("retry", "skip"):
+            raise ValueError("on_error must be 'retry' or 'skip'")
+        self.topics = list(topics)
+        self.handler = handler
+        self.group_id = group_id
+        self.brokers = brokers
+        self.max_batch = max_batch
+        self.max_buffered = max_buffered
+        self.on_error = on_error
+        self.auto_offset_reset = auto_offset_reset
+        self._client = client
+        self._is_async = inspect.iscoroutinefunction(handler)
+        self._slots = asyncio.Semaphore(concurrency)
+        self._partitions: Dict[Any, _Partition] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._started_at = 0.0
+        self._polled_at = 0.0
+        self.poll_errors = 0
+        self.last_poll_error: Optional[str] = None
+
+    # ------------------------------------------------------------- lifecycle
+
+    async def start(self) -> None:
+        if self._client is None:
+            from aiokafka import AIOKafkaConsumer
+
+            self._client = AIOKafkaConsumer(
+                bootstrap_servers=self.brokers,
+                group_id=self.group_id,
+                enable_auto_commit=False,
+                auto_offset_reset=self.auto_offset_reset,
+                max_poll_records=self.max_batch,
+            )
+        await self._client.start()
+        self._client.subscribe(self.topics, listener=_RebalanceListener(self))
+        self._started_at = self._polled_at = time.monotonic()
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        await self._release(list(self._partitions))
+        await self._client.stop()
+
+    # ----------------------------------------------------------------- loop
+
+    async def _poll_loop(self) -> None:
+        failures = 0
+        while True:
+            try:
+                batches = await self._client.getmany(timeout_ms=CONSUMER_POLL_MS, max_records=self.max_batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                failures += 1
+                self.poll_errors += 1
+                self.last_poll_error = repr(exc)
+                logger.warning("Poll of %s failed (%d in a row): %s", self.topics, failures, exc)
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** min(failures, 6)))
+                continue
+            failures = 0
+            self._polled_at = time.monotonic()
+            for tp, records in batches.items():
+                if not records:
+                    continue
+                part = self._partition(tp)
+                part.backlog.extend(records)
+                part.wakeup.set()
+                if not part.paused and len(part.backlog) >= self.max_buffered:
+                    self._client.pause(tp)
+                    part.paused = True
+
+    def _partition(self, tp: Any) -> _Partition:
+        part = self._partitions.get(tp)
+        if part is None:
+            part = self._partitions[tp] = _Partition(tp)
+            part.worker = asyncio.create_task(self._partition_loop(part))
+        return part
+
+    async def _partition_loop(self, part: _Partition) -> None:
+        while True:
+            if not part.backlog:
+                part.wakeup.clear()
+                await part.wakeup.wait()
+                continue
+            batch = [part.backlog.popleft() for _ in range(min(self.max_batch, len(part.backlog)))]
+            await self._process(part, batch)
+            if part.paused and len(part.backlog) <= self.max_buffered // 2:
+                self._client.resume(part.tp)
+                part.paused = False
+
+    async def _process(self, part: _Partition, batch: List[Any]) -> None:
+        part.busy = True
+        try:
+            await self._run_handler(part, batch)
+        finally:
+            part.busy = False
+
+    async def _run_handler(self, part: _Partition, batch: List[Any]) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                async with self._slots:
+                    if self._is_async:
+                        await self.handler(batch)
+                    else:
+                        await asyncio.to_thread(self.handler, batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                part.errors += 1
+                if self.on_error == "retry":
+                    logger.warning("Handler failed on %s at offset %s, retrying: %s", part.tp, batch[0].offset, exc)
+                    await asyncio.sleep(min(30.0, 0.5 * 2 ** min(part.errors, 6)))
+                    continue
+                logger.error("Handler failed on %s at offsets %s-%s, skipped: %s",
+                             part.tp, batch[0].offset, batch[-1].offset, exc)
+            part.handler_seconds += time.monotonic() - started
+            part.records += len(batch)
+            part.processed = batch[-1].offset + 1
+            await self._commit(part)
+            return
+
+    async def _commit(self, part: _Partition) -> None:
+        if self.group_id is None or part.processed is None or part.processed == part.committed:
+            return
+        try:
+            await self._client.commit({part.tp: part.processed})
+            part.committed = part.processed
+        except Exception as exc:
+            # The next batch commits a later offset anyway
+            logger.warning("Offset commit failed on %s: %s", part.tp, exc)
+
+    async def _release(self, tps: Sequence[Any]) -> None:
+        """Let in-flight batches of ``tps`` finish, commit them and forget the partitions."""
+        parts = [self._partitions.pop(tp) for tp in tps if tp in self._partitions]
+        for part in parts:
+            part.backlog.clear()
+            if part.worker is not None:
+                # Cancelling between batches is safe; a batch in the handler gets
+                # CONSUMER_DRAIN_SECONDS to finish, otherwise it is redelivered
+                deadline = time.monotonic() + CONSUMER_DRAIN_SECONDS
+                while part.busy and not part.worker.done() and time.monotonic() < deadline:
+                    await asyncio.sleep(0.01)
+                part.worker.cancel()
+                await asyncio.gather(part.worker, return_exceptions=True)
+            await self._commit(part)
+
+    # -------------------------------------------------------------- metrics
+
+    def healthy(self) -> bool:
+        """Whether the poller is running and has polled successfully within ``CONSUMER_STALL_SECONDS``."""
+        if self._poller is None or self._poller.done():
+            return False
+        return time.monotonic() - self._polled_at < CONSUMER_STALL_SECONDS
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-partition lag (highwater minus next offset to process), backlog and throughput."""
+        partitions = []
+        total_lag = 0
+        for tp, part in sorted(self._partitions.items(), key=lambda item: (item[0].topic, item[0].partition)):
+            highwater = self._client.highwater(tp)
+            lag = None
+            if highwater is not None and part.processed is not None:
+                lag = max(0, highwater - part.processed)
+                total_lag += lag
+            partitions.append({
+                "topic": tp.topic,
+                "partition": tp.partition,
+                "lag": lag,
+                "backlog": len(part.backlog),
+                "paused": part.paused,
+                "committed": part.committed,
+                "records": part.records,
+                "errors": part.errors,
+                "avg_handler_ms": round(part.handler_seconds / part.records * 1000, 3) if part.records else None,
+            })
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        records = sum(p["records"] for p in partitions)
+        return {
+            "group_id": self.group_id,
+            "topics": self.topics,
+            "healthy": self.healthy(),
+            "poll_errors": self.poll_errors,
+            "last_poll_error": self.last_poll_error,
+            "lag": total_lag,
+            "records_per_second": round(records / uptime, 1) if uptime else 0.0,
+            "partitions": partitions,
+        }
+
+
+class _RebalanceListener(_ListenerBase):
+    """Commit and release revoked partitions before the group reassigns them."""
+
+    def __init__(self, consumer: BatchConsumer) -> None:
+        self._consumer = consumer
+
+    async def on_partitions_revoked(self, revoked: Any) -> None:
+        await self._consumer._release(list(revoked))
+
+    async def on_partitions_assigned(self, assigned: Any) -> None:
+        return None
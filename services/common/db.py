@@ -0,0 +1,144 @@
+"""
+Shared CockroachDB access (SQLAlchemy Core over psycopg2).
+
+One engine per process, created lazily from ``DB_URL`` so that importing a
+service module never opens a connection.
+
+Reporting reads (auditor / finance routes) use a second, smaller pool and
+run as ``AS OF SYSTEM TIME`` follower reads: any replica can serve them, they
+never wait on or block the intents of live postings, and a statement timeout
+caps how long one report can hold a connection. ``reporting()`` opens such a
+transaction explicitly; inside a request admitted by ``require_finance`` or
+``require_auditor`` (reporting mode), ``connection()`` does the same.
+"""
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import MetaData, create_engine, event
+from sqlalchemy.engine import Connection, Engine
+
+DB_URL = os.getenv("DB_URL", "")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+REPORTING_DB_URL = os.getenv("REPORTING_DB_URL", "") or DB_URL
+REPORTING_POOL_SIZE = int(os.getenv("REPORTING_POOL_SIZE", "3"))
+REPORTING_MAX_OVERFLOW = int(os.getenv("REPORTING_MAX_OVERFLOW", "2"))
+# Seconds a report waits for a pooled connection before failing
+REPORTING_POOL_TIMEOUT = float(os.getenv("REPORTING_POOL_TIMEOUT", "5"))
+REPORTING_STATEMENT_TIMEOUT_MS = int(os.getenv("REPORTING_STATEMENT_TIMEOUT_MS", "30000"))
+# follower_read_timestamp() (a few seconds behind, served by the nearest
+# replica) or a fixed negative interval such as -30s
+REPORTING_STALENESS = os.getenv("REPORTING_STALENESS", "follower_read_timestamp()")
+
+_INTERVAL = re.compile(r"^-\d+(us|ms|s|m|h)$")
+_reporting_mode: ContextVar[bool] = ContextVar("reporting_mode", default=False)
+
+# Tables of every service register here; each service creates only its own
+metadata = MetaData()
+
+
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    """
+    Process-wide engine for the transactional (payment-path) pool.
+
+    Raises:
+        RuntimeError: If ``DB_URL`` is not configured
+    """
+    if not DB_URL:
+        raise RuntimeError("DB_URL is not configured")
+    return create_engine(
+        DB_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        future=True,
+    )
+
+
+@contextmanager
+def transaction() -> Iterator[Connection]:
+    """Connection inside a transaction; commits on success, rolls back on error."""
+    with get_engine().begin() as conn:
+        yield conn
+
+
+def _as_of() -> str:
+    if REPORTING_STALENESS == "follower_read_timestamp()":
+        return REPORTING_STALENESS
+    if not _INTERVAL.match(REPORTING_STALENESS):
+        raise RuntimeError(f"Invalid REPORTING_STALENESS: {REPORTING_STALENESS!r}")
+    return f"'{REPORTING_STALENESS}'"
+
+
+@lru_cache(maxsize=1)
+def get_reporting_engine() -> Engine:
+    """
+    Process-wide engine for reporting reads, separate from the payment-path pool.
+
+    Raises:
+        RuntimeError: If neither ``REPORTING_DB_URL`` nor ``DB_URL`` is configured
+    """
+    if not REPORTING_DB_URL:
+        raise RuntimeError("REPORTING_DB_URL is not configured")
+    engine = create_engine(
+        REPORTING_DB_URL,
+        pool_size=REPORTING_POOL_SIZE,
+        max_overflow=REPORTING_MAX_OVERFLOW,
+        pool_timeout=REPORTING_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        future=True,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _session_limits(dbapi_conn, _record) -> None:
+        cursor = dbapi_conn.cursor()
+        cursor.execute(f"SET statement_timeout = {REPORTING_STATEMENT_TIMEOUT_MS}")
+        cursor.close()
+        dbapi_conn.commit()
+
+    return engine
+
+
+def enter_reporting_mode() -> None:
+    """Route this request's (context's) ``connection()`` reads to follower reads."""
+    _reporting_mode.set(True)
+
+
+def in_reporting_mode() -> bool:
+    return _reporting_mode.get()
+
+
+@contextmanager
+def reporting(as_of: Optional[datetime] = None) -> Iterator[Connection]:
+    """
+    Read-only follower-read transaction on the reporting pool.
+
+    Data is as of ``REPORTING_STALENESS`` ago, so it never reflects writes
+    made moments before in the same request. Pass ``as_of`` (timezone-aware,
+    older than the staleness bound) to read a fixed snapshot instead, e.g. the
+    same one from several processes.
+    """
+    with get_reporting_engine().begin() as conn:
+        if as_of is None:
+            conn.exec_driver_sql(f"SET TRANSACTION AS OF SYSTEM TIME {_as_of()}")
+        else:
+            conn.exec_driver_sql(f"SET TRANSACTION AS OF SYSTEM TIME '{as_of.isoformat()}'")
+        yield conn
+
+
+@contextmanager
+def connection() -> Iterator[Connection]:
+    """Plain connection for reads (autocommit per statement); follower reads in reporting mode."""
+    if _reporting_mode.get():
+        with reporting() as conn:
+            yield conn
+        return
+    with get_engine().connect() as conn:
+        yield conn
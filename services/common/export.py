@@ -0,0 +1,191 @@
+"""
+Streaming table exports as NDJSON or Arrow IPC.
+
+Rows are read through a server-side cursor (``yield_per``) in chunks of
+``EXPORT_CHUNK_ROWS`` inside one follower-read transaction (``db.reporting``),
+so the export is a consistent snapshot and never touches the payment-path
+pool. Each chunk is encoded and handed to the response before the next one is
+fetched: the cursor only advances as fast as the client reads (uvicorn stops
+accepting body chunks while the socket buffer is full), and memory holds one
+chunk whatever the export size.
+
+    @app.get("/entries/export")
+    async def export(format: str = "ndjson", user = Depends(require_auditor)):
+        return await export_response(select(entries), entries.c, format, "entries")
+
+Arrow output is an IPC *stream* (schema, one record batch per chunk, end
+marker), readable with ``pyarrow.ipc.open_stream``. pyarrow is imported only
+when an Arrow export is requested.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Iterator, List, Optional, Sequence
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import BigInteger, Boolean, Column, Date, DateTime, Integer, Numeric
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeout
+from sqlalchemy.sql import Select
+
+from .db import reporting
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+_DONE = object()
+
+
+def iter_chunks(stmt: Select, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[List[Any]]:
+    """Rows of ``stmt`` in chunks, from a server-side cursor in a follower-read transaction."""
+    with reporting() as conn:
+        result = conn.execution_options(yield_per=chunk_rows).execute(stmt)
+        for rows in result.partitions():
+            yield rows
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+
+def ndjson_chunks(chunks: Iterator[List[Any]], columns: Sequence[Column]) -> Iterator[bytes]:
+    names = [column.name for column in columns]
+    dumps = json.JSONEncoder(default=_json_default, separators=(",", ":")).encode
+    for rows in chunks:
+        yield "".join(dumps(dict(zip(names, row))) + "\n" for row in rows).encode()
+
+
+def arrow_type(column: Column) -> Any:
+    import pyarrow as pa
+
+    kind = column.type
+    if isinstance(kind, BigInteger):
+        return pa.int64()
+    if isinstance(kind, Integer):
+        return pa.int32()
+    if isinstance(kind, Boolean):
+        return pa.bool_()
+    if isinstance(kind, DateTime):
+        return pa.timestamp("us", tz="UTC" if kind.timezone else None)
+    if isinstance(kind, Date):
+        return pa.date32()
+    if isinstance(kind, Numeric):
+        return pa.decimal128(kind.precision or 38, kind.scale or 0)
+    return pa.string()
+
+
+class _Buffer:
+    """File-like sink the IPC writer flushes into; drained after every batch."""
+
+    def __init__(self) -> None:
+        self.parts: List[bytes] = []
+        self.closed = False
+
+    def write(self, data: Any) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        return None
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def arrow_chunks(chunks: Iterator[List[Any]], columns: Sequence[Column]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = pa.schema([pa.field(column.name, arrow_type(column), nullable=column.nullable) for column in columns])
+    buffer = _Buffer()
+    with pa.ipc.new_stream(pa.PythonFile(buffer, mode="w"), schema) as writer:
+        for rows in chunks:
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield buffer.drain()
+    yield buffer.drain()  # end-of-stream marker (and the schema, if there were no rows)
+
+
+def encode(fmt: str, chunks: Iterator[List[Any]], columns: Sequence[Column]) -> Iterator[bytes]:
+    if fmt == "ndjson":
+        return ndjson_chunks(chunks, columns)
+    if fmt == "arrow":
+        return arrow_chunks(chunks, columns)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+async def iterate_in_thread(gen: Iterator[Any]) -> AsyncIterator[Any]:
+    """
+    Drive a blocking generator from the event loop, one item per thread hop.
+
+    The next item is only produced once the previous one was consumed. If the
+    consumer stops early (client disconnect), the generator is closed after
+    any in-flight step finishes, which releases its cursor and connection.
+    """
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(asyncio.to_thread(next, gen, _DONE))
+            item = await asyncio.shield(pending)
+            pending = None
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        if pending is not None:
+            await asyncio.gather(pending, return_exceptions=True)
+        await asyncio.to_thread(gen.close)
+
+
+async def export_response(stmt: Select, columns: Sequence[Column], fmt: str, name: str) -> StreamingResponse:
+    """
+    Stream ``stmt`` as an NDJSON or Arrow download.
+
+    The first chunk is read before the response starts, so an unavailable
+    database or exhausted reporting pool is a 503 instead of a truncated body.
+
+    Raises:
+        HTTPException: 400 for an unknown format, 503 if no reporting connection is available
+    """
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    body = encode(fmt, iter_chunks(stmt), columns)
+    try:
+        first = await asyncio.to_thread(next, body, _DONE)
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Export capacity exhausted, retry later")
+    except OperationalError as exc:
+        logger.error("Export of %s failed to start: %s", name, exc)
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    async def stream() -> AsyncIterator[bytes]:
+        if first is _DONE:
+            return
+        yield first
+        async for chunk in iterate_in_thread(body):
+            yield chunk
+
+    extension = "ndjson" if fmt == "ndjson" else "arrows"
+    return StreamingResponse(
+        stream(),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
@@ -0,0 +1,314 @@
+"""
+Conditional GETs and a short-TTL response cache for read-mostly endpoints.
+
+Endpoints opt in with ``@cacheable``, optionally naming a cheap ``version``
+function of the path parameters (an in-memory lookup - it runs before the
+handler and before authentication):
+
+    app.add_middleware(ResponseCacheMiddleware)
+
+    @app.get("/profiles/{profile_id}")
+    @cacheable(ttl=5, version=lambda params: cache.peek_version(params["profile_id"]))
+    async def get_profile(profile_id: str, user = Depends(get_current_user)): ...
+
+For a GET of an opted-in route carrying a bearer token the handler has
+already accepted (with a ``200``) on this instance, the middleware:
+
+* answers ``If-None-Match`` with ``304`` straight away when the ETag still
+  matches the current version - the handler, auth included, never runs;
+* serves a response cached for the same token, path, query and version
+  within ``ttl`` seconds;
+
+any other request runs the handler, which tags a ``200`` with an ETag (from
+the version, or a hash of the body when the route has none), caches it and
+records the token as verified until it expires.
+
+Token hashes and ETags are keyed with ``HTTP_CACHE_SECRET`` (random per
+process when unset; set it to share ETags across instances), so nobody can
+compute a valid ETag, and an unverified or forged token always reaches the
+handler - a ``304`` never reveals that a resource exists or its version.
+Responses are ``Cache-Control: private, no-cache``: clients keep them but
+revalidate each poll, which costs one dictionary lookup here.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Tuple
+
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "50000"))
+HTTP_CACHE_MAX_BODY = int(os.getenv("HTTP_CACHE_MAX_BODY", str(256 * 1024)))
+# How long a verified token without ``exp`` may skip the handler
+HTTP_CACHE_VERIFIED_SECONDS = float(os.getenv("HTTP_CACHE_VERIFIED_SECONDS", "300"))
+_SECRET = os.getenv("HTTP_CACHE_SECRET", "").encode() or os.urandom(32)
+
+Version = Callable[[Mapping[str, Any]], Optional[Hashable]]
+
+
+class CachePolicy:
+    __slots__ = ("ttl", "version")
+
+    def __init__(self, ttl: float, version: Optional[Version]) -> None:
+        self.ttl = ttl
+        self.version = version
+
+
+def cacheable(ttl: float = 2.0, version: Optional[Version] = None) -> Callable[[Callable], Callable]:
+    """
+    Mark an endpoint as cacheable per principal (place under ``@app.get``).
+
+    Args:
+        ttl: Seconds a cached response may be served without running the handler
+        version: ``version(path_params)`` -> current resource version, or
+            ``None`` when it is not known cheaply (the handler then runs)
+    """
+    def mark(endpoint: Callable) -> Callable:
+        endpoint.__cache_policy__ = CachePolicy(ttl, version)
+        return endpoint
+
+    return mark
+
+
+class _Entry:
+    __slots__ = ("expires", "etag", "headers", "body")
+
+    def __init__(self, expires: float, etag: bytes, headers: List[Tuple[bytes, bytes]], body: bytes) -> None:
+        self.expires = expires
+        self.etag = etag
+        self.headers = headers
+        self.body = body
+
+
+class ResponseCache:
+    """Bounded LRU of responses with per-entry expiry; safe to share across threads."""
+
+    def __init__(self, maxsize: int = HTTP_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[_Entry]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry.expires < now:
+                if entry is not None:
+                    del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: Hashable, entry: _Entry) -> None:
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._data), "hits": self.hits, "not_modified": self.not_modified,
+                "misses": self.misses}
+
+
+class VerifiedTokens:
+    """Token hashes a handler accepted, each until its token expires; bounded LRU."""
+
+    def __init__(self, maxsize: int = HTTP_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._expires: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, principal: str, expires: float) -> None:
+        with self._lock:
+            self._expires[principal] = expires
+            self._expires.move_to_end(principal)
+            while len(self._expires) > self.maxsize:
+                self._expires.popitem(last=False)
+
+    def __contains__(self, principal: str) -> bool:
+        expires = self._expires.get(principal)
+        return expires is not None and expires > time.time()
+
+
+def _principal(headers: List[Tuple[bytes, bytes]]) -> Optional[Tuple[str, float]]:
+    """
+    Keyed hash of an unexpired bearer token and when it expires (``exp`` read
+    without verification - the caller only trusts hashes a handler accepted).
+    """
+    auth = next((value for name, value in headers if name == b"authorization"), None)
+    if auth is None or not auth[:7].lower() == b"bearer ":
+        return None
+    token = auth[7:].strip()
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(token.split(b".")[1] + b"=="))
+    except (IndexError, ValueError):
+        return None
+    exp = claims.get("exp") if isinstance(claims, dict) else None
+    now = time.time()
+    if isinstance(exp, (int, float)) and exp < now:
+        return None
+    expires = float(exp) if isinstance(exp, (int, float)) else now + HTTP_CACHE_VERIFIED_SECONDS
+    return hashlib.blake2b(token, digest_size=16, key=_SECRET).hexdigest(), expires
+
+
+def _etag(*parts: Any) -> bytes:
+    digest = hmac.new(_SECRET, repr(parts).encode(), hashlib.blake2b).hexdigest()[:24]
+    return f'W/"{digest}"'.encode()
+
+
+def _matches(if_none_match: Optional[bytes], etag: bytes, wildcard: bool = True) -> bool:
+    if if_none_match is None:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(b",")]
+    return etag in candidates or (wildcard and b"*" in candidates)
+
+
+_CACHE_CONTROL = (b"cache-control", b"private, no-cache")
+
+
+class ResponseCacheMiddleware:
+    """ASGI middleware applying ``@cacheable`` policies (see module docstring)."""
+
+    def __init__(self, app: Any, cache: Optional[ResponseCache] = None) -> None:
+        self.app = app
+        self.cache = cache or ResponseCache()
+        self.verified = VerifiedTokens()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if not HTTP_CACHE_ENABLED or scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope)
+        policy = getattr(getattr(route[0], "endpoint", None), "__cache_policy__", None) if route else None
+        token = _principal(scope["headers"]) if policy is not None else None
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+
+        principal = token[0]
+        params = route[1]
+        path, query = scope["path"], scope["query_string"]
+        if_none_match = next((value for name, value in scope["headers"] if name == b"if-none-match"), None)
+        version = self._version(policy, params)
+        if principal not in self.verified:
+            # Never answer for a token the handler has not accepted
+            self.cache.misses += 1
+            await self._run(scope, receive, send, policy, version, token, if_none_match)
+            return
+
+        if version is not None:
+            etag = _etag(principal, path, query, version)
+            # Only the exact tag: ``*`` would answer for a resource this token never read
+            if _matches(if_none_match, etag, wildcard=False):
+                self.cache.not_modified += 1
+                await self._send_not_modified(send, etag)
+                return
+            entry = self.cache.get((principal, path, query, version))
+        else:
+            entry = self.cache.get((principal, path, query, None))
+            if entry is not None and _matches(if_none_match, entry.etag):
+                self.cache.not_modified += 1
+                await self._send_not_modified(send, entry.etag)
+                return
+        if entry is not None:
+            self.cache.hits += 1
+            await self._send_entry(scope, send, entry)
+            return
+
+        self.cache.misses += 1
+        await self._run(scope, receive, send, policy, version, token, if_none_match)
+
+    @staticmethod
+    def _route(scope: Dict[str, Any]) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", ()):
+            match, child = route.matches(scope)
+            if match == Match.FULL:
+                return route, child.get("path_params", {})
+        return None
+
+    @staticmethod
+    def _version(policy: CachePolicy, params: Mapping[str, Any]) -> Optional[Hashable]:
+        if policy.version is None:
+            return None
+        try:
+            return policy.version(params)
+        except Exception as exc:
+            logger.warning("Cache version lookup failed: %s", exc)
+            return None
+
+    async def _run(self, scope: Dict[str, Any], receive: Callable, send: Callable, policy: CachePolicy,
+                   version: Optional[Hashable], token: Tuple[str, float], if_none_match: Optional[bytes]) -> None:
+        # ``version`` was read before the handler runs: read after, an invalidation
+        # and refill in between would tag this body with the next version
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+        size = 0
+        passthrough = False
+
+        async def capture(message: Dict[str, Any]) -> None:
+            nonlocal size, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start.update(message)
+                if start["status"] != 200:
+                    passthrough = True
+                    await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if size > HTTP_CACHE_MAX_BODY:
+                # Too large to cache: release what was held back and stream the rest
+                passthrough = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks),
+                            "more_body": message.get("more_body", False)})
+                return
+            if not message.get("more_body", False):
+                await self._finish(scope, send, policy, version, token, if_none_match, start, b"".join(chunks))
+
+        await self.app(scope, receive, capture)
+
+    async def _finish(self, scope: Dict[str, Any], send: Callable, policy: CachePolicy, version: Optional[Hashable],
+                      token: Tuple[str, float], if_none_match: Optional[bytes], start: Dict[str, Any],
+                      body: bytes) -> None:
+        principal, expires = token
+        # A 200 means the handler's auth accepted this token
+        self.verified.add(principal, expires)
+        path, query = scope["path"], scope["query_string"]
+        etag = _etag(principal, path, query, version) if version is not None else _etag(principal, path, query, body)
+        headers = [(k, v) for k, v in start["headers"] if k not in (b"etag", b"cache-control")]
+        headers += [(b"etag", etag), _CACHE_CONTROL]
+        if scope["method"] == "GET":
+            entry = _Entry(time.monotonic() + policy.ttl, etag, headers, body)
+            self.cache.set((principal, path, query, version), entry)
+        if _matches(if_none_match, etag):
+            await self._send_not_modified(send, etag)
+            return
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _send_entry(scope: Dict[str, Any], send: Callable, entry: _Entry) -> None:
+        await send({"type": "http.response.start", "status": 200, "headers": entry.headers})
+        await send({"type": "http.response.body", "body": entry.body if scope["method"] == "GET" else b""})
+
+    @staticmethod
+    async def _send_not_modified(send: Callable, etag: bytes) -> None:
+        await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", etag), _CACHE_CONTROL]})
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,218 @@
+"""
+Process-wide logging: JSON lines written by a background thread.
+
+    from services.common.logs import configure_logging
+    configure_logging()
+
+Request threads never touch stdout. The root logger gets a ``QueueHandler``
+that only puts the record on a bounded in-memory queue; a ``QueueListener``
+thread formats it and writes it out. Formatting is deferred as well: records
+whose arguments are immutable (strings, numbers) are formatted on the
+listener thread, so a message that is filtered out or sampled away costs no
+string building. If the queue is full, records are dropped and counted
+rather than blocking the caller.
+
+Output is one JSON object per line (``ts``, ``level``, ``logger``, ``msg``,
+``service``, ``pid``, ``exc`` and any ``extra=`` fields); ``LOG_FORMAT=text``
+gives plain lines for local runs.
+
+``SamplingFilter`` caps how often one message template is emitted: at most
+``LOG_SAMPLE_BURST`` records per template per ``LOG_SAMPLE_WINDOW`` seconds,
+the rest are dropped and reported as ``suppressed`` on the next record that
+gets through. Attach it to loggers on hot paths (``sample(logger)``) so a
+flood of auth failures produces a handful of lines, not one per request.
+
+The listener is restarted in forked children (uvicorn workers from
+``services.common.serve``, Celery pool processes), each with its own queue.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Tuple
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "10"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "color_message",  # the last one is uvicorn's ANSI variant of msg
+}
+_IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def __init__(self, service: str = SERVICE_NAME) -> None:
+        super().__init__()
+        self.service = service
+        self._dumps = json.JSONEncoder(default=str, ensure_ascii=False, separators=(",", ":")).encode
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "service": self.service,
+            "pid": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return self._dumps(entry)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Enqueues without formatting where that is safe; drops (and counts) when full."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if isinstance(args, dict):
+            args = tuple(args.values())
+        if not args or all(isinstance(arg, _IMMUTABLE) for arg in args):
+            # Cannot change before the listener formats it
+            return record
+        # Mutable arguments are rendered now, as the caller saw them
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _ReportingListener(QueueListener):
+    """Writes a note about records dropped on a full queue once there is room again."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]", handler: logging.Handler,
+                 source: _NonBlockingQueueHandler) -> None:
+        super().__init__(log_queue, handler, respect_handler_level=True)
+        self.source = source
+        self._reported = 0
+
+    def handle(self, record: logging.LogRecord) -> None:
+        dropped = self.source.dropped
+        if dropped != self._reported:
+            note = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                     "Log queue full, dropped %d records", (dropped - self._reported,), None)
+            self._reported = dropped
+            super().handle(note)
+        super().handle(record)
+
+
+class SamplingFilter(logging.Filter):
+    """At most ``burst`` records per message template and level per ``window`` seconds."""
+
+    def __init__(self, window: float = LOG_SAMPLE_WINDOW, burst: int = LOG_SAMPLE_BURST) -> None:
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._counts: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        template = record.msg if isinstance(record.msg, str) else type(record.msg).__name__
+        key = (template, record.levelno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._counts.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state is not None else 0
+                if len(self._counts) > 10_000:
+                    self._counts.clear()
+                self._counts[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+def sample(logger: logging.Logger, window: float = LOG_SAMPLE_WINDOW, burst: int = LOG_SAMPLE_BURST) -> logging.Logger:
+    """Attach a ``SamplingFilter`` to ``logger`` (records logged directly on it)."""
+    logger.addFilter(SamplingFilter(window, burst))
+    return logger
+
+
+_state: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _start(handler: _NonBlockingQueueHandler, output: logging.Handler) -> None:
+    listener = _ReportingListener(handler.queue, output, handler)
+    listener.start()
+    _state["listener"] = listener
+
+
+def _restart_in_child() -> None:
+    # The parent's listener thread does not exist here and its queue may be mid-operation
+    handler = _state.get("handler")
+    if handler is None:
+        return
+    handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler.dropped = 0
+    _start(handler, _state["output"])
+
+
+def shutdown_logging() -> None:
+    """Write out what is queued and stop the listener (runs at exit; call before ``os._exit``)."""
+    listener: Optional[QueueListener] = _state.get("listener")
+    if listener is not None and getattr(listener, "_thread", None) is not None:
+        listener.stop()  # drains what is queued
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, service: str = SERVICE_NAME) -> None:
+    """Route the root logger through the queue to stdout; safe to call more than once."""
+    with _lock:
+        if "handler" in _state:
+            logging.getLogger().setLevel(level)
+            return
+        output = logging.StreamHandler(sys.stdout)
+        if fmt == "json":
+            output.setFormatter(JsonFormatter(service))
+        else:
+            output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handler = _NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        _state.update(handler=handler, output=output)
+        _start(handler, output)
+        atexit.register(shutdown_logging)
+        os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def stats() -> Dict[str, Any]:
+    handler = _state.get("handler")
+    if handler is None:
+        return {"configured": False}
+    return {"configured": True, "queued": handler.queue.qsize(), "dropped": handler.dropped}
@@ -0,0 +1,141 @@
+"""
+In-process stand-in for Redpanda.
+
+Implements the slice of the aiokafka consumer API that ``BatchConsumer``
+uses (subscribe with a rebalance listener, ``getmany``, pause/resume,
+commit, highwater), so consumers can be exercised without a broker:
+
+    broker = InMemoryBroker(partitions=4)
+    consumer = BatchConsumer(["payments.events"], handler, "ledger",
+                             client=broker.consumer("ledger"))
+    await consumer.start()
+    broker.produce("payments.events", b"...", key=b"payer-1")
+"""
+import asyncio
+import time
+import zlib
+from collections import namedtuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+ConsumerRecord = namedtuple(
+    "ConsumerRecord", ["topic", "partition", "offset", "timestamp", "key", "value", "headers"]
+)
+
+
+class InMemoryBroker:
+    """Topics of fixed partition count; committed offsets per group."""
+
+    def __init__(self, partitions: int = 1) -> None:
+        self.partitions = partitions
+        self.logs: Dict[TopicPartition, List[ConsumerRecord]] = {}
+        self.committed: Dict[str, Dict[TopicPartition, int]] = {}
+        self._arrived = asyncio.Event()
+
+    def topic_partitions(self, topic: str) -> List[TopicPartition]:
+        return [TopicPartition(topic, p) for p in range(self.partitions)]
+
+    def produce(self, topic: str, value: bytes, key: Optional[bytes] = None,
+                partition: Optional[int] = None, headers: Sequence = ()) -> ConsumerRecord:
+        if partition is None:
+            partition = zlib.crc32(key) % self.partitions if key is not None else 0
+        tp = TopicPartition(topic, partition)
+        log = self.logs.setdefault(tp, [])
+        record = ConsumerRecord(topic, partition, len(log), int(time.time() * 1000), key, value, list(headers))
+        log.append(record)
+        self._arrived.set()
+        return record
+
+    def consumer(self, group_id: Optional[str] = None, auto_offset_reset: str = "earliest") -> "InMemoryConsumer":
+        return InMemoryConsumer(self, group_id, auto_offset_reset)
+
+
+class InMemoryConsumer:
+    """Single-member consumer: owns every partition of its topics until ``reassign``."""
+
+    def __init__(self, broker: InMemoryBroker, group_id: Optional[str], auto_offset_reset: str) -> None:
+        self._broker = broker
+        self._group_id = group_id
+        self._reset = auto_offset_reset
+        self._listener: Any = None
+        self._assigned: List[TopicPartition] = []
+        self._positions: Dict[TopicPartition, int] = {}
+        self._paused: Set[TopicPartition] = set()
+        self.commits = 0
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+    def subscribe(self, topics: Iterable[str], listener: Any = None) -> None:
+        self._listener = listener
+        self._assign([tp for topic in topics for tp in self._broker.topic_partitions(topic)])
+
+    def _assign(self, partitions: List[TopicPartition]) -> None:
+        self._assigned = list(partitions)
+        committed = self._broker.committed.get(self._group_id, {}) if self._group_id else {}
+        for tp in partitions:
+            if tp in committed:
+                self._positions[tp] = committed[tp]
+            else:
+                end = len(self._broker.logs.get(tp, []))
+                self._positions[tp] = 0 if self._reset == "earliest" else end
+        self._paused.clear()
+
+    async def reassign(self, partitions: List[TopicPartition]) -> None:
+        """Simulate a rebalance: revoke everything, then assign ``partitions``."""
+        if self._listener is not None:
+            await self._listener.on_partitions_revoked(set(self._assigned))
+        self._assign(partitions)
+        if self._listener is not None:
+            await self._listener.on_partitions_assigned(set(partitions))
+
+    def assignment(self) -> Set[TopicPartition]:
+        return set(self._assigned)
+
+    async def getmany(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        batches = self._fetch(max_records)
+        if not batches and timeout_ms:
+            self._broker._arrived.clear()
+            try:
+                await asyncio.wait_for(self._broker._arrived.wait(), timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            batches = self._fetch(max_records)
+        return batches
+
+    def _fetch(self, max_records: Optional[int]) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        budget = max_records or 1 << 30
+        batches: Dict[TopicPartition, List[ConsumerRecord]] = {}
+        for tp in self._assigned:
+            if tp in self._paused or budget <= 0:
+                continue
+            log = self._broker.logs.get(tp, [])
+            start = self._positions[tp]
+            records = log[start:start + budget]
+            if records:
+                batches[tp] = records
+                self._positions[tp] = start + len(records)
+                budget -= len(records)
+        return batches
+
+    def pause(self, *partitions: TopicPartition) -> None:
+        self._paused.update(partitions)
+
+    def resume(self, *partitions: TopicPartition) -> None:
+        self._paused.difference_update(partitions)
+
+    def paused(self) -> Set[TopicPartition]:
+        return set(self._paused)
+
+    async def commit(self, offsets: Dict[TopicPartition, int]) -> None:
+        self._broker.committed.setdefault(self._group_id, {}).update(offsets)
+        self.commits += 1
+
+    async def committed(self, tp: TopicPartition) -> Optional[int]:
+        return self._broker.committed.get(self._group_id, {}).get(tp)
+
+    def highwater(self, tp: TopicPartition) -> Optional[int]:
+        return len(self._broker.logs.get(tp, []))
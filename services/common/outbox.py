@@ -0,0 +1,252 @@
+"""
+Transactional outbox.
+
+A service records the events describing a state change with ``add_event`` on
+the *same* connection/transaction that makes the change, so the event exists
+if and only if the change committed, and the request never waits on Kafka.
+
+``OutboxRelay`` then drains the table to Redpanda: it leases a batch of
+unsent rows (``FOR UPDATE SKIP LOCKED``, so several relays can run), publishes
+them through one idempotent, compressed producer, waits for every ack and
+marks the whole batch sent with a single ``UPDATE``. A relay that dies
+between the ack and the update leaves its lease to expire and the batch is
+published again; every message carries its outbox ``event-id`` header so
+consumers can drop those replays.
+
+Delivery is at-least-once and *not* ordered per key: with several relays,
+``SKIP LOCKED`` lets a newer event of a key be published while an older one
+is leased elsewhere, and a batch whose publish failed is only retried after
+its lease expires, behind events recorded later. Consumers that care about
+order compare a version carried in the payload (as ``ProfileChanged`` does)
+instead of relying on arrival order.
+
+Run a relay with ``python -m services.common.outbox``.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Mapping, Optional
+
+from sqlalchemy import Column, DateTime, Index, LargeBinary, String, Table, Text, delete, select, update
+from sqlalchemy.engine import Connection
+
+from .db import get_engine, metadata, transaction
+
+logger = logging.getLogger(__name__)
+
+KAFKA_BROKERS = os.getenv("KAFKA_BROKERS", "")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "1000"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "0.2"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "30"))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+OUTBOX_COMPRESSION = os.getenv("OUTBOX_COMPRESSION", "gzip")
+
+outbox_events = Table(
+    "outbox_events",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("topic", String(249), nullable=False),
+    Column("key", String(256)),
+    Column("event_type", String(128), nullable=False),
+    Column("payload", LargeBinary, nullable=False),
+    Column("headers", Text),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("leased_until", DateTime(timezone=True)),
+    Column("leased_by", String(128)),
+    Column("sent_at", DateTime(timezone=True)),
+    Index("outbox_events_unsent_idx", "created_at", postgresql_where="sent_at IS NULL"),
+)
+
+
+def create_schema() -> None:
+    metadata.create_all(get_engine(), tables=[outbox_events])
+
+
+def add_event(
+    conn: Connection,
+    topic: str,
+    event_type: str,
+    payload: Any,
+    key: Optional[str] = None,
+    headers: Optional[Mapping[str, str]] = None,
+) -> str:
+    """
+    Record an event inside the caller's transaction.
+
+    Args:
+        conn: Connection of the transaction making the state change
+        topic: Destination topic
+        event_type: Sent as the ``event-type`` header
+        payload: Raw bytes, a mapping encoded as JSON, or a protobuf message
+            encoded by ``services.common.codec.pack`` (``EVENT_ENCODING``)
+        key: Partition key; events with the same key land on the same
+            partition but may arrive out of order (see module docstring)
+        headers: Extra message headers
+
+    Returns:
+        Event id (also sent as the ``event-id`` header)
+    """
+    event_id = str(uuid.uuid4())
+    if hasattr(payload, "SerializeToString"):
+        from .codec import pack
+
+        payload, codec_headers = pack(payload, event_type, event_id, key)
+        headers = {**(headers or {}), **codec_headers}
+    elif not isinstance(payload, (bytes, bytearray)):
+        payload = json.dumps(payload, default=str, separators=(",", ":")).encode()
+    conn.execute(
+        outbox_events.insert().values(
+            id=event_id,
+            topic=topic,
+            key=key,
+            event_type=event_type,
+            payload=bytes(payload),
+            headers=json.dumps(dict(headers)) if headers else None,
+            created_at=datetime.now(timezone.utc),
+        )
+    )
+    return event_id
+
+
+def lease_batch(owner: str, limit: int = OUTBOX_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """Lease up to ``limit`` unsent events, oldest first, skipping rows other relays hold."""
+    now = datetime.now(timezone.utc)
+    candidates = (
+        select(outbox_events.c.id)
+        .where(outbox_events.c.sent_at.is_(None))
+        .where((outbox_events.c.leased_until.is_(None)) | (outbox_events.c.leased_until < now))
+        .order_by(outbox_events.c.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(outbox_events)
+        .where(outbox_events.c.id.in_(candidates.scalar_subquery()))
+        .values(leased_until=now + timedelta(seconds=OUTBOX_LEASE_SECONDS), leased_by=owner)
+        .returning(
+            outbox_events.c.id,
+            outbox_events.c.topic,
+            outbox_events.c.key,
+            outbox_events.c.event_type,
+            outbox_events.c.payload,
+            outbox_events.c.headers,
+            outbox_events.c.created_at,
+        )
+    )
+    with transaction() as conn:
+        rows = [dict(row._mapping) for row in conn.execute(stmt)]
+    rows.sort(key=lambda row: row["created_at"])
+    return rows
+
+
+def mark_sent(event_ids: List[str], owner: str) -> None:
+    """Mark a published batch in one statement (only rows this relay still holds)."""
+    if not event_ids:
+        return
+    with transaction() as conn:
+        conn.execute(
+            update(outbox_events)
+            .where(outbox_events.c.id.in_(event_ids))
+            .where(outbox_events.c.leased_by == owner)
+            .values(sent_at=datetime.now(timezone.utc))
+        )
+
+
+def purge_sent(older_than: timedelta = timedelta(hours=OUTBOX_RETENTION_HOURS)) -> int:
+    cutoff = datetime.now(timezone.utc) - older_than
+    with transaction() as conn:
+        result = conn.execute(
+            delete(outbox_events).where(outbox_events.c.sent_at.is_not(None)).where(outbox_events.c.sent_at < cutoff)
+        )
+    return result.rowcount
+
+
+class OutboxRelay:
+    """Polls the outbox and publishes events to Redpanda in batches."""
+
+    def __init__(self, brokers: str = KAFKA_BROKERS, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_seconds: float = OUTBOX_POLL_SECONDS) -> None:
+        self.brokers = brokers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._producer: Any = None
+        self.published = 0
+
+    async def start(self) -> None:
+        from aiokafka import AIOKafkaProducer
+
+        self._producer = AIOKafkaProducer(
+            bootstrap_servers=self.brokers,
+            enable_idempotence=True,
+            acks="all",
+            compression_type=OUTBOX_COMPRESSION or None,
+            linger_ms=20,
+            max_batch_size=1024 * 1024,
+        )
+        await self._producer.start()
+
+    async def stop(self) -> None:
+        if self._producer is not None:
+            await self._producer.stop()
+            self._producer = None
+
+    async def relay_once(self) -> int:
+        """Publish one leased batch; returns how many events were sent."""
+        rows = await asyncio.to_thread(lease_batch, self.owner, self.batch_size)
+        if not rows:
+            return 0
+        acks = []
+        for row in rows:
+            headers = [("event-id", row["id"].encode()), ("event-type", row["event_type"].encode())]
+            if row["headers"]:
+                headers.extend((k, str(v).encode()) for k, v in json.loads(row["headers"]).items())
+            acks.append(await self._producer.send(
+                row["topic"],
+                row["payload"],
+                key=row["key"].encode() if row["key"] else None,
+                headers=headers,
+            ))
+        await asyncio.gather(*acks)
+        await asyncio.to_thread(mark_sent, [row["id"] for row in rows], self.owner)
+        self.published += len(rows)
+        return len(rows)
+
+    async def run(self) -> None:
+        loops = 0
+        while True:
+            try:
+                sent = await self.relay_once()
+            except Exception as exc:
+                logger.warning("Outbox relay batch failed, retrying: %s", exc)
+                sent = 0
+                await asyncio.sleep(1)
+            loops += 1
+            if loops % 3000 == 0:
+                try:
+                    await asyncio.to_thread(purge_sent)
+                except Exception as exc:
+                    logger.warning("Outbox purge failed: %s", exc)
+            if sent < self.batch_size:
+                await asyncio.sleep(self.poll_seconds)
+
+
+async def _main() -> None:
+    await asyncio.to_thread(create_schema)
+    relay = OutboxRelay()
+    await relay.start()
+    try:
+        await relay.run()
+    finally:
+        await relay.stop()
+
+
+if __name__ == "__main__":
+    from .logs import configure_logging
+
+    configure_logging()
+    asyncio.run(_main())
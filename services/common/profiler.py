@@ -0,0 +1,305 @@
+"""
+On-demand CPU profiling for live services and Celery workers.
+
+Two tools, both producing collapsed stacks (``frame;frame;frame weight`` per
+line - feed them to ``flamegraph.pl`` or speedscope):
+
+* **Sampling** - ``sample(seconds)`` snapshots every thread's Python stack
+  ``PROFILE_SAMPLE_HZ`` times a second from a background thread; weights are
+  sample counts. Exposed as ``GET /debug/profile?seconds=N`` (admin only) on
+  every service and as a Celery control command:
+
+      celery -A celery_app.celery_app control profile 10 --timeout 20
+
+  For prefork workers the command asks each pool process to sample itself
+  (``SIGUSR2``) and merges their stacks; the worker does not consume
+  while the command runs, so keep profiles short.
+
+* **One request, deterministic** - an admin request sent with
+  ``X-Profile: 1`` is traced call by call (``sys.setprofile`` on every
+  thread, filtered to that request's context, so concurrent requests and
+  thread-pool hops are attributed correctly). The response body is replaced
+  by the request's collapsed stacks weighted in microseconds of self time;
+  the handler's own status is in ``X-Profiled-Status``.
+
+Nothing is installed until a profile is requested: no sampler thread, no
+profile hook, and the middleware only looks for the header.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials
+
+from .auth import get_current_user, require_admin
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_HZ = float(os.getenv("PROFILE_SAMPLE_HZ", "100"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_HEADER = b"x-profile"
+
+_busy = threading.Lock()
+
+
+def _label(frame: Any) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse(stacks: Counter) -> str:
+    """Collapsed-stack text, heaviest first."""
+    return "".join(f"{stack} {weight}\n" for stack, weight in stacks.most_common() if weight)
+
+
+# ------------------------------------------------------------------ sampling
+
+def sample(seconds: float, hz: float = PROFILE_SAMPLE_HZ) -> Counter:
+    """
+    Sample all threads' stacks for ``seconds`` (blocking).
+
+    Returns:
+        ``Counter`` of collapsed stack -> samples, rooted at the thread name
+
+    Raises:
+        RuntimeError: If a profile is already running in this process
+    """
+    if not _busy.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        stacks: Counter = Counter()
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _busy.release()
+
+
+router = APIRouter()
+
+
+@router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile_endpoint(
+    seconds: float = Query(10.0, gt=0, le=PROFILE_MAX_SECONDS),
+    hz: float = Query(PROFILE_SAMPLE_HZ, gt=0, le=1000),
+    user: Dict[str, Any] = Depends(require_admin),
+) -> str:
+    """Sample this process for ``seconds`` and return collapsed stacks (admin only)."""
+    logger.info("CPU profile of %.1fs requested by %s", seconds, user.get("username") or user.get("client_id"))
+    try:
+        stacks = await asyncio.to_thread(sample, seconds, hz)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return collapse(stacks)
+
+
+# ------------------------------------------------------- per-request tracing
+
+_traced: contextvars.ContextVar[Optional["_Tracer"]] = contextvars.ContextVar("profiled_request", default=None)
+
+
+class _Tracer:
+    """Deterministic call timing for one request's context, on whichever thread it runs."""
+
+    def __init__(self) -> None:
+        self.stacks: Counter = Counter()
+        self._frames: Dict[int, List[list]] = {}  # thread -> [label path, start, child time]
+
+    def __call__(self, frame: Any, event: str, arg: Any) -> None:
+        if _traced.get() is not self:
+            return
+        now = time.perf_counter()
+        stack = self._frames.setdefault(threading.get_ident(), [])
+        if event == "call" or event == "c_call":
+            label = _label(frame) if event == "call" else f"builtins:{getattr(arg, '__qualname__', arg)}"
+            path = f"{stack[-1][0]};{label}" if stack else label
+            stack.append([path, now, 0.0])
+        elif stack:  # return / c_return / c_exception of a frame seen entering
+            path, started, children = stack.pop()
+            elapsed = now - started
+            self.stacks[path] += int((elapsed - children) * 1_000_000)
+            if stack:
+                stack[-1][2] += elapsed
+
+    def install(self) -> None:
+        if hasattr(threading, "setprofile_all_threads"):  # Python 3.12+
+            threading.setprofile_all_threads(self)
+        else:  # this thread and threads started from now on
+            sys.setprofile(self)
+            threading.setprofile(self)
+
+    def remove(self) -> None:
+        if hasattr(threading, "setprofile_all_threads"):
+            threading.setprofile_all_threads(None)
+        else:
+            sys.setprofile(None)
+            threading.setprofile(None)
+
+
+class RequestProfilerMiddleware:
+    """ASGI middleware answering admin requests with ``X-Profile: 1`` with their call profile."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not any(name == PROFILE_HEADER for name, _ in scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+        if not await self._is_admin(scope) or not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        status: Dict[str, int] = {}
+
+        async def discard(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        tracer = _Tracer()
+        token = _traced.set(tracer)
+        tracer.install()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            tracer.remove()
+            _traced.reset(token)
+            _busy.release()
+        body = collapse(tracer.stacks).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profiled-status", str(status.get("code", 500)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _is_admin(scope: Dict[str, Any]) -> bool:
+        auth = next((value for name, value in scope["headers"] if name == b"authorization"), b"").decode()
+        scheme, _, token = auth.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        try:
+            user = await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+        except HTTPException:
+            return False
+        return "admin" in user.get("realm_roles", [])
+
+
+def install(app: Any) -> None:
+    """Add ``GET /debug/profile`` and ``X-Profile`` handling to a FastAPI app."""
+    app.include_router(router)
+    app.add_middleware(RequestProfilerMiddleware)
+
+
+# ------------------------------------------------------------ celery workers
+
+_REQUEST_DIR = tempfile.gettempdir()
+
+
+def _request_path(pid: int) -> str:
+    return os.path.join(_REQUEST_DIR, f"celery-profile-{pid}.json")
+
+
+def _profile_self(signum: int, _frame: Any) -> None:
+    """SIGUSR2 in a pool process: sample it in the background, write the stacks next to the request."""
+    path = _request_path(os.getpid())
+    try:
+        with open(path) as request:
+            seconds, hz = json.load(request)
+    except (OSError, ValueError):
+        return
+
+    def run() -> None:
+        try:
+            stacks = collapse(sample(seconds, hz))
+        except RuntimeError:
+            stacks = ""
+        tmp = f"{path}.out.tmp"
+        with open(tmp, "w") as out:
+            out.write(stacks)
+        os.replace(tmp, f"{path}.out")
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+
+
+def profile_worker(pool_pids: List[int], seconds: float, hz: float = PROFILE_SAMPLE_HZ) -> Counter:
+    """Sample ``pool_pids`` (or this process if there are none) and merge their stacks."""
+    if not pool_pids:
+        return sample(seconds, hz)
+    pending = []
+    for pid in pool_pids:
+        with open(_request_path(pid), "w") as request:
+            json.dump([seconds, hz], request)
+        try:
+            os.kill(pid, signal.SIGUSR2)
+            pending.append(pid)
+        except ProcessLookupError:
+            os.unlink(_request_path(pid))
+
+    merged: Counter = Counter()
+    deadline = time.monotonic() + seconds + 5
+    while pending and time.monotonic() < deadline:
+        time.sleep(0.2)
+        for pid in list(pending):
+            out = f"{_request_path(pid)}.out"
+            if not os.path.exists(out):
+                continue
+            with open(out) as result:
+                for line in result:
+                    stack, _, weight = line.rstrip("\n").rpartition(" ")
+                    merged[f"pid-{pid};{stack}"] += int(weight)
+            os.unlink(out)
+            os.unlink(_request_path(pid))
+            pending.remove(pid)
+    for pid in pending:
+        logger.warning("Pool process %d did not return a profile", pid)
+    return merged
+
+
+def install_celery() -> None:
+    """Register the ``profile`` control command and the pool-process signal handler."""
+    from celery.signals import worker_process_init
+    from celery.worker.control import control_command
+
+    @control_command(
+        args=[("seconds", float), ("hz", float)],
+        signature="[seconds=10] [hz=100]",
+    )
+    def profile(state: Any, seconds: float = 10.0, hz: float = PROFILE_SAMPLE_HZ) -> Dict[str, Any]:
+        """Sample the worker's pool processes and return collapsed stacks."""
+        seconds = min(float(seconds), PROFILE_MAX_SECONDS)
+        pool_pids = list(state.consumer.pool.info.get("processes", []) or [])
+        return {"ok": collapse(profile_worker(pool_pids, seconds, float(hz)))}
+
+    @worker_process_init.connect(weak=False)
+    def _install_handler(**_kwargs: Any) -> None:
+        signal.signal(signal.SIGUSR2, _profile_self)
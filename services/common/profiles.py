@@ -0,0 +1,105 @@
+"""
+Batched profile lookups for other services.
+
+``ProfileLoader`` works like a DataLoader: coroutines call ``load(id)`` as if
+fetching one profile, and every lookup issued within the same event-loop tick
+is sent to the profile service as one ``POST /profiles/batch`` request. Each
+caller then gets back its own profile (or ``None`` if it does not exist).
+Repeated ids within a tick are fetched once.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SERVICE_URL = os.getenv("PROFILE_SERVICE_URL", "http://profile:8000")
+PROFILE_BATCH_MAX = int(os.getenv("PROFILE_BATCH_MAX", "1000"))
+PROFILE_CLIENT_TIMEOUT = float(os.getenv("PROFILE_CLIENT_TIMEOUT", "5"))
+
+
+class ProfileLoader:
+    """
+    Coalesces concurrent single-profile lookups into bulk requests.
+
+    Args:
+        token_provider: Coroutine returning the bearer token to send
+            (e.g. a client-credentials token for workers)
+        base_url: Profile service base URL
+        max_batch: Largest number of ids per bulk request
+        client: Shared ``httpx.AsyncClient``; one is created if omitted
+    """
+
+    def __init__(
+        self,
+        token_provider: Optional[Callable[[], Awaitable[str]]] = None,
+        base_url: str = PROFILE_SERVICE_URL,
+        max_batch: int = PROFILE_BATCH_MAX,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self._token_provider = token_provider
+        self._base_url = base_url.rstrip("/")
+        self._max_batch = max_batch
+        self._client = client
+        self._owns_client = client is None
+        self._pending: Dict[str, List["asyncio.Future[Optional[Dict[str, Any]]]"]] = {}
+        self._scheduled = False
+        self.requests_sent = 0
+
+    async def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """One profile, fetched together with every other lookup in this tick."""
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Optional[Dict[str, Any]]]" = loop.create_future()
+        self._pending.setdefault(profile_id, []).append(future)
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._dispatch)
+        return await future
+
+    async def load_many(self, profile_ids: Iterable[str]) -> List[Optional[Dict[str, Any]]]:
+        """Profiles in the order of ``profile_ids``; ``None`` where unknown."""
+        return list(await asyncio.gather(*(self.load(pid) for pid in profile_ids)))
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._scheduled = False
+        ids = list(pending)
+        for start in range(0, len(ids), self._max_batch):
+            chunk = {pid: pending[pid] for pid in ids[start:start + self._max_batch]}
+            asyncio.ensure_future(self._fetch(chunk))
+
+    async def _fetch(self, waiters: Dict[str, List["asyncio.Future[Optional[Dict[str, Any]]]"]]) -> None:
+        try:
+            found = await self._request(list(waiters))
+        except Exception as exc:
+            logger.warning("Bulk profile lookup of %d ids failed: %s", len(waiters), exc)
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        for profile_id, futures in waiters.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(profile_id))
+
+    async def _request(self, profile_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=PROFILE_CLIENT_TIMEOUT)
+        headers = {}
+        if self._token_provider is not None:
+            headers["Authorization"] = f"Bearer {await self._token_provider()}"
+        self.requests_sent += 1
+        response = await self._client.post(
+            f"{self._base_url}/profiles/batch", json={"ids": profile_ids}, headers=headers
+        )
+        response.raise_for_status()
+        return response.json().get("profiles", {})
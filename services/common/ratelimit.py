@@ -0,0 +1,266 @@
+"""
+Per-client token-bucket rate limiting, shared across instances through Redis.
+
+Every instance decides locally: a request takes a token from an in-process
+bucket, with no network hop. Every ``RATE_LIMIT_SYNC_SECONDS`` a background
+task adds each bucket's local consumption to a Redis counter (one pipelined
+round-trip for all buckets) and debits the consumption the *other* instances
+reported since the previous sync from the local bucket. Together the
+instances therefore approximate one bucket per client; the overshoot is at
+most what the other instances admit within one sync interval. Without Redis
+(or while it is down) each instance enforces its bucket alone.
+
+Buckets are keyed per caller - ``client_id`` and ``sub`` for user tokens, so
+one heavy user does not exhaust the budget of everyone on the same app, the
+``client_id`` alone for client-credentials tokens - and by service, so
+exhausting payment does not affect forex. Limits per role come
+from ``RATE_LIMITS`` (``role=rate:burst`` pairs, rate per second; ``*`` is
+the default for roles without an entry); a client holding several roles gets
+the most generous one. ``require_roles`` / ``require_*`` enforce them.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
+REDIS_URL = os.getenv("REDIS_URL", "")
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMITS = os.getenv("RATE_LIMITS", "*=50:100,user=20:40,admin=200:400,ops_user=200:400,grpc=500:1000")
+RATE_LIMIT_SYNC_SECONDS = float(os.getenv("RATE_LIMIT_SYNC_SECONDS", "1.0"))
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+RATE_LIMIT_IDLE_SECONDS = float(os.getenv("RATE_LIMIT_IDLE_SECONDS", "600"))
+# Our own services' client ids (service-to-service calls are sized by their callers)
+RATE_LIMIT_EXEMPT_CLIENTS = frozenset(filter(None, os.getenv("RATE_LIMIT_EXEMPT_CLIENTS", "").split(",")))
+
+
+class RateLimit(NamedTuple):
+    """``rate`` tokens per second, up to ``burst`` banked."""
+
+    rate: float
+    burst: int
+    name: str = "*"
+
+
+def parse_limits(spec: str) -> Dict[str, RateLimit]:
+    """``"*=50:100,user=20:40"`` -> ``{"*": RateLimit(50, 100, "*"), "user": ...}``."""
+    limits: Dict[str, RateLimit] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        role, _, value = item.partition("=")
+        rate, _, burst = value.partition(":")
+        rate_f = float(rate)
+        limits[role.strip()] = RateLimit(rate_f, int(burst) if burst else max(1, math.ceil(rate_f)), role.strip())
+    return limits
+
+
+ROLE_LIMITS = parse_limits(RATE_LIMITS)
+
+
+def limit_for(roles: Iterable[str], limits: Dict[str, RateLimit] = ROLE_LIMITS) -> Optional[RateLimit]:
+    """Most generous limit among ``roles``, else the ``*`` default (``None`` if unset)."""
+    matched = [limits[role] for role in roles if role in limits]
+    if not matched:
+        return limits.get("*")
+    return max(matched, key=lambda limit: (limit.rate, limit.burst))
+
+
+class _Bucket:
+    __slots__ = ("limit", "tokens", "updated", "unsynced", "seen_total", "synced_at")
+
+    def __init__(self, limit: RateLimit, now: float) -> None:
+        self.limit = limit
+        self.tokens = float(limit.burst)
+        self.updated = now
+        self.unsynced = 0
+        self.seen_total: Optional[int] = None
+        self.synced_at = 0.0
+
+
+class RateLimiter:
+    """Local token buckets, reconciled with Redis in the background."""
+
+    def __init__(
+        self,
+        redis_url: str = REDIS_URL,
+        sync_seconds: float = RATE_LIMIT_SYNC_SECONDS,
+        max_buckets: int = RATE_LIMIT_MAX_BUCKETS,
+        namespace: str = SERVICE_NAME,
+    ) -> None:
+        self.redis_url = redis_url
+        self.sync_seconds = sync_seconds
+        self.max_buckets = max_buckets
+        self.namespace = namespace
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis: Any = None
+        self._syncer: Optional[asyncio.Task] = None
+        self._sync_failing = False
+        self.allowed = 0
+        self.throttled = 0
+
+    def acquire(self, client: str, limit: RateLimit, cost: int = 1) -> float:
+        """
+        Take ``cost`` tokens for ``client`` under ``limit``.
+
+        Returns:
+            0.0 if admitted, otherwise the seconds until enough tokens refill
+        """
+        key = f"{self.namespace}:{limit.name}:{client}"
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(limit, now)
+                if len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            bucket.tokens = min(limit.burst, bucket.tokens + (now - bucket.updated) * limit.rate)
+            bucket.updated = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                bucket.unsynced += cost
+                self.allowed += 1
+                retry_after = 0.0
+            else:
+                self.throttled += 1
+                retry_after = (cost - bucket.tokens) / limit.rate if limit.rate > 0 else 60.0
+        self._ensure_syncer()
+        return retry_after
+
+    # ------------------------------------------------------------ Redis sync
+
+    def _ensure_syncer(self) -> None:
+        if self._syncer is not None or not self.redis_url:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # called from a worker thread; the next async caller starts it
+            return
+        self._syncer = loop.create_task(self._sync_loop())
+
+    async def _sync_loop(self) -> None:
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.redis_url)
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            try:
+                await self.sync_once()
+                if self._sync_failing:
+                    logger.info("Rate limiter Redis sync recovered")
+                self._sync_failing = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                if not self._sync_failing:
+                    logger.warning("Rate limiter Redis sync failed, enforcing locally: %s", exc)
+                self._sync_failing = True
+
+    async def sync_once(self) -> None:
+        """Publish local consumption and debit what other instances consumed."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, bucket in self._buckets.items()
+                    if now - bucket.updated >= RATE_LIMIT_IDLE_SECONDS and not bucket.unsynced]
+            for key in idle:
+                del self._buckets[key]
+            # Only buckets in recent use; the rest refill to full before others' use could matter
+            active = now - 10 * self.sync_seconds
+            snapshot = [(key, bucket, bucket.unsynced) for key, bucket in self._buckets.items()
+                        if bucket.unsynced or bucket.updated >= active]
+        if not snapshot:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        for key, _bucket, delta in snapshot:
+            pipe.incrby(f"ratelimit:{key}", delta)
+            # Keep the counter while any instance may still hold a bucket for it
+            pipe.expire(f"ratelimit:{key}", int(RATE_LIMIT_IDLE_SECONDS * 2))
+        results = await pipe.execute()
+        with self._lock:
+            for (_key, bucket, delta), total in zip(snapshot, results[::2]):
+                total = int(total)
+                bucket.unsynced -= delta
+                # A counter seen long ago (or reset by expiry) says nothing about recent use
+                recent = now - bucket.synced_at <= 2 * self.sync_seconds + 1
+                if recent and bucket.seen_total is not None and total >= bucket.seen_total + delta:
+                    others = total - bucket.seen_total - delta
+                    # Debt is capped at one burst so a client is never locked out for long
+                    bucket.tokens = max(-float(bucket.limit.burst), bucket.tokens - others)
+                bucket.seen_total = total
+                bucket.synced_at = now
+
+    async def aclose(self) -> None:
+        if self._syncer is not None:
+            self._syncer.cancel()
+            await asyncio.gather(self._syncer, return_exceptions=True)
+            self._syncer = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "redis_sync": bool(self.redis_url) and not self._sync_failing,
+        }
+
+
+limiter = RateLimiter()
+
+
+def is_client_token(user: Dict[str, Any]) -> bool:
+    """
+    Whether ``user`` is a client-credentials token: no user, so ``sub`` is the
+    client itself (or absent), or WSO2's ``aut`` claim is ``APPLICATION``.
+    """
+    client_id, sub = user.get("client_id"), user.get("sub")
+    if not client_id:
+        return False
+    return not sub or sub == client_id or (user.get("raw_payload") or {}).get("aut") == "APPLICATION"
+
+
+def client_key(user: Dict[str, Any]) -> str:
+    """
+    Bucket of the caller: ``<client_id>:<sub>`` for a user token, the client id
+    for a client-credentials token (see ``is_client_token``).
+    """
+    client_id, sub = user.get("client_id"), user.get("sub")
+    if not client_id:
+        return str(sub or "anonymous")
+    if is_client_token(user):
+        return str(client_id)
+    return f"{client_id}:{sub}"
+
+
+def enforce(user: Dict[str, Any], roles: Iterable[str], limit: Optional[RateLimit] = None) -> None:
+    """
+    Charge one request of ``user`` against its bucket.
+
+    Raises:
+        HTTPException: 429 with ``Retry-After`` when the bucket is empty
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    client = client_key(user)
+    limit = limit or limit_for(roles)
+    if limit is None or client in RATE_LIMIT_EXEMPT_CLIENTS:
+        return
+    retry_after = limiter.acquire(client, limit)
+    if retry_after:
+        logger.info("Rate limited %s on %s (limit %s)", client, limiter.namespace, limit.name)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
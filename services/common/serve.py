@@ -0,0 +1,167 @@
+"""
+Preforking launcher for the FastAPI services.
+
+    python -m services.common.serve main:app
+
+The master process imports the application once, does the first request's
+auth work (``auth.prewarm``: jose import, JWKS fetch), freezes the heap and
+binds the listening socket, then forks ``WEB_WORKERS`` uvicorn workers that
+accept on the shared socket. Workers start serving without importing
+anything, and the module pages stay shared copy-on-write between them
+(``gc.freeze`` keeps the collector from touching - and so copying - the
+imported objects). Each worker runs the app's lifespan itself, so database,
+Redis and Kafka connections are per worker; application modules must not
+open connections at import time.
+
+Workers share nothing but the socket. An app whose requests change state
+kept only in process memory (a write would reach one worker and the others
+would keep serving the old state) sets ``app.state.single_process`` to the
+reason, and is then always served by one process whatever ``WEB_WORKERS``
+says; scale it with more instances behind shared storage instead.
+
+The master restarts workers that exit unexpectedly and forwards ``SIGTERM``
+to them for a graceful shutdown (a terminal's Ctrl-C reaches them directly).
+
+Environment:
+    WEB_HOST, WEB_PORT        listen address (``0.0.0.0:8000``)
+    WEB_WORKERS               worker processes (1 runs in-process, no fork)
+    WEB_PREWARM               prefetch auth state before forking (true)
+    WEB_IMPORT_PROFILE        log the slowest imports of the app at startup (false)
+"""
+import gc
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Any, Dict
+
+from . import coldstart
+from .logs import configure_logging, shutdown_logging
+
+logger = logging.getLogger(__name__)
+
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8000"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+WEB_PREWARM = os.getenv("WEB_PREWARM", "true").lower() in ("1", "true", "yes")
+WEB_IMPORT_PROFILE = os.getenv("WEB_IMPORT_PROFILE", "false").lower() in ("1", "true", "yes")
+
+# A worker that dies sooner than this after starting is restarted with a delay
+_MIN_WORKER_LIFETIME = 1.0
+
+
+def load_app(target: str) -> Any:
+    """Import ``module:attribute`` (from the current directory), recording when it was loaded."""
+    sys.path.insert(0, os.getcwd())
+    module_name, _, attribute = target.partition(":")
+    if WEB_IMPORT_PROFILE:
+        coldstart.log_import_profile(module_name)
+    module = __import__(module_name, fromlist=["_"])
+    app = getattr(module, attribute or "app")
+    coldstart.record_loaded()
+    logger.info("Loaded %s %.3fs after process start", target, coldstart.startup_stats()["loaded_seconds"])
+    return app
+
+
+def prewarm() -> None:
+    from .auth import prewarm as prewarm_auth
+
+    started = time.perf_counter()
+    cached = prewarm_auth()
+    logger.info("Prewarmed auth in %.3fs (signing key %s)", time.perf_counter() - started,
+                "cached" if cached else "not available yet")
+
+
+class Master:
+    """Forks and supervises uvicorn workers sharing one listening socket."""
+
+    def __init__(self, config: Any, workers: int) -> None:
+        self.config = config
+        self.workers = workers
+        self.socket = config.bind_socket()
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self.children[pid] = time.monotonic()
+
+    def _run_worker(self) -> None:
+        import uvicorn
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            uvicorn.Server(self.config).run(sockets=[self.socket])
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            code = 1
+        finally:
+            shutdown_logging()
+            os._exit(code)
+
+    def _stop(self, signum: int, _frame: Any) -> None:
+        self.stopping = True
+        if signum == signal.SIGINT:
+            return
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info("Master %d serving on %s:%d with %d workers",
+                    os.getpid(), self.config.host, self.config.port, self.workers)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning("Worker %d exited (status %d), restarting", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < _MIN_WORKER_LIFETIME:
+                time.sleep(_MIN_WORKER_LIFETIME)
+            self.spawn()
+        self.socket.close()
+
+
+def main(target: str) -> None:
+    import uvicorn
+
+    configure_logging()
+    app = load_app(target)
+    workers = WEB_WORKERS
+    reason = getattr(getattr(app, "state", None), "single_process", None)
+    if reason and workers > 1:
+        logger.warning("Ignoring WEB_WORKERS=%d: %s must run in one process (%s)", workers, target, reason)
+        workers = 1
+    if WEB_PREWARM:
+        prewarm()
+    # No log_config: uvicorn's error and access logs go through the shared queue handler
+    config = uvicorn.Config(app, host=WEB_HOST, port=WEB_PORT, log_config=None)
+    if workers <= 1:
+        uvicorn.Server(config).run()
+        return
+
+    # Objects that exist now are never collected in the workers, so their pages stay shared
+    gc.collect()
+    gc.freeze()
+    Master(config, workers).run()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else "main:app")
@@ -0,0 +1,273 @@
+"""
+Per-task resource accounting for Celery workers.
+
+``install(celery_app)`` hooks Celery signals so that every task execution
+records:
+
+* ``wall`` - seconds from ``task_prerun`` to ``task_postrun``;
+* ``cpu`` - CPU seconds of the executing thread over the same span;
+* ``rss_kb`` - how far the task raised the process's peak RSS;
+* ``wait`` - seconds between publishing (or the ETA) and the task starting,
+  from a ``sent_at`` header stamped by ``before_task_publish``.
+
+A task whose wall time exceeds its budget - the task's ``budget=`` option,
+else ``TASK_BUDGETS`` (``name=seconds`` pairs, ``*`` default) - is logged as
+a warning with the measurements attached.
+
+Measurements are aggregated per task name in the pool process and flushed to
+Redis every ``TASK_STATS_FLUSH_SECONDS`` (one pipeline, hourly buckets kept
+``TASK_STATS_RETENTION_HOURS``), so every worker of every service adds to one
+view. ``report(hours)`` ranks task types by the worker time they consumed:
+
+    python -m services.common.taskstats [hours]
+    celery -A celery_app.celery_app inspect task_stats 6
+
+If OpenTelemetry is installed and a span is active (instrumented workers),
+the measurements are also set on it as ``celery.task.*`` attributes.
+"""
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TASK_BUDGETS = os.getenv("TASK_BUDGETS", "*=30")
+TASK_STATS_REDIS_URL = os.getenv("TASK_STATS_REDIS_URL", "")
+TASK_STATS_FLUSH_SECONDS = float(os.getenv("TASK_STATS_FLUSH_SECONDS", "10"))
+TASK_STATS_RETENTION_HOURS = int(os.getenv("TASK_STATS_RETENTION_HOURS", "168"))
+
+_SUMS = ("count", "failures", "over_budget", "wall", "cpu", "wait", "rss_kb")
+_MAXES = ("max_wall", "max_rss_kb")
+_KEY_PREFIX = "taskstats"
+
+
+def parse_budgets(spec: str) -> Dict[str, float]:
+    """``"*=30,payment.ingest_payout_file=600"`` -> ``{"*": 30.0, ...}``."""
+    budgets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, seconds = item.partition("=")
+        budgets[name.strip()] = float(seconds)
+    return budgets
+
+
+BUDGETS = parse_budgets(TASK_BUDGETS)
+
+try:
+    from opentelemetry import trace as _otel_trace
+except ImportError:  # tracing is optional
+    _otel_trace = None
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _hour(ts: float) -> str:
+    return time.strftime("%Y%m%d%H", time.gmtime(ts))
+
+
+class TaskAccounting:
+    """Signal handlers plus the per-process aggregate they feed."""
+
+    def __init__(self, redis_url: str = "", flush_seconds: float = TASK_STATS_FLUSH_SECONDS,
+                 budgets: Optional[Dict[str, float]] = None) -> None:
+        self.redis_url = redis_url
+        self.flush_seconds = flush_seconds
+        self.budgets = BUDGETS if budgets is None else budgets
+        self._running: Dict[str, Tuple[float, float, int, Optional[float]]] = {}
+        self._pending: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._redis: Any = None
+
+    # ------------------------------------------------------------- signals
+
+    @staticmethod
+    def stamp(headers: Optional[Dict[str, Any]] = None, **_kwargs: Any) -> None:
+        """``before_task_publish``: record when the message left the producer."""
+        if headers is not None:
+            headers.setdefault("sent_at", time.time())
+
+    def started(self, task_id: str, task: Any, **_kwargs: Any) -> None:
+        """``task_prerun``."""
+        request = task.request
+        sent_at = getattr(request, "sent_at", None)
+        eta = getattr(request, "eta", None)
+        if eta:
+            from datetime import datetime
+
+            eta_ts = eta.timestamp() if isinstance(eta, datetime) else datetime.fromisoformat(eta).timestamp()
+            sent_at = max(sent_at or 0.0, eta_ts)
+        wait = max(0.0, time.time() - float(sent_at)) if sent_at else None
+        self._running[task_id] = (time.perf_counter(), time.thread_time(), _peak_rss_kb(), wait)
+
+    def finished(self, task_id: str, task: Any, state: Optional[str] = None, **_kwargs: Any) -> None:
+        """``task_postrun`` (runs for failures too)."""
+        started = self._running.pop(task_id, None)
+        if started is None:
+            return
+        wall_start, cpu_start, rss_start, wait = started
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        rss_kb = max(0, _peak_rss_kb() - rss_start)
+        name = task.name
+        budget = getattr(task, "budget", None) or self.budgets.get(name, self.budgets.get("*"))
+        over = budget is not None and wall > budget
+        failed = state not in (None, "SUCCESS")
+        measured = {"wall": wall, "cpu": cpu, "rss_kb": rss_kb, "wait": wait}
+
+        if over:
+            logger.warning(
+                "Task %s[%s] over budget: %.2fs wall (budget %gs), %.2fs cpu, +%d KiB peak rss",
+                name, task_id, wall, budget, cpu, rss_kb,
+                extra={"task": name, "task_id": task_id, **measured, "budget": budget},
+            )
+        else:
+            logger.debug("Task %s[%s] took %.3fs wall, %.3fs cpu", name, task_id, wall, cpu,
+                         extra={"task": name, "task_id": task_id, **measured})
+        if _otel_trace is not None:
+            span = _otel_trace.get_current_span()
+            if span.is_recording():
+                span.set_attributes({
+                    f"celery.task.{key}": value for key, value in {**measured, "over_budget": over}.items()
+                    if value is not None
+                })
+
+        with self._lock:
+            agg = self._pending.setdefault(name, dict.fromkeys(_SUMS + _MAXES, 0.0))
+            agg["count"] += 1
+            agg["failures"] += failed
+            agg["over_budget"] += over
+            agg["wall"] += wall
+            agg["cpu"] += cpu
+            agg["wait"] += wait or 0.0
+            agg["rss_kb"] += rss_kb
+            agg["max_wall"] = max(agg["max_wall"], wall)
+            agg["max_rss_kb"] = max(agg["max_rss_kb"], rss_kb)
+        if time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+
+    # --------------------------------------------------------------- Redis
+
+    def _client(self) -> Any:
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def flush(self) -> None:
+        """Add the aggregate since the last flush to this hour's Redis buckets."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending or not self.redis_url:
+            return
+        hour = _hour(time.time())
+        ttl = TASK_STATS_RETENTION_HOURS * 3600
+        try:
+            client = self._client()
+            pipe = client.pipeline(transaction=False)
+            for name, agg in pending.items():
+                key = f"{_KEY_PREFIX}:{hour}:{name}"
+                for field in _SUMS:
+                    if agg[field]:
+                        pipe.hincrbyfloat(key, field, agg[field])
+                pipe.expire(key, ttl)
+                for field in _MAXES:
+                    # Sorted set per maximum: ZADD GT keeps the larger score atomically
+                    pipe.zadd(f"{_KEY_PREFIX}:{hour}:{field}", {name: agg[field]}, gt=True)
+            pipe.sadd(f"{_KEY_PREFIX}:{hour}", *pending)
+            for key in (f"{_KEY_PREFIX}:{hour}", *(f"{_KEY_PREFIX}:{hour}:{field}" for field in _MAXES)):
+                pipe.expire(key, ttl)
+            pipe.execute()
+        except Exception as exc:
+            logger.warning("Task stats flush failed (%d task types dropped): %s", len(pending), exc)
+
+    def report(self, hours: int = 1) -> List[Dict[str, Any]]:
+        """Per task name over the last ``hours`` buckets, heaviest by worker time first."""
+        client = self._client()
+        now = time.time()
+        buckets = [_hour(now - 3600 * i) for i in range(hours)]
+        totals: Dict[str, Dict[str, float]] = {}
+        for hour in buckets:
+            names = sorted(name.decode() for name in client.smembers(f"{_KEY_PREFIX}:{hour}"))
+            if not names:
+                continue
+            pipe = client.pipeline(transaction=False)
+            for name in names:
+                pipe.hgetall(f"{_KEY_PREFIX}:{hour}:{name}")
+            for field in _MAXES:
+                pipe.zrange(f"{_KEY_PREFIX}:{hour}:{field}", 0, -1, withscores=True)
+            results = pipe.execute()
+            for name, fields in zip(names, results):
+                total = totals.setdefault(name, dict.fromkeys(_SUMS + _MAXES, 0.0))
+                for field, value in fields.items():
+                    if field.decode() in _SUMS:
+                        total[field.decode()] += float(value)
+            for field, maxima in zip(_MAXES, results[len(names):]):
+                for name, value in maxima:
+                    total = totals.get(name.decode())
+                    if total is not None:
+                        total[field] = max(total[field], value)
+
+        busy = sum(total["wall"] for total in totals.values()) or 1.0
+        rows = []
+        for name, total in totals.items():
+            count = total["count"] or 1.0
+            rows.append({
+                "task": name,
+                "count": int(total["count"]),
+                "failures": int(total["failures"]),
+                "over_budget": int(total["over_budget"]),
+                "worker_seconds": round(total["wall"], 3),
+                "share": round(total["wall"] / busy, 4),
+                "avg_wall": round(total["wall"] / count, 4),
+                "max_wall": round(total["max_wall"], 4),
+                "avg_cpu": round(total["cpu"] / count, 4),
+                "avg_wait": round(total["wait"] / count, 4),
+                "avg_rss_kb": round(total["rss_kb"] / count, 1),
+                "max_rss_kb": int(total["max_rss_kb"]),
+            })
+        rows.sort(key=lambda row: row["worker_seconds"], reverse=True)
+        return rows
+
+
+def install(celery_app: Any, redis_url: Optional[str] = None) -> TaskAccounting:
+    """Connect accounting to ``celery_app``'s signals and register the ``task_stats`` command."""
+    from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_shutdown
+    from celery.worker.control import inspect_command
+
+    url = redis_url or TASK_STATS_REDIS_URL or celery_app.conf.broker_url or ""
+    accounting = TaskAccounting(url if url.startswith(("redis://", "rediss://")) else "")
+    before_task_publish.connect(accounting.stamp, weak=False)
+    task_prerun.connect(accounting.started, weak=False)
+    task_postrun.connect(accounting.finished, weak=False)
+    worker_process_shutdown.connect(lambda **_kwargs: accounting.flush(), weak=False)
+
+    @inspect_command(args=[("hours", int)], signature="[hours=1]")
+    def task_stats(state: Any, hours: int = 1) -> Dict[str, Any]:
+        """Worker time per task type over the last ``hours``, from all workers."""
+        return {"ok": accounting.report(int(hours))}
+
+    return accounting
+
+
+def _print_report(rows: List[Dict[str, Any]]) -> None:
+    print(f"{'task':40} {'count':>8} {'share':>6} {'worker s':>10} {'avg s':>8} {'max s':>8} "
+          f"{'cpu s':>7} {'wait s':>7} {'rss KiB':>8} {'over':>5} {'fail':>5}")
+    for row in rows:
+        print(f"{row['task']:40} {row['count']:8d} {row['share']:6.1%} {row['worker_seconds']:10.1f} "
+              f"{row['avg_wall']:8.3f} {row['max_wall']:8.2f} {row['avg_cpu']:7.3f} {row['avg_wait']:7.2f} "
+              f"{row['avg_rss_kb']:8.0f} {row['over_budget']:5d} {row['failures']:5d}")
+
+
+if __name__ == "__main__":
+    url = TASK_STATS_REDIS_URL or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    _print_report(TaskAccounting(url).report(int(sys.argv[1]) if len(sys.argv) > 1 else 1))
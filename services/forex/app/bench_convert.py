@@ -0,0 +1,43 @@
+"""
+Throughput benchmark for batch conversion.
+
+Usage (inside the forex container):
+    python bench_convert.py [rows] [repeats]
+"""
+import sys
+import time
+
+import numpy as np
+
+from conversion import convert_batch
+from rates import RateBook
+
+
+def main(rows: int = 100_000, repeats: int = 5) -> None:
+    book = RateBook()
+    book.load_from_env("EUR/USD=1.08345,USD/JPY=151.234567,GBP/USD=1.27012,USD/KWD=0.30725,EUR/GBP=0.85301")
+    pairs = [("EUR", "USD"), ("USD", "JPY"), ("GBP", "USD"), ("USD", "KWD"), ("EUR", "GBP")]
+
+    rng = np.random.default_rng(42)
+    choice = rng.integers(0, len(pairs), rows)
+    amounts = rng.integers(1, 10 ** 12, rows).tolist()
+    from_ccy = [pairs[i][0] for i in choice]
+    to_ccy = [pairs[i][1] for i in choice]
+
+    convert_batch(book, amounts[:1000], from_ccy[:1000], to_ccy[:1000])  # warm-up
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        convert_batch(book, amounts, from_ccy, to_ccy)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    print(f"rows={rows} repeats={repeats}")
+    print(f"best={best * 1000:.1f}ms median={sorted(timings)[len(timings) // 2] * 1000:.1f}ms")
+    print(f"throughput={rows / best:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
@@ -1,7 +1,13 @@
 import os
 from celery import Celery
+from celery.signals import setup_logging
+from celery.schedules import crontab
 from kombu import Queue
 
+from services.common.logs import configure_logging
+from services.common.profiler import install_celery as install_profiler
+from services.common.taskstats import install as install_task_accounting
+
 redis_password = os.getenv("REDIS_PASSWORD", "")
 default_broker = (
     f"redis://:{redis_password}@redis:6379/0" if redis_password else "redis://redis:6379/0"
@@ -25,4 +31,19 @@ celery_app.conf.update(
     task_default_queue=queue_name,
     task_queues=(Queue(queue_name),),
     broker_connection_retry_on_startup=True,
+    beat_schedule={
+        "compact-forex-ticks": {
+            "task": "forex.compact_ticks",
+            "schedule": crontab(hour=0, minute=15),
+        },
+    },
 )
+
+install_profiler()
+install_task_accounting(celery_app)
+
+
+@setup_logging.connect
+def _setup_logging(**_kwargs):
+    """Log through the shared queue-backed JSON pipeline instead of Celery's handlers."""
+    configure_logging()
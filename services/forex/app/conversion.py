@@ -0,0 +1,156 @@
+"""
+Vectorized, decimal-safe batch conversion.
+
+Amounts travel as integer minor units (cents, yen, fils...) and rates as
+scaled integers, so a conversion is ``amount * rate / scale`` evaluated in
+exact int64 arithmetic with banker's rounding (round-half-even) applied to the
+remainder. Nothing is ever converted to float.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from rates import RATE_SCALE, RateBook, format_rate
+
+# ISO 4217 minor-unit exponents; anything not listed is rejected
+CURRENCY_EXPONENTS: Dict[str, int] = {
+    "AED": 2, "AUD": 2, "BHD": 3, "BRL": 2, "CAD": 2, "CHF": 2, "CLP": 0,
+    "CNY": 2, "CZK": 2, "DKK": 2, "EUR": 2, "GBP": 2, "HKD": 2, "HUF": 2,
+    "IDR": 2, "ILS": 2, "INR": 2, "ISK": 0, "JOD": 3, "JPY": 0, "KRW": 0,
+    "KWD": 3, "MXN": 2, "MYR": 2, "NOK": 2, "NZD": 2, "OMR": 3, "PHP": 2,
+    "PKR": 2, "PLN": 2, "QAR": 2, "RON": 2, "SAR": 2, "SEK": 2, "SGD": 2,
+    "THB": 2, "TND": 3, "TRY": 2, "TWD": 2, "UGX": 0, "USD": 2, "VND": 0,
+    "XAF": 0, "XOF": 0, "ZAR": 2,
+}
+
+# Long multiplication works on 16-bit limbs of |amount|; every intermediate
+# (remainder * LIMB + limb * rate) must stay below 2**63.
+_LIMB_BITS = 16
+_LIMB = 1 << _LIMB_BITS
+_LIMB_MASK = _LIMB - 1
+_LIMB_COUNT = 4
+_MAX_FACTOR = (2 ** 63 - 1) // _LIMB
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+@dataclass
+class BatchConversion:
+    """Columnar result of a batch conversion."""
+
+    amounts: np.ndarray
+    quotes: Dict[Tuple[str, str], int]
+
+    def quotes_as_strings(self) -> Dict[str, str]:
+        return {f"{base}/{quote}": format_rate(rate) for (base, quote), rate in self.quotes.items()}
+
+
+def muldiv_half_even(amounts: np.ndarray, numerators: np.ndarray, denominators: np.ndarray) -> np.ndarray:
+    """
+    Exact ``round_half_even(amounts * numerators / denominators)`` over int64 arrays.
+
+    The product is formed limb by limb (schoolbook long division), so it never
+    overflows even when ``amount * rate`` would not fit in 64 bits.
+
+    Raises:
+        ValueError: If a rate factor is too large for the limb width, or a
+            result does not fit in int64
+    """
+    numerators = np.asarray(numerators, dtype=np.int64)
+    denominators = np.asarray(denominators, dtype=np.int64)
+    if numerators.size and (int(numerators.max()) + int(denominators.max())) > _MAX_FACTOR:
+        raise ValueError("Rate factor exceeds exact conversion range")
+
+    amounts = np.asarray(amounts, dtype=np.int64)
+    if amounts.size and int(amounts.min()) == np.iinfo(np.int64).min:
+        raise ValueError("Amount exceeds exact conversion range")
+    negative = amounts < 0
+    magnitude = np.abs(amounts)
+
+    quotient = np.zeros_like(magnitude)
+    remainder = np.zeros_like(magnitude)
+    for shift in range((_LIMB_COUNT - 1) * _LIMB_BITS, -1, -_LIMB_BITS):
+        limb = (magnitude >> shift) & _LIMB_MASK
+        acc = remainder * _LIMB + limb * numerators
+        digit, remainder = np.divmod(acc, denominators)
+        # quotient * LIMB + digit must not wrap
+        if np.any(quotient > (_INT64_MAX - digit) // _LIMB):
+            raise ValueError("Converted amount exceeds int64 range")
+        quotient = quotient * _LIMB + digit
+
+    twice = remainder * 2
+    round_up = (twice > denominators) | ((twice == denominators) & ((quotient & 1) == 1))
+    if np.any(round_up & (quotient == _INT64_MAX)):
+        raise ValueError("Converted amount exceeds int64 range")
+    quotient += round_up
+    return np.where(negative, -quotient, quotient)
+
+
+def _exponents(codes: np.ndarray) -> np.ndarray:
+    try:
+        return np.array([CURRENCY_EXPONENTS[str(code)] for code in codes], dtype=np.int64)
+    except KeyError as exc:
+        raise ValueError(f"Unsupported currency: {exc.args[0]}") from None
+
+
+def convert_batch(
+    book: RateBook,
+    amounts: Sequence[int],
+    from_currencies: Sequence[str],
+    to_currencies: Sequence[str],
+) -> BatchConversion:
+    """
+    Convert columnar arrays of minor-unit amounts between currency pairs.
+
+    Distinct currencies and pairs are resolved once; the per-row work is pure
+    NumPy gather plus one vectorized mul-div.
+
+    Raises:
+        ValueError: On mismatched columns, amounts outside int64, unknown
+            currencies or missing rates
+    """
+    n = len(amounts)
+    if len(from_currencies) != n or len(to_currencies) != n:
+        raise ValueError("amounts, from_currencies and to_currencies must have the same length")
+
+    try:
+        amount_arr = np.asarray(amounts, dtype=np.int64)
+    except OverflowError:
+        raise ValueError("amounts must fit in a signed 64-bit integer") from None
+    if n == 0:
+        return BatchConversion(amounts=amount_arr, quotes={})
+
+    src_codes, src_idx = np.unique(np.asarray(from_currencies, dtype=str), return_inverse=True)
+    dst_codes, dst_idx = np.unique(np.asarray(to_currencies, dtype=str), return_inverse=True)
+    src_codes, dst_codes = np.char.upper(src_codes), np.char.upper(dst_codes)
+    src_exp = _exponents(src_codes)
+    dst_exp = _exponents(dst_codes)
+
+    pair_keys, pair_idx = np.unique(src_idx * len(dst_codes) + dst_idx, return_inverse=True)
+    pair_src = pair_keys // len(dst_codes)
+    pair_dst = pair_keys % len(dst_codes)
+
+    quotes: Dict[Tuple[str, str], int] = {}
+    missing: List[str] = []
+    pair_num = np.empty(len(pair_keys), dtype=np.int64)
+    pair_den = np.empty(len(pair_keys), dtype=np.int64)
+    for i, (s, d) in enumerate(zip(pair_src, pair_dst)):
+        base, quote = str(src_codes[s]), str(dst_codes[d])
+        try:
+            rate = book.get(base, quote)
+        except KeyError:
+            missing.append(f"{base}/{quote}")
+            continue
+        quotes[(base, quote)] = rate
+        # Fold the minor-unit exponent shift into the rate factor
+        shift = int(dst_exp[d] - src_exp[s])
+        pair_num[i] = rate * 10 ** max(shift, 0)
+        pair_den[i] = RATE_SCALE * 10 ** max(-shift, 0)
+
+    if missing:
+        raise ValueError(f"No rate for pair(s): {', '.join(sorted(missing))}")
+
+    converted = muldiv_half_even(amount_arr, pair_num[pair_idx], pair_den[pair_idx])
+    return BatchConversion(amounts=converted, quotes=quotes)
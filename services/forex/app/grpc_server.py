@@ -0,0 +1,83 @@
+"""
+Internal gRPC front-end for the forex service.
+
+Stubs are compiled into ``app/generated`` by the image build (``make proto``
+locally); when they are missing or were generated for another protobuf
+runtime, the REST API keeps working and the gRPC listener is simply skipped.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+from typing import Optional
+
+from services.common.ratelimit import ROLE_LIMITS, RATE_LIMIT_ENABLED, limit_for, limiter
+
+from conversion import convert_batch
+from rates import format_rate, rate_book
+
+logger = logging.getLogger(__name__)
+
+GRPC_PORT = int(os.getenv("GRPC_PORT", "50056"))
+# gRPC bypasses the gateway and carries no token: callers are limited per peer host
+GRPC_LIMIT = ROLE_LIMITS.get("grpc") or limit_for(())
+
+# protoc emits absolute imports (``from forex.v1 import ...``) rooted at generated/
+_GENERATED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated")
+if _GENERATED_DIR not in sys.path:
+    sys.path.append(_GENERATED_DIR)
+
+_STUBS_ERROR: Optional[str] = None
+try:
+    import grpc
+    from forex.v1 import forex_pb2, forex_pb2_grpc
+except Exception as exc:  # pragma: no cover - depends on generated stubs
+    # ImportError when missing; stubs from another grpcio-tools raise RuntimeError
+    # (grpcio check) or protobuf's VersionError, which is not an ImportError
+    _STUBS_ERROR = repr(exc)
+    grpc = None
+    forex_pb2 = forex_pb2_grpc = None
+
+
+if forex_pb2_grpc is not None:
+
+    class ForexServicer(forex_pb2_grpc.ForexServiceServicer):
+        """gRPC service - called directly by payment and ledger."""
+
+        async def ConvertBatch(self, request, context):
+            if RATE_LIMIT_ENABLED and GRPC_LIMIT is not None:
+                peer = context.peer().rsplit(":", 1)[0]
+                if limiter.acquire(f"grpc:{peer}", GRPC_LIMIT):
+                    await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Rate limit exceeded")
+            try:
+                result = convert_batch(
+                    rate_book,
+                    list(request.amounts),
+                    list(request.from_currencies),
+                    list(request.to_currencies),
+                )
+            except ValueError as exc:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(exc))
+
+            return forex_pb2.ConvertBatchResponse(
+                amounts=result.amounts.tolist(),
+                quotes=[
+                    forex_pb2.Quote(base=base, quote=quote, rate=format_rate(rate))
+                    for (base, quote), rate in result.quotes.items()
+                ],
+            )
+
+
+async def start() -> Optional["grpc.aio.Server"]:
+    """Start the gRPC listener on the running event loop, if stubs are available."""
+    if forex_pb2_grpc is None:
+        logger.warning("gRPC stubs unusable (%s; run `make proto`); gRPC listener disabled", _STUBS_ERROR)
+        return None
+
+    server = grpc.aio.server()
+    forex_pb2_grpc.add_ForexServiceServicer_to_server(ForexServicer(), server)
+    server.add_insecure_port(f"[::]:{GRPC_PORT}")
+    await server.start()
+    logger.info("Forex gRPC listening on :%d", GRPC_PORT)
+    return server
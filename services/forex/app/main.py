@@ -1,14 +1,55 @@
 import os
 import base64
 import json
-from fastapi import FastAPI, HTTPException, Request
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
 
-from services.common.auth import decode_token
+from fastapi import Depends, FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from services.common.auth import decode_token, require_authenticated, require_ops
+from services.common.httpcache import ResponseCacheMiddleware, cacheable
+from services.common.profiler import install as install_profiler
 from services.common.userinfo import extract_user_info
 
+import grpc_server
+from conversion import convert_batch
+from rates import format_rate, rate_book
+from tickstore import tick_store
+
+logger = logging.getLogger(__name__)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
 
-app = FastAPI(title=SERVICE_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rate_book.load_from_env()
+    server = await grpc_server.start()
+    yield
+    if server is not None:
+        await server.stop(grace=5)
+
+
+app = FastAPI(title=SERVICE_NAME, lifespan=lifespan)
+# PUT /rates writes the in-process rate book; other workers would not see it
+app.state.single_process = "rates are published to process memory"
+app.add_middleware(ResponseCacheMiddleware)
+install_profiler(app)
+
+
+class RateUpdate(BaseModel):
+    rate: str
+
+
+class ConvertBatchRequest(BaseModel):
+    """Columnar batch: row ``i`` converts ``amounts[i]`` minor units."""
+
+    amounts: List[int]
+    from_currencies: List[str]
+    to_currencies: List[str]
 
 
 def decode_jwt_header(request: Request) -> dict:
@@ -70,3 +111,61 @@ def health(request: Request) -> dict:
 def readiness() -> dict[str, str]:
     """Readiness probe for upstream load balancers."""
     return {"status": "ready", "service": SERVICE_NAME}
+
+
+@app.get("/rates")
+@cacheable(ttl=1, version=lambda params: (rate_book.epoch, rate_book.version))
+def list_rates(user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """Current mid rates as fixed-point decimal strings."""
+    return {
+        f"{base}/{quote}": {"rate": format_rate(rate), "updated_at": ts}
+        for (base, quote), (rate, ts) in rate_book.snapshot().items()
+    }
+
+
+@app.put("/rates/{base}/{quote}")
+def publish_rate(base: str, quote: str, body: RateUpdate, user: Dict[str, Any] = Depends(require_ops)) -> dict:
+    """Publish a new mid rate for a currency pair (ops only)."""
+    ts = time.time()
+    try:
+        scaled = rate_book.set_rate(base, quote, body.rate, ts=ts)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    try:
+        tick_store.append(base, quote, ts, scaled)
+    except (OSError, ValueError) as exc:
+        # History is best-effort; the live rate is already published
+        logger.warning("Failed to record tick for %s/%s: %s", base, quote, exc)
+
+    return {"pair": f"{base.upper()}/{quote.upper()}", "rate": format_rate(scaled)}
+
+
+@app.get("/rates/{base}/{quote}/at")
+def rate_at(base: str, quote: str, ts: float, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """
+    Historical rate in effect at ``ts`` (epoch seconds).
+
+    Used by reconciliation and refunds; served from the memory-mapped tick
+    store, never from the database.
+    """
+    found = tick_store.rate_at(base, quote, ts)
+    if found is None:
+        raise HTTPException(status_code=404, detail=f"No {base.upper()}/{quote.upper()} rate at or before {ts}")
+    tick_ts, scaled = found
+    return {"pair": f"{base.upper()}/{quote.upper()}", "rate": format_rate(scaled), "effective_at": tick_ts}
+
+
+@app.post("/convert/batch")
+def convert_batch_endpoint(body: ConvertBatchRequest, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """
+    Convert many amounts in one call.
+
+    Amounts are integer minor units; results are rounded half-even and
+    returned in request order, with the rate applied for each distinct pair.
+    """
+    try:
+        result = convert_batch(rate_book, body.amounts, body.from_currencies, body.to_currencies)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {"amounts": result.amounts.tolist(), "quotes": result.quotes_as_strings()}
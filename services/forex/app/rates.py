@@ -0,0 +1,112 @@
+"""
+In-process rate book for the forex service.
+
+Rates are stored as scaled integers (``rate * RATE_SCALE``) so that every
+conversion downstream is exact integer arithmetic - no floats ever touch money.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Optional, Tuple
+
+# Rates carry 8 decimal places (1 EUR = 1.08345000 USD -> 108345000)
+RATE_DECIMALS = 8
+RATE_SCALE = 10 ** RATE_DECIMALS
+
+Pair = Tuple[str, str]
+
+
+def parse_rate(value: "Decimal | str | int") -> int:
+    """Convert a decimal rate into its scaled-integer form, rejecting lossy input."""
+    try:
+        rate = Decimal(str(value))
+    except InvalidOperation as exc:
+        raise ValueError(f"Invalid rate: {value!r}") from exc
+
+    if not rate.is_finite() or rate <= 0:
+        raise ValueError(f"Rate must be a positive number: {value!r}")
+
+    scaled = rate.scaleb(RATE_DECIMALS)
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"Rate {value!r} has more than {RATE_DECIMALS} decimal places")
+    return int(scaled)
+
+
+def format_rate(scaled: int) -> str:
+    """Render a scaled-integer rate as a fixed-point decimal string."""
+    return str(Decimal(scaled).scaleb(-RATE_DECIMALS).quantize(Decimal(1).scaleb(-RATE_DECIMALS)))
+
+
+class RateBook:
+    """
+    Latest mid rate per currency pair.
+
+    Readers never lock: writers build a new mapping and swap the reference, so
+    a batch conversion always sees one consistent snapshot.
+    """
+
+    def __init__(self) -> None:
+        self._rates: Dict[Pair, Tuple[int, float]] = {}
+        self._write_lock = threading.Lock()
+        # Bumped on every publish; lets readers tag and revalidate snapshots cheaply.
+        # Counters are per process, so the epoch keeps two processes' tags apart -
+        # renewed in forked children, which would otherwise inherit the parent's.
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        os.register_at_fork(after_in_child=self._renew_epoch)
+
+    def _renew_epoch(self) -> None:
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def set_rate(self, base: str, quote: str, rate: "Decimal | str | int", ts: Optional[float] = None) -> int:
+        """Publish a new rate for ``base/quote`` and return its scaled value."""
+        scaled = parse_rate(rate)
+        pair = (base.upper(), quote.upper())
+        with self._write_lock:
+            rates = dict(self._rates)
+            rates[pair] = (scaled, ts if ts is not None else time.time())
+            self._rates = rates
+            self.version += 1
+        return scaled
+
+    def snapshot(self) -> Dict[Pair, Tuple[int, float]]:
+        """Return the current immutable view of all rates."""
+        return self._rates
+
+    def get(self, base: str, quote: str) -> int:
+        """
+        Scaled rate for ``base/quote``.
+
+        Raises:
+            KeyError: If no rate has been published for the pair
+        """
+        base, quote = base.upper(), quote.upper()
+        if base == quote:
+            return RATE_SCALE
+        return self._rates[(base, quote)][0]
+
+    def load_from_env(self, spec: Optional[str] = None) -> int:
+        """
+        Seed rates from ``FOREX_SEED_RATES`` (e.g. ``EUR/USD=1.0834,GBP/USD=1.27``).
+
+        Returns:
+            Number of rates loaded
+        """
+        spec = spec if spec is not None else os.getenv("FOREX_SEED_RATES", "")
+        loaded = 0
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            pair, _, rate = item.partition("=")
+            base, _, quote = pair.partition("/")
+            if not (base and quote and rate):
+                raise ValueError(f"Invalid FOREX_SEED_RATES entry: {item!r}")
+            self.set_rate(base, quote, rate)
+            loaded += 1
+        return loaded
+
+
+# Process-wide rate book shared by the REST and gRPC front-ends
+rate_book = RateBook()
@@ -1,12 +1,16 @@
+import logging
 import time
 
 from celery_app import celery_app
+from tickstore import tick_store
+
+logger = logging.getLogger(__name__)
 
 
 @celery_app.task(name="tasks.echo")
 def echo(msg):
     """Echo a message back."""
-    print(f"[FOREX WORKER] Echo: {msg}")
+    logger.info("Echo: %s", msg)
     return msg
 
 
@@ -21,3 +25,12 @@ def slow(seconds):
     """Sleep for the provided duration and return it."""
     time.sleep(seconds)
     return seconds
+
+
+@celery_app.task(name="forex.compact_ticks")
+def compact_ticks():
+    """Merge closed daily tick segments into monthly segments for every pair."""
+    merged = {}
+    for base, quote in tick_store.pairs():
+        merged[f"{base}/{quote}"] = tick_store.compact(base, quote)
+    return merged
@@ -0,0 +1,292 @@
+"""
+Append-only, memory-mapped columnar store for historical forex ticks.
+
+Layout (one directory per pair under ``FOREX_TICK_DIR``)::
+
+    EURUSD/
+        20261019.ts      int64 microseconds since epoch (UTC), append-only
+        20261019.rate    int64 scaled rate (rates.RATE_SCALE), append-only
+        20261001-20261018.seg   compacted, immutable: header + ts[] + rate[]
+
+Readers map the files read-only and binary-search the timestamp column in
+place, so lookups copy nothing and every worker process shares the same
+page-cache pages. Compaction folds closed daily segments into one immutable
+segment per month and swaps it in with an atomic rename.
+"""
+from __future__ import annotations
+
+import bisect
+import fcntl
+import logging
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TICK_DIR = os.getenv("FOREX_TICK_DIR", "/data/forex-ticks")
+
+_MAGIC = b"FXTICK01"
+_HEADER = struct.Struct("<8sq")  # magic, row count
+_ROW = struct.Struct("<q")
+_ITEM = np.dtype("<i8")
+
+
+def to_micros(ts: float) -> int:
+    """Epoch seconds -> integer microseconds."""
+    return int(round(ts * 1_000_000))
+
+
+def _day_of(micros: int) -> str:
+    return datetime.fromtimestamp(micros / 1_000_000, tz=timezone.utc).strftime("%Y%m%d")
+
+
+@dataclass(frozen=True)
+class Segment:
+    """One on-disk segment; ``start`` is the first UTC day it covers."""
+
+    start: str
+    end: str
+    compacted: bool
+    paths: Tuple[str, ...]
+
+
+class _Mapped:
+    """Read-only column views over a segment, valid while the mapping lives."""
+
+    def __init__(self, segment: Segment) -> None:
+        self.segment = segment
+        if segment.compacted:
+            path = segment.paths[0]
+            with open(path, "rb") as fh:
+                magic, count = _HEADER.unpack(fh.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"Corrupt tick segment: {path}")
+            data = np.memmap(path, dtype=_ITEM, mode="r", offset=_HEADER.size, shape=(count * 2,)) if count else np.empty(0, _ITEM)
+            self.ts, self.rate = data[:count], data[count:]
+            self.size = os.path.getsize(path)
+        else:
+            ts_path, rate_path = segment.paths
+            ts_size, rate_size = os.path.getsize(ts_path), os.path.getsize(rate_path)
+            # A concurrent append may have landed in one column only
+            count = min(ts_size, rate_size) // _ITEM.itemsize
+            self.ts = np.memmap(ts_path, dtype=_ITEM, mode="r", shape=(count,)) if count else np.empty(0, _ITEM)
+            self.rate = np.memmap(rate_path, dtype=_ITEM, mode="r", shape=(count,)) if count else np.empty(0, _ITEM)
+            self.size = ts_size + rate_size
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+
+class TickStore:
+    """Historical rate ticks per currency pair with point-in-time lookup."""
+
+    def __init__(self, root: str = TICK_DIR) -> None:
+        self.root = root
+        self._maps: Dict[Tuple[str, str], _Mapped] = {}
+        self._listings: Dict[str, Tuple[int, FrozenSet[str], List[Segment]]] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ paths
+
+    def _pair_dir(self, base: str, quote: str) -> str:
+        return os.path.join(self.root, f"{base.upper()}{quote.upper()}")
+
+    @contextmanager
+    def _pair_lock(self, pair_dir: str) -> Iterator[None]:
+        """Cross-process writer lock; readers never take it."""
+        os.makedirs(pair_dir, exist_ok=True)
+        with open(os.path.join(pair_dir, ".lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def segments(self, base: str, quote: str) -> List[Segment]:
+        """Segments for a pair ordered by start day (compacted wins ties)."""
+        pair_dir = self._pair_dir(base, quote)
+        try:
+            mtime = os.stat(pair_dir).st_mtime_ns
+        except FileNotFoundError:
+            return []
+
+        # Appends never touch the directory entry, so it only changes when a
+        # segment is created or swapped by compaction. The mtime alone can miss
+        # that on filesystems with coarse timestamps; the names cannot
+        names = os.listdir(pair_dir)
+        name_set = frozenset(names)
+        cached = self._listings.get(pair_dir)
+        if cached is not None and cached[0] == mtime and cached[1] == name_set:
+            return cached[2]
+
+        found: List[Segment] = []
+        for name in names:
+            stem, ext = os.path.splitext(name)
+            if ext == ".seg":
+                start, _, end = stem.partition("-")
+                found.append(Segment(start, end, True, (os.path.join(pair_dir, name),)))
+            elif ext == ".ts" and f"{stem}.rate" in names:
+                found.append(Segment(stem, stem, False, (
+                    os.path.join(pair_dir, name),
+                    os.path.join(pair_dir, f"{stem}.rate"),
+                )))
+        found.sort(key=lambda s: s.end, reverse=True)
+        found.sort(key=lambda s: (s.start, not s.compacted))
+
+        # During compaction the inputs linger briefly next to their output
+        result: List[Segment] = []
+        for segment in found:
+            if result and result[-1].compacted and segment.start <= result[-1].end:
+                continue
+            result.append(segment)
+        self._listings[pair_dir] = (mtime, name_set, result)
+        self._unmap_unlisted(pair_dir, result)
+        return result
+
+    def _unmap_unlisted(self, pair_dir: str, listed: List[Segment]) -> None:
+        """Drop mappings of the pair's segments compaction replaced, so their disk space is freed."""
+        live = {segment.paths[0] for segment in listed}
+        with self._lock:
+            for key in [key for key in self._maps if os.path.dirname(key[0]) == pair_dir and key[0] not in live]:
+                del self._maps[key]
+
+    # ----------------------------------------------------------------- writes
+
+    def append(self, base: str, quote: str, ts: float, rate: int) -> None:
+        """
+        Append one tick to the pair's daily segment.
+
+        Raises:
+            ValueError: If ``ts`` is older than the last tick already stored
+        """
+        micros = to_micros(ts)
+        pair_dir = self._pair_dir(base, quote)
+        day = _day_of(micros)
+        ts_path = os.path.join(pair_dir, f"{day}.ts")
+        rate_path = os.path.join(pair_dir, f"{day}.rate")
+
+        with self._pair_lock(pair_dir):
+            if os.path.exists(ts_path) and os.path.getsize(ts_path) >= _ITEM.itemsize:
+                with open(ts_path, "rb") as fh:
+                    fh.seek(-_ITEM.itemsize, os.SEEK_END)
+                    (last,) = _ROW.unpack(fh.read(_ITEM.itemsize))
+                if micros < last:
+                    raise ValueError(f"Out-of-order tick for {base}/{quote}: {micros} < {last}")
+
+            with open(ts_path, "ab") as fh:
+                fh.write(_ROW.pack(micros))
+            with open(rate_path, "ab") as fh:
+                fh.write(_ROW.pack(rate))
+
+    # ------------------------------------------------------------------ reads
+
+    def _mapped(self, segment: Segment) -> _Mapped:
+        key = (segment.paths[0], "seg" if segment.compacted else "day")
+        with self._lock:
+            mapped = self._maps.get(key)
+            # Open daily segments grow; remap only when the file size moved
+            if mapped is None or (not segment.compacted and mapped.size != sum(os.path.getsize(p) for p in segment.paths)):
+                mapped = _Mapped(segment)
+                self._maps[key] = mapped
+            return mapped
+
+    def rate_at(self, base: str, quote: str, ts: float) -> Optional[Tuple[float, int]]:
+        """
+        Latest tick at or before ``ts``.
+
+        Returns:
+            ``(tick_timestamp_seconds, scaled_rate)`` or ``None`` if no earlier tick exists
+        """
+        micros = to_micros(ts)
+        try:
+            return self._search(base, quote, micros)
+        except FileNotFoundError:
+            # A compaction swapped segments between listing and mapping
+            return self._search(base, quote, micros)
+
+    def _search(self, base: str, quote: str, micros: int) -> Optional[Tuple[float, int]]:
+        segments = self.segments(base, quote)
+        starts = [s.start for s in segments]
+        idx = bisect.bisect_right(starts, _day_of(micros)) - 1
+
+        while idx >= 0:
+            mapped = self._mapped(segments[idx])
+            pos = int(np.searchsorted(mapped.ts, micros, side="right")) - 1
+            if pos >= 0:
+                return int(mapped.ts[pos]) / 1_000_000, int(mapped.rate[pos])
+            idx -= 1
+        return None
+
+    # ------------------------------------------------------------- compaction
+
+    def compact(self, base: str, quote: str, before: Optional[datetime] = None) -> int:
+        """
+        Merge closed daily segments (before ``before``, default today UTC)
+        into one immutable segment per calendar month.
+
+        Returns:
+            Number of daily segments folded in
+        """
+        cutoff = (before or datetime.now(timezone.utc)).strftime("%Y%m%d")
+        pair_dir = self._pair_dir(base, quote)
+        merged = 0
+
+        with self._pair_lock(pair_dir):
+            by_month: Dict[str, List[Segment]] = {}
+            for segment in self.segments(base, quote):
+                if segment.end < cutoff:
+                    by_month.setdefault(segment.start[:6], []).append(segment)
+
+            for month, group in sorted(by_month.items()):
+                dailies = [s for s in group if not s.compacted]
+                if not dailies:
+                    continue
+                columns = [_Mapped(s) for s in group]
+                ts = np.concatenate([c.ts for c in columns]) if columns else np.empty(0, _ITEM)
+                rate = np.concatenate([c.rate for c in columns]) if columns else np.empty(0, _ITEM)
+                order = np.argsort(ts, kind="stable")
+                ts, rate = ts[order], rate[order]
+
+                start, end = group[0].start, max(s.end for s in group)
+                target = os.path.join(pair_dir, f"{start}-{end}.seg")
+                tmp = f"{target}.tmp"
+                with open(tmp, "wb") as fh:
+                    fh.write(_HEADER.pack(_MAGIC, len(ts)))
+                    fh.write(ts.astype(_ITEM, copy=False).tobytes())
+                    fh.write(rate.astype(_ITEM, copy=False).tobytes())
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp, target)
+
+                # Readers holding old mappings keep valid pages after unlink
+                for segment in group:
+                    if segment.paths[0] == target:
+                        continue
+                    for path in segment.paths:
+                        os.unlink(path)
+                with self._lock:
+                    for segment in group:
+                        self._maps.pop((segment.paths[0], "seg" if segment.compacted else "day"), None)
+                merged += len(dailies)
+                logger.info("Compacted %d daily segment(s) of %s/%s for %s", len(dailies), base, quote, month)
+
+        return merged
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        """All pairs that have tick data on disk."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return [(name[:3], name[3:]) for name in sorted(names) if len(name) == 6]
+
+
+# Process-wide store; mappings are per process, pages are shared by the kernel
+tick_store = TickStore()
@@ -0,0 +1,67 @@
+"""
+Benchmark for settlement netting on one window.
+
+Usage (inside the ledger container):
+    python bench_netting.py [payments] [counterparties] [repeats]
+
+Rows are generated as the tuples the DB driver returns, so the load stage
+includes the chunked conversion to Arrow columns; posting is not measured.
+"""
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from netting import SETTLEMENT_CHUNK_ROWS, net_positions, settlement_transfers, to_batch
+
+
+def make_rows(payments: int, parties: int, seed: int = 42) -> list:
+    rng = np.random.default_rng(seed)
+    currencies = ["EUR", "USD", "GBP", "JPY"]
+    names = [f"bank-{i:05d}" for i in range(parties)]
+    payers = rng.integers(0, parties, payments)
+    payees = (payers + rng.integers(1, parties, payments)) % parties
+    amounts = rng.integers(100, 10 ** 9, payments)
+    ccy = rng.integers(0, len(currencies), payments)
+    cross = rng.random(payments) < 0.1
+    settle_ccy = np.where(cross, (ccy + 1) % len(currencies), ccy)
+    settle_amounts = np.where(cross, (amounts * 1.08).astype(np.int64), amounts)
+    return [
+        (names[payer], names[payee], amount, currencies[c], settle_amount, currencies[s])
+        for payer, payee, amount, c, settle_amount, s in zip(
+            payers.tolist(), payees.tolist(), amounts.tolist(), ccy.tolist(), settle_amounts.tolist(),
+            settle_ccy.tolist(),
+        )
+    ]
+
+
+def main(payments: int = 1_000_000, parties: int = 1000, repeats: int = 3) -> None:
+    rows = make_rows(payments, parties)
+    timings = {"load": [], "net": [], "transfers": []}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        window = pa.Table.from_batches(
+            [to_batch(rows[i:i + SETTLEMENT_CHUNK_ROWS]) for i in range(0, len(rows), SETTLEMENT_CHUNK_ROWS)]
+        )
+        timings["load"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        positions = net_positions(window)
+        timings["net"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        transfers = settlement_transfers(positions)
+        timings["transfers"].append(time.perf_counter() - start)
+
+    total = sum(min(values) for values in timings.values())
+    print(f"payments={payments} counterparties={parties} repeats={repeats}")
+    for stage, values in timings.items():
+        print(f"{stage:10} best={min(values) * 1000:8.1f}ms")
+    print(f"positions={positions.num_rows} transfers={len(transfers)} (gross {payments} payments)")
+    print(f"throughput={payments / total:,.0f} payments/s")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    main(*args)
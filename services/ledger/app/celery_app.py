@@ -1,7 +1,13 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import setup_logging
 from kombu import Queue
 
+from services.common.logs import configure_logging
+from services.common.profiler import install_celery as install_profiler
+from services.common.taskstats import install as install_task_accounting
+
 redis_password = os.getenv("REDIS_PASSWORD", "")
 default_broker = (
     f"redis://:{redis_password}@redis:6379/0" if redis_password else "redis://redis:6379/0"
@@ -16,6 +22,9 @@ celery_app = Celery(
 )
 
 queue_name = os.getenv("CELERY_DEFAULT_QUEUE", "ledger-tasks")
+# Reconciliation starts its own process pool, which a prefork child may not do;
+# this queue is consumed by a ``-P solo`` worker (ledger-reconciler)
+reconcile_queue = os.getenv("LEDGER_RECONCILE_QUEUE", "ledger-reconcile")
 
 celery_app.conf.update(
     task_acks_late=True,
@@ -23,6 +32,26 @@ celery_app.conf.update(
     enable_utc=True,
     timezone="UTC",
     task_default_queue=queue_name,
-    task_queues=(Queue(queue_name),),
+    task_queues=(Queue(queue_name), Queue(reconcile_queue)),
+    task_routes={"ledger.reconcile": {"queue": reconcile_queue}},
     broker_connection_retry_on_startup=True,
+    beat_schedule={
+        "settle-windows": {
+            "task": "ledger.settle",
+            "schedule": crontab(minute=10),
+        },
+        "reconcile-payments": {
+            "task": "ledger.reconcile",
+            "schedule": crontab(hour=0, minute=30),
+        },
+    },
 )
+
+install_profiler()
+install_task_accounting(celery_app)
+
+
+@setup_logging.connect
+def _setup_logging(**_kwargs):
+    """Log through the shared queue-backed JSON pipeline instead of Celery's handlers."""
+    configure_logging()
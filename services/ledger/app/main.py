@@ -1,14 +1,37 @@
 import os
+import asyncio
 import base64
 import json
-from fastapi import FastAPI, HTTPException, Request
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
 
-from services.common.auth import decode_token
+from fastapi import Depends, FastAPI, HTTPException, Request
+
+from services.common.auth import decode_token, require_auditor
+from services.common.export import export_response
+from services.common.profiler import install as install_profiler
 from services.common.userinfo import extract_user_info
 
+import store
+
+logger = logging.getLogger(__name__)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
 
-app = FastAPI(title=SERVICE_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.to_thread(store.create_schema)
+    except Exception as exc:
+        logger.warning("Ledger schema not ensured at startup: %s", exc)
+    yield
+
+
+app = FastAPI(title=SERVICE_NAME, lifespan=lifespan)
+install_profiler(app)
 
 
 def decode_jwt_header(request: Request) -> dict:
@@ -70,3 +93,30 @@ def health(request: Request) -> dict:
 def readiness() -> dict[str, str]:
     """Readiness probe for upstream load balancers."""
     return {"status": "ready", "service": SERVICE_NAME}
+
+
+@app.get("/entries/export")
+async def export_entries(
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    account: Optional[str] = None,
+    user: Dict[str, Any] = Depends(require_auditor),
+):
+    """
+    Stream ledger entries in ``[since, until)`` as NDJSON or an Arrow IPC stream.
+
+    Served from a follower-read snapshot through a server-side cursor, so
+    memory stays flat however many rows match.
+    """
+    return await export_response(store.entries_query(since, until, account), store.ledger_entries.c,
+                                 format, "ledger-entries")
+
+
+@app.get("/reconciliation/latest")
+async def latest_reconciliation(user: Dict[str, Any] = Depends(require_auditor)) -> Dict[str, Any]:
+    """The most recent reconciliation run and its break report."""
+    run = await asyncio.to_thread(store.latest_reconciliation)
+    if run is None:
+        raise HTTPException(status_code=404, detail="No reconciliation has run yet")
+    return run
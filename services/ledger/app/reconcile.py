@@ -0,0 +1,339 @@
+"""
+End-of-day reconciliation of payments against wallet movements and ledger journals.
+
+A run covers the window ``[checkpoint, now - RECON_SETTLE_SECONDS)``: every
+payment that was created, or had a wallet movement or ledger entry written,
+inside it is re-checked in full, so a hold released or a journal reversed days
+later is reconciled again. The window end is also the snapshot every read uses
+(``AS OF SYSTEM TIME``), so all processes see the same data and sagas still in
+flight at the edge are left for the next run.
+
+The work is split into ``RECON_PARTITIONS`` hash partitions of the payment id
+(``crc32ieee(id) % N`` for payments, of ``reference`` for movements and
+entries) and run on a process pool with one process per core
+(``RECON_WORKERS``). Each partition streams three server-side cursors - its
+payments ordered by id, wallet movements and ledger entries ordered by
+reference - and walks them as a sort-merge join, so memory holds one payment's
+rows at a time. Per payment it checks:
+
+* ``missing_wallet`` / ``wallet_mismatch`` - the payer's net wallet movement
+  is ``-amount`` (zero for failed payments, whose hold was released);
+* ``missing_ledger`` / ``ledger_mismatch`` - the ledger nets ``-amount`` on
+  the payer and ``+settlement_amount`` on the payee (nothing once failed);
+* ``unbalanced_journal`` - a single-currency posting that does not sum to
+  zero (cross-currency postings balance through the FX rate, which the legs
+  check covers);
+* ``orphan_wallet`` / ``orphan_ledger`` - movements whose reference is not a
+  payment.
+
+The two legs checks only run for the legs listed in ``RECON_LEGS``, none by
+default while payments neither hold funds nor post journals.
+
+Partitions return counts and a few sample breaks, never rows; the merged
+report (totals per kind, ``RECON_REPORT_SAMPLES`` examples) is stored on the
+run in ``reconciliation_runs`` and the checkpoint only advances when every
+partition finished.
+
+A daemonic process may not start children, so the pool cannot run inside a
+Celery prefork child: ``ledger.reconcile`` is routed to the
+``ledger-reconcile`` queue, served by a ``--pool solo`` worker that runs tasks
+in its main process. Called from a daemonic process anyway, the partitions
+run one after another in-process instead.
+
+    python reconcile.py                # from services/ledger/app
+    celery -A celery_app.celery_app call ledger.reconcile
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import attrgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select, union
+from sqlalchemy.sql import Select
+
+from services.common.db import get_engine, get_reporting_engine, reporting
+
+import store
+
+logger = logging.getLogger(__name__)
+
+RECON_WORKERS = int(os.getenv("RECON_WORKERS", "0")) or os.cpu_count() or 1
+# More partitions than workers keeps every core busy when partitions are uneven
+RECON_PARTITIONS = int(os.getenv("RECON_PARTITIONS", "0")) or 4 * RECON_WORKERS
+RECON_CHUNK_ROWS = int(os.getenv("RECON_CHUNK_ROWS", "10000"))
+RECON_SETTLE_SECONDS = float(os.getenv("RECON_SETTLE_SECONDS", "300"))
+RECON_INITIAL_HOURS = float(os.getenv("RECON_INITIAL_HOURS", "24"))
+RECON_REPORT_SAMPLES = int(os.getenv("RECON_REPORT_SAMPLES", "100"))
+# Legs every live payment must have (``wallet``, ``ledger``). None by default:
+# the payment pipeline does not hold funds or post journals yet, so payments
+# have no legs to miss; list a leg once the step writing it is enabled
+RECON_LEGS = frozenset(filter(None, os.getenv("RECON_LEGS", "").split(",")))
+
+# Payments whose funds were given back: every leg must net to zero
+_VOID_STATUSES = frozenset({"failed"})
+
+payments = store.payments
+wallet_movements = store.wallet_movements
+ledger_entries = store.ledger_entries
+
+Break = Dict[str, Any]
+Legs = Dict[Tuple[str, str], int]
+
+
+# ------------------------------------------------------------------- queries
+
+def _partition_of(key: Any, partitions: int) -> Any:
+    return func.crc32ieee(key) % partitions
+
+
+def partition_queries(partition: int, partitions: int, since: datetime,
+                      until: datetime) -> Tuple[Select, Select, Select]:
+    """Payments, wallet movements and ledger entries of payments touched in the window, in id order."""
+    def touched_by(source: Any, key: Any) -> Select:
+        return select(key.label("payment_id")).where(
+            source.c.created_at >= since,
+            source.c.created_at < until,
+            key.is_not(None),
+            _partition_of(key, partitions) == partition,
+        )
+
+    touched = union(
+        touched_by(payments, payments.c.id),
+        touched_by(wallet_movements, wallet_movements.c.reference),
+        touched_by(ledger_entries, ledger_entries.c.reference).where(
+            ~ledger_entries.c.reference.startswith(store.SETTLEMENT_REFERENCE_PREFIX)
+        ),
+    ).cte("touched")
+    ids = select(touched.c.payment_id)
+    return (
+        select(payments).where(payments.c.id.in_(ids)).order_by(payments.c.id),
+        select(wallet_movements.c.reference, wallet_movements.c.account_id, wallet_movements.c.amount,
+               wallet_movements.c.currency)
+        .where(wallet_movements.c.reference.in_(ids))
+        .order_by(wallet_movements.c.reference, wallet_movements.c.id),
+        select(ledger_entries.c.reference, ledger_entries.c.posting_id, ledger_entries.c.account,
+               ledger_entries.c.amount, ledger_entries.c.currency)
+        .where(ledger_entries.c.reference.in_(ids))
+        .order_by(ledger_entries.c.reference, ledger_entries.c.posting_id, ledger_entries.c.id),
+    )
+
+
+# --------------------------------------------------------------------- merge
+
+def _groups(rows: Iterable[Any]) -> Iterator[Tuple[str, List[Any]]]:
+    for reference, group in groupby(rows, key=attrgetter("reference")):
+        yield reference, list(group)
+
+
+def merge_join(payment_rows: Iterable[Any], wallet_rows: Iterable[Any],
+               ledger_rows: Iterable[Any]) -> Iterator[Tuple[str, Optional[Any], List[Any], List[Any]]]:
+    """
+    Walk three streams sorted by payment id in step.
+
+    Yields ``(payment_id, payment or None, wallet rows, ledger rows)`` once per id
+    present in any stream.
+    """
+    payments_iter = iter(payment_rows)
+    wallet_iter = _groups(wallet_rows)
+    ledger_iter = _groups(ledger_rows)
+    payment = next(payments_iter, None)
+    wallet = next(wallet_iter, None)
+    ledger = next(ledger_iter, None)
+    while payment is not None or wallet is not None or ledger is not None:
+        key = min(k for k in (payment and payment.id, wallet and wallet[0], ledger and ledger[0]) if k is not None)
+        current = None
+        wallet_group: List[Any] = []
+        ledger_group: List[Any] = []
+        if payment is not None and payment.id == key:
+            current, payment = payment, next(payments_iter, None)
+        if wallet is not None and wallet[0] == key:
+            wallet_group, wallet = wallet[1], next(wallet_iter, None)
+        if ledger is not None and ledger[0] == key:
+            ledger_group, ledger = ledger[1], next(ledger_iter, None)
+        yield key, current, wallet_group, ledger_group
+
+
+# -------------------------------------------------------------------- checks
+
+def _net(rows: Iterable[Any], account: str) -> Legs:
+    net: Legs = defaultdict(int)
+    for row in rows:
+        net[(getattr(row, account), row.currency)] += row.amount
+    return {leg: amount for leg, amount in net.items() if amount}
+
+
+def _legs(legs: Legs) -> Dict[str, int]:
+    return {f"{account}/{currency}": amount for (account, currency), amount in sorted(legs.items())}
+
+
+def check_payment(payment_id: str, payment: Optional[Any], wallet: List[Any], ledger: List[Any],
+                  legs: frozenset = RECON_LEGS) -> List[Break]:
+    """Breaks for one payment and the movements that reference it."""
+    if payment is None:
+        return [{"payment_id": payment_id, "kind": f"orphan_{leg}", "rows": len(rows)}
+                for leg, rows in (("wallet", wallet), ("ledger", ledger)) if rows]
+
+    breaks: List[Break] = []
+    live = payment.status not in _VOID_STATUSES
+    if "wallet" in legs:
+        expected: Legs = {(payment.payer_id, payment.currency): -payment.amount} if live else {}
+        actual = _net(wallet, "account_id")
+        if actual != expected:
+            kind = "missing_wallet" if not wallet else "wallet_mismatch"
+            breaks.append({"payment_id": payment_id, "kind": kind,
+                           "expected": _legs(expected), "actual": _legs(actual)})
+    if "ledger" in legs:
+        expected = defaultdict(int)
+        if live:
+            expected[(payment.payer_id, payment.currency)] -= payment.amount
+            expected[(payment.payee_id, payment.settlement_currency or payment.currency)] += (
+                payment.amount if payment.settlement_amount is None else payment.settlement_amount
+            )
+        expected = {leg: amount for leg, amount in expected.items() if amount}
+        actual = _net(ledger, "account")
+        if actual != expected:
+            kind = "missing_ledger" if not ledger else "ledger_mismatch"
+            breaks.append({"payment_id": payment_id, "kind": kind,
+                           "expected": _legs(expected), "actual": _legs(actual)})
+    for posting_id, lines in groupby(ledger, key=attrgetter("posting_id")):
+        lines = list(lines)
+        if len({line.currency for line in lines}) == 1 and sum(line.amount for line in lines):
+            breaks.append({"payment_id": payment_id, "kind": "unbalanced_journal", "posting_id": posting_id,
+                           "sum": sum(line.amount for line in lines), "currency": lines[0].currency})
+    return breaks
+
+
+# ---------------------------------------------------------------- partitions
+
+def _init_worker() -> None:
+    # Forked from a process that may hold pooled connections: never use (or close) the parent's sockets
+    for factory in (get_engine, get_reporting_engine):
+        if factory.cache_info().currsize:
+            factory().dispose(close=False)
+
+
+def _stream(conn: Any, stmt: Select) -> Iterator[Any]:
+    result = conn.execution_options(yield_per=RECON_CHUNK_ROWS).execute(stmt)
+    for rows in result.partitions():
+        yield from rows
+
+
+def reconcile_partition(partition: int, partitions: int, since: datetime, until: datetime,
+                        samples: int = RECON_REPORT_SAMPLES) -> Dict[str, Any]:
+    """Reconcile one hash partition; returns counts and up to ``samples`` breaks."""
+    started = time.perf_counter()
+    counts: Counter = Counter()
+    by_kind: Counter = Counter()
+    kept: List[Break] = []
+    payment_sql, wallet_sql, ledger_sql = partition_queries(partition, partitions, since, until)
+    with reporting(as_of=until) as conn:
+        merged = merge_join(_stream(conn, payment_sql), _stream(conn, wallet_sql), _stream(conn, ledger_sql))
+        for payment_id, payment, wallet, ledger in merged:
+            counts["payments"] += payment is not None
+            counts["wallet_movements"] += len(wallet)
+            counts["ledger_entries"] += len(ledger)
+            for found in check_payment(payment_id, payment, wallet, ledger):
+                by_kind[found["kind"]] += 1
+                if len(kept) < samples:
+                    kept.append(found)
+    return {"partition": partition, **counts, "by_kind": dict(by_kind), "samples": kept,
+            "seconds": time.perf_counter() - started}
+
+
+def _daemonic() -> bool:
+    """Whether this process may not start children (e.g. a Celery prefork child)."""
+    if multiprocessing.current_process().daemon:
+        return True
+    try:
+        from billiard.process import current_process
+    except ImportError:
+        return False
+    return bool(current_process().daemon)
+
+
+def _partition_results(since: datetime, until: datetime, partitions: int, workers: int) -> Iterator[Dict[str, Any]]:
+    if workers <= 1 or _daemonic():
+        for partition in range(partitions):
+            yield reconcile_partition(partition, partitions, since, until)
+        return
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=min(workers, partitions), mp_context=context,
+                             initializer=_init_worker) as pool:
+        futures = [pool.submit(reconcile_partition, partition, partitions, since, until)
+                   for partition in range(partitions)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def reconcile_window(since: datetime, until: datetime, partitions: int = RECON_PARTITIONS,
+                     workers: int = RECON_WORKERS) -> Dict[str, Any]:
+    """Run every partition of ``[since, until)`` on a process pool and merge their results."""
+    started = time.perf_counter()
+    totals: Counter = Counter()
+    by_kind: Counter = Counter()
+    samples: List[Break] = []
+    slowest = 0.0
+    if workers > 1 and _daemonic():
+        logger.warning("Reconciling in a daemonic process; running %d partitions serially", partitions)
+        workers = 1
+    for result in _partition_results(since, until, partitions, workers):
+        for key in ("payments", "wallet_movements", "ledger_entries"):
+            totals[key] += result.get(key, 0)
+        by_kind.update(result["by_kind"])
+        samples.extend(result["samples"])
+        slowest = max(slowest, result["seconds"])
+    samples.sort(key=lambda found: (found["kind"], found["payment_id"]))
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "partitions": partitions,
+        "workers": min(workers, partitions),
+        "payments": totals["payments"],
+        "wallet_movements": totals["wallet_movements"],
+        "ledger_entries": totals["ledger_entries"],
+        "breaks": sum(by_kind.values()),
+        "by_kind": dict(sorted(by_kind.items())),
+        "samples": samples[:RECON_REPORT_SAMPLES],
+        "seconds": round(time.perf_counter() - started, 3),
+        "slowest_partition_seconds": round(slowest, 3),
+    }
+
+
+def run(until: Optional[datetime] = None) -> Dict[str, Any]:
+    """Reconcile from the last checkpoint to ``until`` (default: now minus the settle delay)."""
+    until = until or datetime.now(timezone.utc) - timedelta(seconds=RECON_SETTLE_SECONDS)
+    since = store.reconciliation_checkpoint() or until - timedelta(hours=RECON_INITIAL_HOURS)
+    if since >= until:
+        logger.info("Reconciliation already covers %s", until.isoformat())
+        return {"since": since.isoformat(), "until": until.isoformat(), "payments": 0, "breaks": 0}
+
+    run_id = store.start_reconciliation(since, until)
+    try:
+        report = reconcile_window(since, until)
+    except Exception as exc:
+        store.finish_reconciliation(run_id, "failed", {"error": str(exc)})
+        raise
+    report["run_id"] = run_id
+    store.finish_reconciliation(run_id, "complete", report)
+    log = logger.warning if report["breaks"] else logger.info
+    log("Reconciled %d payments in [%s, %s) in %.1fs: %d breaks %s", report["payments"], report["since"],
+        report["until"], report["seconds"], report["breaks"], report["by_kind"],
+        extra={"run_id": run_id, "breaks": report["breaks"]})
+    return report
+
+
+if __name__ == "__main__":
+    import json
+
+    from services.common.logs import configure_logging
+
+    configure_logging()
+    print(json.dumps(run(), indent=2))
@@ -0,0 +1,182 @@
+"""
+Ledger persistence in CockroachDB.
+"""
+from __future__ import annotations
+
+import json
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Index, Integer, String, Table, Text, column, func, select, table, update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import Select
+
+from services.common.db import connection, get_engine, metadata, transaction
+
+# One row per posting line; the lines of a posting share ``posting_id`` and sum to zero per currency
+ledger_entries = Table(
+    "ledger_entries",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("posting_id", String(36), nullable=False, index=True),
+    Column("account", String(64), nullable=False),
+    Column("amount", BigInteger, nullable=False),  # minor units, debits negative
+    Column("currency", String(3), nullable=False),
+    Column("reference", String(140)),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Index("ledger_entries_created_idx", "created_at", "id"),
+    Index("ledger_entries_account_idx", "account", "created_at"),
+)
+
+# Settlement journals reference their run as ``settlement:<run id>``, not a payment
+SETTLEMENT_REFERENCE_PREFIX = "settlement:"
+
+# One row per settled window; the unique window keeps a window from being posted twice
+settlement_runs = Table(
+    "settlement_runs",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("window_start", DateTime(timezone=True), nullable=False),
+    Column("window_end", DateTime(timezone=True), nullable=False),
+    Column("payments", BigInteger, nullable=False),
+    Column("positions", Integer, nullable=False),
+    Column("transfers", Integer, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Index("settlement_runs_window_idx", "window_start", "window_end", unique=True),
+)
+
+# One row per reconciliation run; the ``until`` of the last complete run is the checkpoint
+reconciliation_runs = Table(
+    "reconciliation_runs",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("since", DateTime(timezone=True), nullable=False),
+    Column("until", DateTime(timezone=True), nullable=False),
+    Column("status", String(16), nullable=False),  # running, complete, failed
+    Column("payments", BigInteger, nullable=False, default=0),
+    Column("breaks", BigInteger, nullable=False, default=0),
+    Column("report", Text),
+    Column("started_at", DateTime(timezone=True), nullable=False),
+    Column("finished_at", DateTime(timezone=True)),
+    Index("reconciliation_runs_until_idx", "status", "until"),
+)
+
+
+def create_schema() -> None:
+    metadata.create_all(get_engine(), tables=[ledger_entries, settlement_runs, reconciliation_runs])
+
+
+# Owned by the payment and wallet services; only read here
+payments = table(
+    "payments",
+    column("id"), column("payer_id"), column("payee_id"), column("amount"), column("currency"),
+    column("settlement_amount"), column("settlement_currency"), column("status"), column("created_at"),
+)
+wallet_movements = table(
+    "wallet_movements",
+    column("id"), column("account_id"), column("amount"), column("currency"), column("reference"),
+    column("created_at"),
+)
+
+
+def entries_query(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    account: Optional[str] = None,
+) -> Select:
+    """Entries in ``[since, until)``, oldest first (``ledger_entries_created_idx`` order)."""
+    stmt = select(*ledger_entries.c)
+    if since is not None:
+        stmt = stmt.where(ledger_entries.c.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(ledger_entries.c.created_at < until)
+    if account is not None:
+        stmt = stmt.where(ledger_entries.c.account == account)
+    return stmt.order_by(ledger_entries.c.created_at, ledger_entries.c.id)
+
+
+def reconciliation_checkpoint() -> Optional[datetime]:
+    """End of the window the last complete reconciliation covered."""
+    with connection() as conn:
+        return conn.execute(
+            select(func.max(reconciliation_runs.c.until)).where(reconciliation_runs.c.status == "complete")
+        ).scalar()
+
+
+def start_reconciliation(since: datetime, until: datetime) -> str:
+    run_id = str(uuid.uuid4())
+    with transaction() as conn:
+        conn.execute(reconciliation_runs.insert().values(
+            id=run_id, since=since, until=until, status="running", payments=0, breaks=0,
+            started_at=datetime.now(timezone.utc),
+        ))
+    return run_id
+
+
+def finish_reconciliation(run_id: str, status: str, report: Dict[str, Any]) -> None:
+    with transaction() as conn:
+        conn.execute(
+            update(reconciliation_runs)
+            .where(reconciliation_runs.c.id == run_id)
+            .values(status=status, payments=report.get("payments", 0), breaks=report.get("breaks", 0),
+                    report=json.dumps(report), finished_at=datetime.now(timezone.utc))
+        )
+
+
+def latest_reconciliation() -> Optional[Dict[str, Any]]:
+    with connection() as conn:
+        row = conn.execute(
+            select(*reconciliation_runs.c).order_by(reconciliation_runs.c.started_at.desc()).limit(1)
+        ).first()
+    if row is None:
+        return None
+    data = dict(row._mapping)
+    data["report"] = json.loads(data["report"]) if data["report"] else None
+    for key in ("since", "until", "started_at", "finished_at"):
+        if isinstance(data[key], datetime):
+            data[key] = data[key].isoformat()
+    return data
+
+
+def last_settled_window_end() -> Optional[datetime]:
+    with connection() as conn:
+        return conn.execute(select(func.max(settlement_runs.c.window_end))).scalar()
+
+
+def post_settlement(window_start: datetime, window_end: datetime, payments_count: int, positions: int,
+                    transfers: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Record a settled window and post one two-line journal per transfer, atomically.
+
+    Args:
+        transfers: ``{"payer", "payee", "amount", "currency"}`` each, amounts positive
+
+    Returns:
+        The run id, or ``None`` if the window was already settled
+    """
+    run_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    reference = f"{SETTLEMENT_REFERENCE_PREFIX}{run_id}"
+    with transaction() as conn:
+        inserted = conn.execute(
+            insert(settlement_runs)
+            .values(id=run_id, window_start=window_start, window_end=window_end, payments=payments_count,
+                    positions=positions, transfers=len(transfers), created_at=now)
+            .on_conflict_do_nothing(index_elements=["window_start", "window_end"])
+            .returning(settlement_runs.c.id)
+        ).first()
+        if inserted is None:
+            return None
+        lines = []
+        for transfer in transfers:
+            posting_id = str(uuid.uuid4())
+            for account, amount in ((transfer["payer"], -transfer["amount"]), (transfer["payee"], transfer["amount"])):
+                lines.append({"id": str(uuid.uuid4()), "posting_id": posting_id, "account": account,
+                              "amount": amount, "currency": transfer["currency"], "reference": reference,
+                              "created_at": now})
+        if lines:
+            conn.execute(ledger_entries.insert(), lines)
+    return run_id
@@ -1,12 +1,17 @@
+import logging
 import time
 
+import netting
+import reconcile
 from celery_app import celery_app
 
+logger = logging.getLogger(__name__)
+
 
 @celery_app.task(name="tasks.echo")
 def echo(msg):
     """Echo a message back."""
-    print(f"[LEDGER WORKER] Echo: {msg}")
+    logger.info("Echo: %s", msg)
     return msg
 
 
@@ -21,3 +26,15 @@ def slow(seconds):
     """Sleep for the provided duration and return it."""
     time.sleep(seconds)
     return seconds
+
+
+@celery_app.task(name="ledger.settle", budget=900)
+def settle():
+    """Net and post every closed settlement window since the last one settled."""
+    return netting.settle_due()
+
+
+@celery_app.task(name="ledger.reconcile", budget=3600)
+def reconcile_payments():
+    """Reconcile payments, wallet movements and ledger journals since the last checkpoint."""
+    return reconcile.run()
@@ -0,0 +1,92 @@
+"""
+Pooled clients for the services a payment calls.
+
+One ``httpx.AsyncClient`` per downstream keeps connections warm across
+payments; every call takes its timeout from the payment deadline. Calls are
+authenticated with the payment service's own client-credentials token.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from services.common.auth import WSO2_IS_URL
+from services.common.profiles import ProfileLoader
+
+PAYMENT_CLIENT_ID = os.getenv("PAYMENT_CLIENT_ID", "")
+PAYMENT_CLIENT_SECRET = os.getenv("PAYMENT_CLIENT_SECRET", "")
+RULE_ENGINE_URL = os.getenv("RULE_ENGINE_URL", "http://rule-engine:8000")
+FOREX_URL = os.getenv("FOREX_URL", "http://forex:8000")
+DOWNSTREAM_MAX_CONNECTIONS = int(os.getenv("DOWNSTREAM_MAX_CONNECTIONS", "100"))
+
+
+class ServiceToken:
+    """Client-credentials access token, refreshed shortly before it expires."""
+
+    def __init__(self, client: httpx.AsyncClient) -> None:
+        self._client = client
+        self._token = ""
+        self._expires = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> str:
+        if self._token and time.monotonic() < self._expires:
+            return self._token
+        async with self._lock:
+            if not self._token or time.monotonic() >= self._expires:
+                response = await self._client.post(
+                    f"{WSO2_IS_URL}/oauth2/token",
+                    data={"grant_type": "client_credentials"},
+                    auth=(PAYMENT_CLIENT_ID, PAYMENT_CLIENT_SECRET),
+                )
+                response.raise_for_status()
+                body = response.json()
+                self._token = body["access_token"]
+                self._expires = time.monotonic() + int(body.get("expires_in", 3600)) - 60
+        return self._token
+
+
+class Downstream:
+    """Profile, rule-engine and forex calls for one payment."""
+
+    def __init__(self) -> None:
+        limits = httpx.Limits(max_connections=DOWNSTREAM_MAX_CONNECTIONS,
+                              max_keepalive_connections=DOWNSTREAM_MAX_CONNECTIONS)
+        self._clients = {
+            name: httpx.AsyncClient(base_url=url, limits=limits)
+            for name, url in (("rules", RULE_ENGINE_URL), ("forex", FOREX_URL))
+        }
+        # TLS verification handled by truststore, as in services.common.auth
+        self._idp = httpx.AsyncClient(timeout=10.0, verify=False)
+        self.token = ServiceToken(self._idp)
+        self.profiles = ProfileLoader(token_provider=self.token.get)
+
+    async def aclose(self) -> None:
+        await self.profiles.aclose()
+        await self._idp.aclose()
+        for client in self._clients.values():
+            await client.aclose()
+
+    async def _call(self, service: str, method: str, path: str, timeout: float,
+                    json: Any = None) -> Dict[str, Any]:
+        response = await self._clients[service].request(
+            method, path, json=json, timeout=timeout,
+            headers={"Authorization": f"Bearer {await self.token.get()}"},
+        )
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    async def profile(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return await self.profiles.load(profile_id)
+
+    async def quote(self, amount: int, from_currency: str, to_currency: str, timeout: float) -> Dict[str, Any]:
+        body = {"amounts": [amount], "from_currencies": [from_currency], "to_currencies": [to_currency]}
+        result = await self._call("forex", "POST", "/convert/batch", timeout, body)
+        return {"amount": result["amounts"][0], "currency": to_currency, "rates": result["quotes"]}
+
+    async def screen(self, txn: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        return await self._call("rules", "POST", "/evaluate", timeout, txn)
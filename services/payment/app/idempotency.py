@@ -0,0 +1,318 @@
+"""
+Idempotency keys for payment submission.
+
+Mobile clients retry, so every ``POST /payments`` carrying an
+``Idempotency-Key`` is resolved in this order:
+
+1. In-process replay cache - recently completed keys answer without any
+   network hop.
+2. Redis ``SET NX GET`` - one round trip that either reserves the key
+   (``pending``, with a TTL) or returns what is already stored: a concurrent
+   attempt still in flight, or the completed response to replay.
+3. CockroachDB - only consulted when Redis no longer knows the key (expired
+   or lost) *and* the in-process Bloom filter says it may have been seen.
+   The filter has no false negatives, so new keys - almost all of them -
+   skip the database entirely.
+
+Completed responses are written back to Redis right away and persisted to
+the database asynchronously in batches; the filter is kept in sync with
+keys recorded by other instances by polling the database, re-reading an
+overlap window behind the last watermark because batches can commit out of
+``created_at`` order. Durable keys are kept for ``IDEMPOTENCY_RETENTION_HOURS``
+and purged after that, so a restart only loads that window into the filter.
+The filter forgets them too: it is two generations of one retention window
+each, and the older one is dropped when the current one has been filled for
+a whole window, so its false-positive rate stays where it was sized.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Mapping, Optional, Tuple
+
+import store
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_PENDING_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_PENDING_TTL_SECONDS", "60"))
+# Keys per retention window, across all instances
+IDEMPOTENCY_BLOOM_CAPACITY = int(os.getenv("IDEMPOTENCY_BLOOM_CAPACITY", "2000000"))
+IDEMPOTENCY_BLOOM_ERROR_RATE = float(os.getenv("IDEMPOTENCY_BLOOM_ERROR_RATE", "0.001"))
+IDEMPOTENCY_BLOOM_SYNC_SECONDS = float(os.getenv("IDEMPOTENCY_BLOOM_SYNC_SECONDS", "30"))
+# Re-read behind the watermark; must exceed the longest idempotency flush transaction
+IDEMPOTENCY_SYNC_OVERLAP_SECONDS = float(os.getenv("IDEMPOTENCY_SYNC_OVERLAP_SECONDS", "120"))
+# Keep above IDEMPOTENCY_TTL_SECONDS: older keys are no longer replayed
+IDEMPOTENCY_RETENTION_HOURS = int(os.getenv("IDEMPOTENCY_RETENTION_HOURS", "168"))
+IDEMPOTENCY_PURGE_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "3600"))
+IDEMPOTENCY_REPLAY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_REPLAY_CACHE_SIZE", "50000"))
+IDEMPOTENCY_FLUSH_BATCH = int(os.getenv("IDEMPOTENCY_FLUSH_BATCH", "500"))
+IDEMPOTENCY_FLUSH_SECONDS = float(os.getenv("IDEMPOTENCY_FLUSH_SECONDS", "0.05"))
+_KEY_PREFIX = "payment:idem"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one BLAKE2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.size = bits
+        self.hashes = max(1, round(bits / capacity * math.log(2)))
+        self._bits = bytearray((bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item: str) -> List[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        positions = self._positions(item)
+        with self._lock:
+            for pos in positions:
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RotatingBloomFilter:
+    """
+    Two Bloom filter generations, each taking adds for ``window`` seconds.
+
+    On rotation the previous generation is dropped and the current one takes
+    its place, so an item is remembered for at least one window and at most
+    two. Each generation gets half the error budget: a lookup checks both.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, window: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate / 2
+        self.window = window
+        self._current = BloomFilter(capacity, self.error_rate)
+        self._previous: Optional[BloomFilter] = None
+        self._rotates_at = time.monotonic() + window
+        self._lock = threading.Lock()
+
+    def _rotate(self) -> None:
+        if time.monotonic() < self._rotates_at:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now < self._rotates_at:
+                return
+            self._previous, self._current = self._current, BloomFilter(self.capacity, self.error_rate)
+            self._rotates_at = now + self.window
+
+    def add(self, item: str) -> None:
+        self._rotate()
+        self._current.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        self._rotate()
+        previous = self._previous
+        return item in self._current or (previous is not None and item in previous)
+
+
+def fingerprint(body: Mapping[str, Any]) -> str:
+    """Stable hash of a request body; a key reused with a different body is rejected."""
+    canonical = json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class Reservation:
+    """
+    Outcome of ``IdempotencyStore.reserve``.
+
+    ``state`` is ``new`` (caller owns the key and must ``complete`` or
+    ``release`` it), ``replay`` (``status_code``/``response`` hold the
+    original answer), ``in_progress`` or ``mismatch``.
+    """
+
+    state: str
+    status_code: int = 0
+    response: Any = None
+
+
+class IdempotencyStore:
+    """Redis-reserved, Bloom-guarded, asynchronously persisted idempotency keys."""
+
+    def __init__(self, redis_client: Any) -> None:
+        self._redis = redis_client
+        self.bloom = RotatingBloomFilter(IDEMPOTENCY_BLOOM_CAPACITY, IDEMPOTENCY_BLOOM_ERROR_RATE,
+                                         IDEMPOTENCY_RETENTION_HOURS * 3600)
+        self._replays: "OrderedDict[str, Tuple[float, str, int, Any]]" = OrderedDict()
+        self._replays_lock = threading.Lock()
+        self._queue: "asyncio.Queue[Tuple[str, str, int, Any]]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._watermark: Optional[datetime] = None
+        self._purged_at = 0.0
+        self.db_checks = 0
+
+    @staticmethod
+    def scoped_key(owner: str, key: str) -> str:
+        """Keys are only unique per caller; never let two callers share one."""
+        return f"{_KEY_PREFIX}:{owner}:{key}"
+
+    # ------------------------------------------------------------- lifecycle
+
+    async def start(self) -> None:
+        try:
+            await self.sync_bloom()
+        except Exception as exc:
+            logger.warning("Idempotency Bloom filter not warmed from the database: %s", exc)
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self._sync_loop())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        while not self._queue.empty():
+            try:
+                await self._flush(self._drain())
+            except Exception:
+                break
+
+    async def sync_bloom(self) -> int:
+        """Add keys recorded (by any instance) since the last sync, or within retention on the first one."""
+        since = self._watermark or datetime.now(timezone.utc) - timedelta(hours=IDEMPOTENCY_RETENTION_HOURS)
+        keys, self._watermark = await asyncio.to_thread(
+            store.idempotency_keys_since, since, timedelta(seconds=IDEMPOTENCY_SYNC_OVERLAP_SECONDS)
+        )
+        for key in keys:
+            self.bloom.add(key)
+        return len(keys)
+
+    async def purge(self) -> int:
+        """Delete durable keys older than ``IDEMPOTENCY_RETENTION_HOURS``."""
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=IDEMPOTENCY_RETENTION_HOURS)
+        purged = await asyncio.to_thread(store.purge_idempotency, cutoff)
+        if purged:
+            logger.info("Purged %d idempotency keys older than %s", purged, cutoff.isoformat())
+        return purged
+
+    # ------------------------------------------------------------------- API
+
+    async def reserve(self, key: str, fp: str) -> Reservation:
+        local = self._replay_get(key)
+        if local is not None:
+            return self._resolve(fp, "done", *local)
+
+        pending = json.dumps({"s": "pending", "fp": fp})
+        existing = await self._redis.set(key, pending, nx=True, get=True, ex=IDEMPOTENCY_PENDING_TTL_SECONDS)
+        if existing is not None:
+            entry = json.loads(existing)
+            if entry["s"] == "done":
+                self._replay_put(key, entry["fp"], entry["code"], entry["body"])
+            return self._resolve(fp, entry["s"], entry["fp"], entry.get("code", 0), entry.get("body"))
+
+        if key not in self.bloom:
+            return Reservation("new")
+
+        # Possibly completed before Redis forgot it: ask the durable record
+        self.db_checks += 1
+        durable = await asyncio.to_thread(store.fetch_idempotency, key)
+        if durable is None:
+            return Reservation("new")
+        stored_fp, code, body = durable
+        await self._redis.set(key, self._done_entry(stored_fp, code, body), ex=IDEMPOTENCY_TTL_SECONDS)
+        self._replay_put(key, stored_fp, code, body)
+        return self._resolve(fp, "done", stored_fp, code, body)
+
+    async def complete(self, key: str, fp: str, status_code: int, response: Any) -> None:
+        """Store the response for replay and queue the durable record."""
+        # Local and durable first: the payment exists even if Redis is down now
+        self._replay_put(key, fp, status_code, response)
+        self.bloom.add(key)
+        self._queue.put_nowait((key, fp, status_code, response))
+        await self._redis.set(key, self._done_entry(fp, status_code, response), ex=IDEMPOTENCY_TTL_SECONDS)
+
+    async def release(self, key: str) -> None:
+        """Drop a reservation whose request failed so the client can retry."""
+        await self._redis.delete(key)
+
+    # ------------------------------------------------------------- internals
+
+    @staticmethod
+    def _done_entry(fp: str, status_code: int, response: Any) -> str:
+        return json.dumps({"s": "done", "fp": fp, "code": status_code, "body": response})
+
+    @staticmethod
+    def _resolve(fp: str, state: str, stored_fp: str, status_code: int, response: Any) -> Reservation:
+        if stored_fp != fp:
+            return Reservation("mismatch")
+        if state != "done":
+            return Reservation("in_progress")
+        return Reservation("replay", status_code, response)
+
+    def _replay_get(self, key: str) -> Optional[Tuple[str, int, Any]]:
+        with self._replays_lock:
+            entry = self._replays.get(key)
+            if entry is None:
+                return None
+            self._replays.move_to_end(key)
+            expires, fp, code, body = entry
+        if expires < time.monotonic():
+            return None
+        return fp, code, body
+
+    def _replay_put(self, key: str, fp: str, status_code: int, response: Any) -> None:
+        expires = time.monotonic() + IDEMPOTENCY_TTL_SECONDS
+        with self._replays_lock:
+            self._replays[key] = (expires, fp, status_code, response)
+            self._replays.move_to_end(key)
+            while len(self._replays) > IDEMPOTENCY_REPLAY_CACHE_SIZE:
+                self._replays.popitem(last=False)
+
+    def _drain(self) -> List[Tuple[str, str, int, Any]]:
+        batch = []
+        while not self._queue.empty() and len(batch) < IDEMPOTENCY_FLUSH_BATCH:
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _flush(self, batch: List[Tuple[str, str, int, Any]]) -> None:
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(store.record_idempotency, batch)
+        except Exception as exc:
+            # Redis still holds these for the TTL; retry on the next flush
+            logger.warning("Persisting %d idempotency keys failed: %s", len(batch), exc)
+            for record in batch:
+                self._queue.put_nowait(record)
+            raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            first = await self._queue.get()
+            await asyncio.sleep(IDEMPOTENCY_FLUSH_SECONDS)
+            try:
+                await self._flush([first] + self._drain())
+            except Exception:
+                await asyncio.sleep(1)
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(IDEMPOTENCY_BLOOM_SYNC_SECONDS)
+            try:
+                await self.sync_bloom()
+            except Exception as exc:
+                logger.warning("Idempotency Bloom filter sync failed: %s", exc)
+            if time.monotonic() - self._purged_at >= IDEMPOTENCY_PURGE_SECONDS:
+                self._purged_at = time.monotonic()
+                try:
+                    await self.purge()
+                except Exception as exc:
+                    logger.warning("Idempotency key purge failed: %s", exc)
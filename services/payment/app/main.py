@@ -1,14 +1,83 @@
 import os
+import asyncio
 import base64
 import json
-from fastapi import FastAPI, HTTPException, Request
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, Optional
 
-from services.common.auth import decode_token
+import httpx
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from services.common.auth import decode_token, require_auditor, require_authenticated
+from services.common.export import export_response
+from services.common.profiler import install as install_profiler
 from services.common.userinfo import extract_user_info
 
+import payouts
+import pipeline
+import store
+from celery_app import celery_app
+from clients import Downstream
+from idempotency import IdempotencyStore, fingerprint
+from orchestrator import Orchestrator, StepFailed
+
+logger = logging.getLogger(__name__)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
+REDIS_URL = os.getenv("REDIS_URL", "")
+PAYMENT_DEADLINE_SECONDS = float(os.getenv("PAYMENT_DEADLINE_SECONDS", "2.0"))
+PAYOUT_FILE_DIR = os.getenv("PAYOUT_FILE_DIR", "/data/payout-files")
+PAYOUT_MAX_BYTES = int(os.getenv("PAYOUT_MAX_BYTES", str(2 * 1024 ** 3)))
+# Roles allowed to submit a payment on behalf of another payer
+PAYMENT_ON_BEHALF_ROLES = {"admin", "ops_user"}
+
+idempotency: Optional[IdempotencyStore] = None
+orchestrator: Optional[Orchestrator] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global idempotency, orchestrator
+    downstream = Downstream()
+    orchestrator = pipeline.build(downstream)
+    try:
+        await asyncio.to_thread(store.create_schema)
+    except Exception as exc:
+        logger.warning("Payment schema not ensured at startup: %s", exc)
+
+    redis_client = None
+    if REDIS_URL:
+        import redis.asyncio as redis
+
+        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        idempotency = IdempotencyStore(redis_client)
+        await idempotency.start()
+
+    yield
+
+    if idempotency is not None:
+        await idempotency.stop()
+    if redis_client is not None:
+        await redis_client.aclose()
+    await downstream.aclose()
 
-app = FastAPI(title=SERVICE_NAME)
+
+app = FastAPI(title=SERVICE_NAME, lifespan=lifespan)
+install_profiler(app)
+
+
+class PaymentRequest(BaseModel):
+    payer_id: str
+    payee_id: str
+    amount: int = Field(..., gt=0, description="Minor units")
+    currency: str = Field(..., min_length=3, max_length=3)
+    reference: Optional[str] = Field(None, max_length=140)
+    settlement_currency: Optional[str] = Field(None, min_length=3, max_length=3)
 
 
 def decode_jwt_header(request: Request) -> dict:
@@ -70,3 +139,178 @@ def health(request: Request) -> dict:
 def readiness() -> dict[str, str]:
     """Readiness probe for upstream load balancers."""
     return {"status": "ready", "service": SERVICE_NAME}
+
+
+@app.post("/payments", status_code=201)
+async def submit_payment(
+    body: PaymentRequest,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    user: Dict[str, Any] = Depends(require_authenticated),
+):
+    """
+    Submit a payment.
+
+    The payer profile and FX quote are fetched concurrently, then the
+    payment is screened by the rule engine and recorded, all under one
+    ``PAYMENT_DEADLINE_SECONDS`` deadline (see ``pipeline.py``). Blocked or
+    unknown payers get 422, a missed deadline 504, a failing dependency 502.
+
+    With an ``Idempotency-Key`` header, retries of the same request return
+    the original response (marked ``Idempotent-Replayed: true``) instead of
+    creating a second payment. Reusing a key with a different body is
+    rejected with 422; a retry racing the original gets 409.
+
+    ``payer_id`` must be the caller (``sub``) unless the caller is admin or
+    ops_user; otherwise 403.
+    """
+    if body.payer_id != user.get("sub") and not PAYMENT_ON_BEHALF_ROLES & set(user.get("roles", [])):
+        raise HTTPException(status_code=403, detail="payer_id must be the authenticated user")
+    fields = body.model_dump()
+    if idempotency_key is None:
+        return await _process(fields, user)
+    if idempotency is None:
+        raise HTTPException(status_code=503, detail="Idempotency store unavailable")
+
+    key = IdempotencyStore.scoped_key(user.get("sub") or "anonymous", idempotency_key)
+    fp = fingerprint(fields)
+    try:
+        reservation = await idempotency.reserve(key, fp)
+    except Exception as exc:
+        logger.warning("Idempotency check failed: %s", exc)
+        raise HTTPException(status_code=503, detail="Idempotency store unavailable")
+
+    if reservation.state == "replay":
+        return JSONResponse(
+            reservation.response,
+            status_code=reservation.status_code,
+            headers={"Idempotent-Replayed": "true"},
+        )
+    if reservation.state == "mismatch":
+        raise HTTPException(status_code=422, detail="Idempotency-Key was used with a different request body")
+    if reservation.state == "in_progress":
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is in progress")
+
+    try:
+        payment = await _process(fields, user)
+    except Exception:
+        await idempotency.release(key)
+        raise
+    try:
+        await idempotency.complete(key, fp, 201, payment)
+    except Exception as exc:
+        logger.warning("Storing idempotent response in Redis failed: %s", exc)
+    return payment
+
+
+async def _process(fields: Dict[str, Any], user: Dict[str, Any]) -> Dict[str, Any]:
+    inputs = {**fields, "payment_id": str(uuid.uuid4()), "created_by": user.get("sub")}
+    try:
+        outcome = await orchestrator.execute(inputs, PAYMENT_DEADLINE_SECONDS)
+    except StepFailed as exc:
+        if isinstance(exc.cause, pipeline.PaymentRejected):
+            raise HTTPException(status_code=422, detail={
+                "reason": exc.cause.reason, "matched_rules": exc.cause.matched_rules,
+            })
+        if isinstance(exc.cause, (TimeoutError, httpx.TimeoutException)):
+            raise HTTPException(status_code=504, detail=f"Payment deadline exceeded in {exc.step}")
+        logger.warning("Payment %s failed at %s: %r", inputs["payment_id"], exc.step, exc.cause)
+        raise HTTPException(status_code=502, detail=f"Payment step {exc.step} failed")
+    return outcome.results["record"]
+
+
+@app.get("/payments/export")
+async def export_payments(
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    status: Optional[str] = None,
+    user: Dict[str, Any] = Depends(require_auditor),
+):
+    """
+    Stream payments created in ``[since, until)`` as NDJSON or an Arrow IPC stream.
+
+    Served from a follower-read snapshot through a server-side cursor, so
+    memory stays flat however many rows match.
+    """
+    return await export_response(store.payments_query(since, until, status), store.payments.c,
+                                 format, "payments")
+
+
+@app.post("/payouts/files", status_code=202)
+async def upload_payout_file(
+    request: Request,
+    format: str,
+    user: Dict[str, Any] = Depends(require_authenticated),
+) -> dict:
+    """
+    Upload a bulk payout file as the raw request body (``format=csv`` or
+    ``format=pain.001``).
+
+    The body is streamed to disk, never held in memory (each write runs in
+    a worker thread, off the event loop), and parsed by the payment workers
+    in chunks; poll ``GET /payouts/files/{id}`` for progress.
+    """
+    if format not in payouts.FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {list(payouts.FORMATS)}")
+    file_id = str(uuid.uuid4())
+    os.makedirs(PAYOUT_FILE_DIR, exist_ok=True)
+    path = os.path.join(PAYOUT_FILE_DIR, f"{file_id}.{'csv' if format == 'csv' else 'xml'}")
+    size = 0
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > PAYOUT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Payout file too large")
+            await asyncio.to_thread(f.write, chunk)
+        await asyncio.to_thread(f.close)
+    except BaseException:
+        f.close()
+        os.unlink(path)
+        raise
+    if size == 0:
+        os.unlink(path)
+        raise HTTPException(status_code=422, detail="Empty payout file")
+
+    payout = await asyncio.to_thread(store.create_payout_file, file_id, user.get("sub") or "", format, path, size)
+    celery_app.send_task("payment.ingest_payout_file", args=[file_id])
+    return payout
+
+
+async def _owned_payout(file_id: str, user: Dict[str, Any]) -> Dict[str, Any]:
+    payout = await asyncio.to_thread(store.fetch_payout_file, file_id)
+    if payout is None or (payout["owner"] != user.get("sub") and "admin" not in user.get("roles", [])):
+        raise HTTPException(status_code=404, detail="Payout file not found")
+    return payout
+
+
+@app.get("/payouts/files/{file_id}")
+async def payout_progress(file_id: str, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """
+    Ingestion progress: rows parsed (the checkpoint), chunks dispatched and
+    loaded, and valid / invalid row counts.
+    """
+    return await _owned_payout(file_id, user)
+
+
+@app.get("/payouts/files/{file_id}/errors")
+async def payout_errors(
+    file_id: str,
+    after_row: int = 0,
+    limit: int = 100,
+    user: Dict[str, Any] = Depends(require_authenticated),
+) -> dict:
+    """Invalid rows with the reason, in file order (page with ``after_row``)."""
+    await _owned_payout(file_id, user)
+    errors = await asyncio.to_thread(store.fetch_payout_errors, file_id, min(limit, 1000), after_row)
+    return {"file_id": file_id, "errors": errors}
+
+
+@app.post("/payouts/files/{file_id}/resume", status_code=202)
+async def resume_payout_file(file_id: str, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """Re-queue parsing of an interrupted file; it continues from its checkpoint."""
+    payout = await _owned_payout(file_id, user)
+    if payout["status"] != "parsing":
+        raise HTTPException(status_code=409, detail=f"Payout file is {payout['status']}")
+    celery_app.send_task("payment.ingest_payout_file", args=[file_id])
+    return payout
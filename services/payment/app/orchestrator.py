@@ -0,0 +1,191 @@
+"""
+Dependency-graph execution of the calls behind one payment.
+
+Each ``Step`` names the steps it needs; a step starts as soon as its last
+dependency finishes, so independent calls (profile fetch, FX quote) overlap
+and the end-to-end latency tracks the longest chain, not the sum of calls.
+The whole graph shares one deadline. When a step fails (or the deadline
+passes, or the caller is cancelled) nothing new starts and every running
+step is cancelled - except ``shield`` steps, which cannot be interrupted
+(a write running in a thread) and are waited for instead. Then the ``abort``
+hooks of steps that ended without a result run, and the compensations of
+the steps that completed (shielded ones included) run in reverse order of
+completion.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Context:
+    """Per-payment state shared by all steps: inputs, step results and the deadline."""
+
+    def __init__(self, inputs: Dict[str, Any], deadline: float) -> None:
+        self.inputs = inputs
+        self.results: Dict[str, Any] = {}
+        self.deadline = deadline
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (use as the timeout of each call)."""
+        return max(0.0, self.deadline - time.monotonic())
+
+
+@dataclass(frozen=True)
+class Step:
+    """
+    One node of the graph.
+
+    ``run(ctx)`` returns the step result (stored in ``ctx.results[name]``);
+    ``compensate(ctx, result)`` undoes it if a later step fails.
+    ``abort(ctx)`` undoes a step that raised, timed out or was cancelled but
+    may have taken effect anyway; it has no result, so it must find the
+    effect from ``ctx.inputs`` (e.g. the payment id used as reference) and
+    be a no-op when there is none. A ``shield`` step is never cancelled.
+    """
+
+    name: str
+    run: Callable[[Context], Awaitable[Any]]
+    after: Tuple[str, ...] = ()
+    compensate: Optional[Callable[[Context, Any], Awaitable[None]]] = None
+    abort: Optional[Callable[[Context], Awaitable[None]]] = None
+    shield: bool = False
+
+
+class StepFailed(Exception):
+    """A step raised (``cause``) or the deadline passed (``cause`` is ``TimeoutError``)."""
+
+    def __init__(self, step: str, cause: BaseException) -> None:
+        super().__init__(f"Step {step} failed: {cause!r}")
+        self.step = step
+        self.cause = cause
+        self.outcome: Optional["Outcome"] = None
+
+
+@dataclass
+class Outcome:
+    results: Dict[str, Any]
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    compensated: List[str] = field(default_factory=list)
+
+
+class Orchestrator:
+    """Validated step graph, reusable across payments."""
+
+    def __init__(self, steps: Sequence[Step]) -> None:
+        self.steps = {step.name: step for step in steps}
+        if len(self.steps) != len(steps):
+            raise ValueError("Duplicate step name")
+        for step in steps:
+            missing = [dep for dep in step.after if dep not in self.steps]
+            if missing:
+                raise ValueError(f"Step {step.name} depends on unknown steps {missing}")
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        state: Dict[str, int] = {}
+
+        def visit(name: str) -> None:
+            if state.get(name) == 1:
+                raise ValueError(f"Dependency cycle through step {name}")
+            if state.get(name) == 2:
+                return
+            state[name] = 1
+            for dep in self.steps[name].after:
+                visit(dep)
+            state[name] = 2
+
+        for name in self.steps:
+            visit(name)
+
+    async def execute(self, inputs: Dict[str, Any], timeout: float) -> Outcome:
+        """
+        Run the graph.
+
+        Raises:
+            StepFailed: After cancelling the rest and compensating completed steps
+        """
+        ctx = Context(inputs, time.monotonic() + timeout)
+        outcome = Outcome(ctx.results)
+        completed: List[str] = []
+        running: Dict[asyncio.Task, str] = {}
+        started: Dict[str, float] = {}
+        waiting = dict(self.steps)
+
+        def launch_ready() -> None:
+            for name, step in list(waiting.items()):
+                if all(dep in ctx.results for dep in step.after):
+                    del waiting[name]
+                    started[name] = time.monotonic()
+                    running[asyncio.create_task(step.run(ctx), name=f"payment-step:{name}")] = name
+
+        failure: Optional[StepFailed] = None
+        unfinished: List[str] = []
+        launch_ready()
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, timeout=ctx.remaining(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    failure = StepFailed(",".join(sorted(running.values())), TimeoutError("payment deadline exceeded"))
+                    break
+                for task in done:
+                    name = running.pop(task)
+                    outcome.timings_ms[name] = round((time.monotonic() - started[name]) * 1000, 3)
+                    exc = task.exception()
+                    if exc is not None:
+                        failure = failure or StepFailed(name, exc)
+                        unfinished.append(name)
+                        continue
+                    ctx.results[name] = task.result()
+                    completed.append(name)
+                if failure is not None:
+                    break
+                launch_ready()
+        except asyncio.CancelledError:
+            await self._unwind(ctx, outcome, running, completed, unfinished)
+            raise
+
+        if failure is None:
+            return outcome
+        await self._unwind(ctx, outcome, running, completed, unfinished)
+        failure.outcome = outcome
+        raise failure
+
+    async def _unwind(self, ctx: Context, outcome: Outcome, running: Dict[asyncio.Task, str],
+                      completed: List[str], unfinished: List[str]) -> None:
+        """Stop the running steps, then abort the unfinished ones and compensate the completed ones."""
+        for task, name in running.items():
+            if not self.steps[name].shield:
+                task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        for task, name in running.items():
+            if task.cancelled() or task.exception() is not None:
+                unfinished.append(name)
+            else:
+                ctx.results[name] = task.result()
+                completed.append(name)
+
+        for name in unfinished:
+            step = self.steps[name]
+            if step.abort is None:
+                continue
+            try:
+                await step.abort(ctx)
+                outcome.compensated.append(name)
+            except Exception as exc:
+                logger.error("Abort of step %s failed: %s", name, exc)
+        for name in reversed(completed):
+            step = self.steps[name]
+            if step.compensate is None:
+                continue
+            try:
+                await step.compensate(ctx, ctx.results[name])
+                outcome.compensated.append(name)
+            except Exception as exc:
+                # Left for reconciliation; the original failure is what the caller sees
+                logger.error("Compensation of step %s failed: %s", name, exc)
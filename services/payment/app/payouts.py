@@ -0,0 +1,146 @@
+"""
+Streaming parsers for bulk payout files.
+
+Both formats are read one record at a time, so memory stays flat however
+large the file is:
+
+* CSV - ``csv.DictReader`` over the open file (header row required);
+* ISO 20022 pain.001 - ``ElementTree.iterparse``; each ``CdtTrfTxInf`` is
+  turned into a row and then detached from the tree, so only the current
+  transaction is ever held.
+
+Rows are numbered from 1 in file order; resuming from a checkpoint skips the
+rows already handled.
+"""
+from __future__ import annotations
+
+import csv
+import re
+import xml.etree.ElementTree as ET
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+FORMATS = ("csv", "pain.001")
+
+# Minor-unit exponents that differ from the usual 2
+_EXPONENTS = {
+    "BHD": 3, "CLP": 0, "ISK": 0, "JOD": 3, "JPY": 0, "KRW": 0, "KWD": 3,
+    "OMR": 3, "TND": 3, "UGX": 0, "VND": 0, "XAF": 0, "XOF": 0,
+}
+_CURRENCY = re.compile(r"^[A-Z]{3}$")
+_IBAN = re.compile(r"^[A-Z]{2}[0-9]{2}[A-Z0-9]{11,30}$")
+
+CSV_COLUMNS = ("end_to_end_id", "creditor_name", "creditor_iban", "amount", "currency", "remittance")
+
+# Widths of the text columns of ``payout_items`` (pain.001 limits)
+TEXT_LIMITS = {"end_to_end_id": 35, "creditor_name": 140, "creditor_iban": 34, "debtor_iban": 34, "remittance": 140}
+
+
+def iter_csv(path: str, skip: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        for row_no, row in enumerate(islice(reader, skip, None), start=skip + 1):
+            yield row_no, {col: (row.get(col) or "").strip() for col in CSV_COLUMNS}
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _text(elem: ET.Element, *path: str) -> str:
+    """Text of the first descendant matching ``path`` by local names (namespace-agnostic)."""
+    node: Optional[ET.Element] = elem
+    for name in path:
+        node = next((child for child in node if _local(child.tag) == name), None)
+        if node is None:
+            return ""
+    return (node.text or "").strip()
+
+
+def iter_pain001(path: str, skip: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    row_no = 0
+    debtor_iban = ""
+    stack: List[ET.Element] = []
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        name = _local(elem.tag)
+        if name == "DbtrAcct":
+            debtor_iban = _text(elem, "Id", "IBAN")
+        elif name == "CdtTrfTxInf":
+            row_no += 1
+            if row_no > skip:
+                amount = next((n for n in elem.iter() if _local(n.tag) == "InstdAmt"), None)
+                yield row_no, {
+                    "end_to_end_id": _text(elem, "PmtId", "EndToEndId"),
+                    "creditor_name": _text(elem, "Cdtr", "Nm"),
+                    "creditor_iban": _text(elem, "CdtrAcct", "Id", "IBAN"),
+                    "amount": (amount.text or "").strip() if amount is not None else "",
+                    "currency": amount.get("Ccy", "") if amount is not None else "",
+                    "remittance": _text(elem, "RmtInf", "Ustrd"),
+                    "debtor_iban": debtor_iban,
+                }
+        if name in ("CdtTrfTxInf", "PmtInf", "GrpHdr") and stack:
+            # Detach finished subtrees so the tree never grows with the file
+            stack[-1].remove(elem)
+
+
+def iter_rows(fmt: str, path: str, skip: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    if fmt == "csv":
+        return iter_csv(path, skip)
+    if fmt == "pain.001":
+        return iter_pain001(path, skip)
+    raise ValueError(f"Unsupported payout file format: {fmt}")
+
+
+def _storable(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A row that fits ``payout_items`` whatever it holds: typed fields unset, text cut to column width."""
+    stored = {**row, "amount": None, "currency": None}
+    for field, limit in TEXT_LIMITS.items():
+        if stored.get(field) is not None:
+            stored[field] = str(stored[field])[:limit]
+    return stored
+
+
+def validate(row: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Normalize one row; returns ``(row, error)`` with ``error`` set if it is invalid.
+
+    An invalid row is still returned in storable form (so it can be listed
+    with its error): ``amount``/``currency`` are ``None`` unless they parsed
+    and text fields are truncated to their column width.
+    """
+    stored = _storable(row)
+    currency = row.get("currency", "").upper()
+    if not _CURRENCY.match(currency):
+        return stored, "invalid currency"
+    stored["currency"] = currency
+    try:
+        amount = Decimal(row.get("amount", ""))
+    except InvalidOperation:
+        return stored, "invalid amount"
+    if not amount.is_finite():
+        return stored, "invalid amount"
+    minor = amount.scaleb(_EXPONENTS.get(currency, 2))
+    if minor <= 0 or minor != minor.to_integral_value():
+        return stored, "amount must be positive with at most the currency's minor-unit precision"
+    iban = row.get("creditor_iban", "").replace(" ", "").upper()
+    if not _IBAN.match(iban):
+        return stored, "invalid creditor IBAN"
+    if not row.get("creditor_name"):
+        return stored, "missing creditor name"
+    for field in ("end_to_end_id", "creditor_name", "remittance"):
+        if len(row.get(field) or "") > TEXT_LIMITS[field]:
+            return stored, f"{field} longer than {TEXT_LIMITS[field]} characters"
+    return {**stored, "amount": int(minor), "creditor_iban": iban}, None
+
+
+def chunks(rows: Iterator[Tuple[int, Dict[str, Any]]], size: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,93 @@
+"""
+The payment submission graph.
+
+    profile ──┐
+              ├─> screen ─> record
+    fx ───────┘
+
+``profile`` and ``fx`` run concurrently. No funds move here: neither the
+wallet nor the ledger service has hold or posting endpoints yet.
+
+``record`` is shielded from the deadline: the insert runs in a thread that
+cannot be interrupted, so it is waited for and then compensated instead of
+being abandoned half-done. If it ends without a result, its ``abort`` marks
+the payment failed by id.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List
+
+import store
+from clients import Downstream
+from orchestrator import Context, Orchestrator, Step
+
+
+class PaymentRejected(Exception):
+    """Business refusal (unknown payer, blocked by rules); maps to 422."""
+
+    def __init__(self, reason: str, matched_rules: List[str] = ()) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.matched_rules = list(matched_rules)
+
+
+def build(downstream: Downstream) -> Orchestrator:
+    async def profile(ctx: Context) -> Dict[str, Any]:
+        payer = await asyncio.wait_for(downstream.profile(ctx.inputs["payer_id"]), ctx.remaining())
+        if payer is None:
+            raise PaymentRejected("Unknown payer")
+        return payer
+
+    async def fx(ctx: Context) -> Dict[str, Any]:
+        amount, currency = ctx.inputs["amount"], ctx.inputs["currency"]
+        target = ctx.inputs.get("settlement_currency") or currency
+        if target == currency:
+            return {"amount": amount, "currency": currency, "rates": {}}
+        return await downstream.quote(amount, currency, target, ctx.remaining())
+
+    async def screen(ctx: Context) -> Dict[str, Any]:
+        payer, settlement = ctx.results["profile"], ctx.results["fx"]
+        txn = {
+            "payer_id": ctx.inputs["payer_id"],
+            "account_id": ctx.inputs["payer_id"],  # velocity counters key on the paying account
+            "payee_id": ctx.inputs["payee_id"],
+            "amount": ctx.inputs["amount"],
+            "currency": ctx.inputs["currency"],
+            "settlement_amount": settlement["amount"],
+            "settlement_currency": settlement["currency"],
+            "country": payer.get("country"),
+            "kyc_status": payer.get("kyc_status"),
+            "kyc_level": payer.get("kyc_level"),
+            "risk_rating": payer.get("risk_rating"),
+        }
+        decision = await downstream.screen(txn, ctx.remaining())
+        if decision.get("action") == "block":
+            raise PaymentRejected("Blocked by risk rules", decision.get("matched_rules", []))
+        return decision
+
+    async def record(ctx: Context) -> Dict[str, Any]:
+        fields = {k: ctx.inputs[k] for k in ("payer_id", "payee_id", "amount", "currency", "reference")}
+        settlement = ctx.results["fx"]
+        status = "review" if ctx.results["screen"].get("action") == "review" else "accepted"
+        return await asyncio.to_thread(
+            store.create_payment, fields, ctx.inputs.get("created_by"),
+            payment_id=ctx.inputs["payment_id"], status=status,
+            settlement_amount=settlement["amount"], settlement_currency=settlement["currency"],
+            risk_action=ctx.results["screen"].get("action"),
+        )
+
+    async def unrecord(ctx: Context, result: Dict[str, Any]) -> None:
+        await asyncio.to_thread(store.set_payment_status, result["id"], "failed")
+
+    async def unrecord_unconfirmed(ctx: Context) -> None:
+        # A commit whose acknowledgement was lost still left the row (no-op otherwise)
+        await asyncio.to_thread(store.set_payment_status, ctx.inputs["payment_id"], "failed")
+
+    steps = [
+        Step("profile", profile),
+        Step("fx", fx),
+        Step("screen", screen, after=("profile", "fx")),
+        Step("record", record, after=("screen",), compensate=unrecord, abort=unrecord_unconfirmed, shield=True),
+    ]
+    return Orchestrator(steps)
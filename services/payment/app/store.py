@@ -0,0 +1,364 @@
+"""
+Payment persistence in CockroachDB.
+"""
+from __future__ import annotations
+
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String, Table, Text, delete, func, select, update
+from sqlalchemy.sql import Select
+from sqlalchemy.dialects.postgresql import insert
+
+from services.common.db import connection, get_engine, metadata, transaction
+from services.common.outbox import add_event, outbox_events
+
+PAYMENT_EVENTS_TOPIC = "payments.events"
+
+payments = Table(
+    "payments",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("payer_id", String(64), nullable=False, index=True),
+    Column("payee_id", String(64), nullable=False),
+    Column("amount", BigInteger, nullable=False),  # minor units
+    Column("currency", String(3), nullable=False),
+    Column("reference", String(140)),
+    Column("settlement_amount", BigInteger),
+    Column("settlement_currency", String(3)),
+    Column("risk_action", String(16)),
+    Column("status", String(32), nullable=False),
+    Column("created_by", String(128)),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+)
+
+# Export order; created separately so existing tables get it too
+payments_created_idx = Index("payments_created_idx", payments.c.created_at, payments.c.id)
+
+idempotency_keys = Table(
+    "payment_idempotency_keys",
+    metadata,
+    Column("key", String(320), primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("status_code", Integer, nullable=False),
+    Column("response", Text, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False, index=True),
+)
+
+
+payout_files = Table(
+    "payout_files",
+    metadata,
+    Column("id", String(36), primary_key=True),
+    Column("owner", String(128), nullable=False),
+    Column("format", String(16), nullable=False),
+    Column("path", String(512), nullable=False),
+    Column("size_bytes", BigInteger, nullable=False),
+    Column("status", String(16), nullable=False),  # parsing, loading, complete, failed
+    Column("checkpoint_row", BigInteger, nullable=False, default=0),
+    Column("chunks_dispatched", Integer, nullable=False, default=0),
+    Column("error", Text),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+)
+
+# One row per loaded chunk; progress counters are sums over it, so a chunk
+# loaded twice (redelivery, resume) is never double counted
+payout_chunks = Table(
+    "payout_chunks",
+    metadata,
+    Column("file_id", String(36), primary_key=True),
+    Column("chunk_no", Integer, primary_key=True),
+    Column("valid_rows", Integer, nullable=False),
+    Column("invalid_rows", Integer, nullable=False),
+    Column("loaded_at", DateTime(timezone=True), nullable=False),
+)
+
+payout_items = Table(
+    "payout_items",
+    metadata,
+    Column("file_id", String(36), primary_key=True),
+    Column("row_no", BigInteger, primary_key=True),
+    Column("end_to_end_id", String(35)),
+    Column("creditor_name", String(140)),
+    Column("creditor_iban", String(34)),
+    Column("debtor_iban", String(34)),
+    Column("amount", BigInteger),
+    Column("currency", String(3)),
+    Column("remittance", String(140)),
+    Column("status", String(16), nullable=False),  # pending, invalid
+    Column("error", String(256)),
+)
+
+_ITEM_FIELDS = ("end_to_end_id", "creditor_name", "creditor_iban", "debtor_iban", "amount", "currency", "remittance")
+
+
+def create_schema() -> None:
+    metadata.create_all(
+        get_engine(),
+        tables=[payments, idempotency_keys, outbox_events, payout_files, payout_chunks, payout_items],
+    )
+    payments_created_idx.create(get_engine(), checkfirst=True)
+
+
+def _as_dict(row: Any) -> Dict[str, Any]:
+    data = dict(row._mapping)
+    if isinstance(data.get("created_at"), datetime):
+        data["created_at"] = data["created_at"].isoformat()
+    return data
+
+
+def create_payment(
+    fields: Dict[str, Any],
+    created_by: Optional[str],
+    payment_id: Optional[str] = None,
+    status: str = "accepted",
+    **extra: Any,
+) -> Dict[str, Any]:
+    """
+    Insert a payment and its ``payment.created`` event.
+
+    Idempotent on ``payment_id``: if the row already exists it is returned
+    unchanged and no second event is recorded.
+    """
+    values = {
+        **fields,
+        **extra,
+        "id": payment_id or str(uuid.uuid4()),
+        "status": status,
+        "created_by": created_by,
+        "created_at": datetime.now(timezone.utc),
+    }
+    with transaction() as conn:
+        row = conn.execute(
+            insert(payments).values(**values).on_conflict_do_nothing(index_elements=["id"]).returning(*payments.c)
+        ).first()
+        if row is None:
+            return _as_dict(conn.execute(select(*payments.c).where(payments.c.id == values["id"])).one())
+        payment = _as_dict(row)
+        add_event(conn, PAYMENT_EVENTS_TOPIC, "payment.created", payment, key=payment["payer_id"])
+    return payment
+
+
+def set_payment_status(payment_id: str, status: str) -> None:
+    with transaction() as conn:
+        row = conn.execute(
+            update(payments).where(payments.c.id == payment_id).values(status=status).returning(payments.c.payer_id)
+        ).first()
+        if row is not None:
+            add_event(conn, PAYMENT_EVENTS_TOPIC, f"payment.{status}", {"id": payment_id, "status": status},
+                      key=row.payer_id)
+
+
+def payments_query(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    status: Optional[str] = None,
+) -> Select:
+    """Payments created in ``[since, until)``, oldest first (``payments_created_idx`` order)."""
+    stmt = select(*payments.c)
+    if since is not None:
+        stmt = stmt.where(payments.c.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(payments.c.created_at < until)
+    if status is not None:
+        stmt = stmt.where(payments.c.status == status)
+    return stmt.order_by(payments.c.created_at, payments.c.id)
+
+
+def record_idempotency(records: Iterable[Tuple[str, str, int, Any]]) -> None:
+    """
+    Persist completed idempotency keys; a key already stored is left as is.
+
+    ``created_at`` is the database clock, so the sync watermark of every
+    instance compares timestamps from one clock.
+    """
+    rows = [
+        {"key": key, "fingerprint": fp, "status_code": code, "response": json.dumps(body), "created_at": func.now()}
+        for key, fp, code, body in records
+    ]
+    if not rows:
+        return
+    with transaction() as conn:
+        conn.execute(insert(idempotency_keys).values(rows).on_conflict_do_nothing(index_elements=["key"]))
+
+
+def fetch_idempotency(key: str) -> Optional[Tuple[str, int, Any]]:
+    """``(fingerprint, status_code, response)`` of a completed key, if stored."""
+    with connection() as conn:
+        row = conn.execute(
+            select(idempotency_keys.c.fingerprint, idempotency_keys.c.status_code, idempotency_keys.c.response)
+            .where(idempotency_keys.c.key == key)
+        ).first()
+    if row is None:
+        return None
+    return row.fingerprint, row.status_code, json.loads(row.response)
+
+
+def idempotency_keys_since(since: datetime, overlap: timedelta = timedelta(0)) -> Tuple[List[str], datetime]:
+    """
+    Keys recorded after ``since - overlap`` and the newest timestamp seen (the next watermark).
+
+    ``created_at`` is taken when a batch's transaction starts, so a batch can
+    commit after a newer one was already read; re-reading ``overlap`` behind
+    the watermark picks it up (keys seen twice are simply added again).
+    """
+    stmt = select(idempotency_keys.c.key, idempotency_keys.c.created_at).where(
+        idempotency_keys.c.created_at > since - overlap
+    )
+    keys: List[str] = []
+    newest = since
+    with connection() as conn:
+        for key, created_at in conn.execute(stmt.execution_options(yield_per=10000)):
+            keys.append(key)
+            if created_at > newest:
+                newest = created_at
+    return keys, newest
+
+
+def purge_idempotency(older_than: datetime, batch_size: int = 10000) -> int:
+    """Delete keys recorded before ``older_than``, ``batch_size`` rows per transaction."""
+    purged = 0
+    while True:
+        expired = (
+            select(idempotency_keys.c.key).where(idempotency_keys.c.created_at < older_than).limit(batch_size)
+        )
+        with transaction() as conn:
+            deleted = conn.execute(delete(idempotency_keys).where(idempotency_keys.c.key.in_(expired))).rowcount
+        purged += deleted
+        if deleted < batch_size:
+            return purged
+
+
+def create_payout_file(file_id: str, owner: str, fmt: str, path: str, size_bytes: int) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    values = dict(id=file_id, owner=owner, format=fmt, path=path, size_bytes=size_bytes, status="parsing",
+                  checkpoint_row=0, chunks_dispatched=0, created_at=now, updated_at=now)
+    with transaction() as conn:
+        conn.execute(insert(payout_files).values(**values))
+    return _as_dict_payout(values)
+
+
+def _as_dict_payout(data: Dict[str, Any]) -> Dict[str, Any]:
+    data = dict(data)
+    data.pop("path", None)
+    for key in ("created_at", "updated_at"):
+        if isinstance(data.get(key), datetime):
+            data[key] = data[key].isoformat()
+    return data
+
+
+def fetch_payout_file(file_id: str, with_path: bool = False) -> Optional[Dict[str, Any]]:
+    """File row plus progress summed over its loaded chunks."""
+    with connection() as conn:
+        row = conn.execute(select(payout_files).where(payout_files.c.id == file_id)).first()
+        if row is None:
+            return None
+        totals = conn.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(payout_chunks.c.valid_rows), 0),
+                func.coalesce(func.sum(payout_chunks.c.invalid_rows), 0),
+            ).where(payout_chunks.c.file_id == file_id)
+        ).one()
+    data = dict(row._mapping)
+    path = data["path"]
+    data = _as_dict_payout(data)
+    data.update(chunks_loaded=totals[0], valid_rows=int(totals[1]), invalid_rows=int(totals[2]))
+    if with_path:
+        data["path"] = path
+    return data
+
+
+def checkpoint_payout_file(file_id: str, checkpoint_row: int, chunks_dispatched: int,
+                           status: Optional[str] = None, error: Optional[str] = None) -> None:
+    values: Dict[str, Any] = {
+        "checkpoint_row": checkpoint_row,
+        "chunks_dispatched": chunks_dispatched,
+        "updated_at": datetime.now(timezone.utc),
+    }
+    if status is not None:
+        values["status"] = status
+    if error is not None:
+        values["error"] = error
+    with transaction() as conn:
+        conn.execute(update(payout_files).where(payout_files.c.id == file_id).values(**values))
+
+
+def set_payout_status(file_id: str, status: str, error: Optional[str] = None) -> None:
+    with transaction() as conn:
+        conn.execute(
+            update(payout_files).where(payout_files.c.id == file_id)
+            .values(status=status, error=error, updated_at=datetime.now(timezone.utc))
+        )
+
+
+def load_payout_chunk(file_id: str, chunk_no: int, rows: List[Dict[str, Any]]) -> bool:
+    """
+    Bulk insert one validated chunk and record it; a chunk already loaded is skipped.
+
+    Returns:
+        True when this call completed the file (every dispatched chunk loaded)
+    """
+    items = [
+        {
+            "file_id": file_id,
+            "row_no": row["row_no"],
+            **{k: row.get(k) for k in _ITEM_FIELDS},
+            "status": "invalid" if row.get("error") else "pending",
+            "error": row.get("error"),
+        }
+        for row in rows
+    ]
+    invalid = sum(1 for item in items if item["error"])
+    now = datetime.now(timezone.utc)
+    with transaction() as conn:
+        inserted = conn.execute(
+            insert(payout_chunks)
+            .values(file_id=file_id, chunk_no=chunk_no, valid_rows=len(items) - invalid,
+                    invalid_rows=invalid, loaded_at=now)
+            .on_conflict_do_nothing(index_elements=["file_id", "chunk_no"])
+        ).rowcount
+        if not inserted:
+            return False
+        if items:
+            conn.execute(insert(payout_items).values(items).on_conflict_do_nothing(index_elements=["file_id", "row_no"]))
+        loaded = conn.execute(select(func.count()).where(payout_chunks.c.file_id == file_id)).scalar_one()
+        done = conn.execute(
+            update(payout_files)
+            .where(payout_files.c.id == file_id)
+            .where(payout_files.c.status == "loading")
+            .where(payout_files.c.chunks_dispatched == loaded)
+            .values(status="complete", updated_at=now)
+        ).rowcount
+    return bool(done)
+
+
+def finish_payout_parsing(file_id: str, checkpoint_row: int, chunks_dispatched: int) -> None:
+    """All chunks dispatched; complete now if they are already all loaded."""
+    now = datetime.now(timezone.utc)
+    with transaction() as conn:
+        loaded = conn.execute(select(func.count()).where(payout_chunks.c.file_id == file_id)).scalar_one()
+        conn.execute(
+            update(payout_files).where(payout_files.c.id == file_id).values(
+                checkpoint_row=checkpoint_row,
+                chunks_dispatched=chunks_dispatched,
+                status="complete" if loaded == chunks_dispatched else "loading",
+                updated_at=now,
+            )
+        )
+
+
+def fetch_payout_errors(file_id: str, limit: int, after_row: int = 0) -> List[Dict[str, Any]]:
+    with connection() as conn:
+        rows = conn.execute(
+            select(payout_items.c.row_no, payout_items.c.end_to_end_id, payout_items.c.error)
+            .where(payout_items.c.file_id == file_id)
+            .where(payout_items.c.status == "invalid")
+            .where(payout_items.c.row_no > after_row)
+            .order_by(payout_items.c.row_no)
+            .limit(limit)
+        ).all()
+    return [dict(row._mapping) for row in rows]
@@ -1,12 +1,22 @@
+import csv
+import logging
+import os
 import time
+import xml.etree.ElementTree as ET
 
+import payouts
+import store
 from celery_app import celery_app
 
+logger = logging.getLogger(__name__)
+
+PAYOUT_CHUNK_SIZE = int(os.getenv("PAYOUT_CHUNK_SIZE", "1000"))
+
 
 @celery_app.task(name="tasks.echo")
 def echo(msg):
     """Echo a message back."""
-    print(f"[PAYMENT WORKER] Echo: {msg}")
+    logger.info("Echo: %s", msg)
     return msg
 
 
@@ -21,3 +31,62 @@ def slow(seconds):
     """Sleep for the provided duration and return it."""
     time.sleep(seconds)
     return seconds
+
+
+@celery_app.task(name="payment.ingest_payout_file", budget=600)
+def ingest_payout_file(file_id):
+    """
+    Stream a payout file from its checkpoint, validating and dispatching one
+    chunk at a time to ``payment.load_payout_chunk``.
+
+    The checkpoint moves after every dispatched chunk, so a redelivered task
+    (acks are late) or ``POST /payouts/files/{id}/resume`` continues where the
+    previous run stopped; a chunk dispatched twice is loaded once.
+    """
+    payout = store.fetch_payout_file(file_id, with_path=True)
+    if payout is None or payout["status"] != "parsing":
+        return {"file_id": file_id, "status": payout and payout["status"]}
+
+    row_no = payout["checkpoint_row"]
+    chunk_no = payout["chunks_dispatched"]
+    try:
+        for chunk in payouts.chunks(payouts.iter_rows(payout["format"], payout["path"], skip=row_no), PAYOUT_CHUNK_SIZE):
+            rows = []
+            for number, raw in chunk:
+                row, error = payouts.validate(raw)
+                rows.append({**row, "row_no": number, "error": error})
+            load_payout_chunk.delay(file_id, chunk_no, rows)
+            chunk_no += 1
+            row_no = chunk[-1][0]
+            store.checkpoint_payout_file(file_id, row_no, chunk_no)
+    except (ET.ParseError, csv.Error, UnicodeDecodeError, OSError) as exc:
+        logger.warning("Payout file %s unreadable after row %s: %s", file_id, row_no, exc)
+        store.checkpoint_payout_file(file_id, row_no, chunk_no, status="failed", error=f"after row {row_no}: {exc}")
+        return {"file_id": file_id, "status": "failed"}
+
+    store.finish_payout_parsing(file_id, row_no, chunk_no)
+    return {"file_id": file_id, "rows": row_no, "chunks": chunk_no}
+
+
+@celery_app.task(
+    name="payment.load_payout_chunk",
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=8,
+)
+def load_payout_chunk(self, file_id, chunk_no, rows):
+    """
+    Bulk insert one validated chunk (retried on transaction conflicts).
+
+    When the last retry fails too, the file is marked ``failed`` rather than
+    left in ``loading`` forever.
+    """
+    try:
+        completed = store.load_payout_chunk(file_id, chunk_no, rows)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            logger.error("Payout file %s chunk %s not loaded: %s", file_id, chunk_no, exc)
+            store.set_payout_status(file_id, "failed", f"chunk {chunk_no}: {exc}"[:256])
+        raise
+    return {"file_id": file_id, "chunk_no": chunk_no, "completed_file": completed}
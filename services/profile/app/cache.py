@@ -0,0 +1,294 @@
+"""
+Two-tier read-through cache for profiles.
+
+    in-process LRU (TTL)  ->  Redis (TTL)  ->  CockroachDB
+
+Writers replace the Redis entry with a short-lived tombstone after commit
+and publish an invalidation event; every instance consumes those events and
+evicts its local copy (see ``events.py``). TTLs bound staleness if an event
+is ever missed. Concurrent misses for the same id share one fetch
+(single-flight), so a cold key hit by a burst of payments costs one Redis
+read and at most one DB query.
+
+A load that read the old row before a write must not put it back after the
+invalidation: Redis fills are ``SET NX``, so they cannot replace a tombstone,
+and local fills are dropped when the id was evicted after the load started or
+the loaded version is older than the one the invalidation announced.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar
+
+import store
+
+logger = logging.getLogger(__name__)
+
+PROFILE_LOCAL_TTL = float(os.getenv("PROFILE_LOCAL_TTL", "30"))
+PROFILE_LOCAL_SIZE = int(os.getenv("PROFILE_LOCAL_SIZE", "100000"))
+PROFILE_NEGATIVE_TTL = float(os.getenv("PROFILE_NEGATIVE_TTL", "5"))
+PROFILE_REDIS_TTL = int(os.getenv("PROFILE_REDIS_TTL", "300"))
+# How long a write blocks Redis fills for the id; must outlast a slow DB read
+PROFILE_TOMBSTONE_TTL = int(os.getenv("PROFILE_TOMBSTONE_TTL", "10"))
+_KEY_PREFIX = "profile:v1"
+
+T = TypeVar("T")
+
+# Marks a cached "not found" so unknown ids do not hammer the database
+_ABSENT: Dict[str, Any] = {}
+
+
+class LocalTTLCache:
+    """Bounded LRU with per-entry expiry; safe to share across threads."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Like ``get`` but without touching LRU order or counters."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def evict(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight(Generic[T]):
+    """
+    Collapse concurrent calls for the same key into one in-flight task.
+
+    The fetch runs detached from its callers, so a cancelled caller (client
+    disconnect, deadline) neither cancels the fetch nor fails the others.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Task[T]"] = {}
+        self._running: Set["asyncio.Task[T]"] = set()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._running.add(task)
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: "asyncio.Task[T]") -> None:
+        self._running.discard(task)
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller went away
+
+    def forget(self, key: Hashable) -> None:
+        """Let the next caller start a fresh fetch (used on invalidation)."""
+        self._inflight.pop(key, None)
+
+
+class ProfileCache:
+    """Read-through profile cache: local LRU, then Redis, then CockroachDB."""
+
+    def __init__(self, redis_client: Any = None) -> None:
+        self.local = LocalTTLCache(PROFILE_LOCAL_SIZE, PROFILE_LOCAL_TTL)
+        self._redis = redis_client
+        self._flight: SingleFlight[Optional[Dict[str, Any]]] = SingleFlight()
+        # profile id -> (eviction sequence, announced version) of recent invalidations
+        self._evicted = LocalTTLCache(PROFILE_LOCAL_SIZE, PROFILE_TOMBSTONE_TTL + PROFILE_LOCAL_TTL)
+        self._evictions = 0
+        self.db_reads = 0
+
+    def use_redis(self, redis_client: Any) -> None:
+        self._redis = redis_client
+
+    @staticmethod
+    def _key(profile_id: str) -> str:
+        return f"{_KEY_PREFIX}:{profile_id}"
+
+    @staticmethod
+    def _decode(raw: Optional[str]) -> Optional[Dict[str, Any]]:
+        """A Redis value as a profile; ``None`` for a miss or a tombstone."""
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        return None if "tombstone" in value else value
+
+    def _fresh(self, profile_id: str, started: int, profile: Optional[Dict[str, Any]]) -> bool:
+        """Whether a load that began at eviction sequence ``started`` may still fill the local tier."""
+        mark = self._evicted.peek(profile_id)
+        if mark is None:
+            return True
+        sequence, version = mark
+        if sequence > started:
+            return False
+        return version is None or (profile is not None and profile.get("version", 0) >= version)
+
+    def _fill_local(self, profile_id: str, started: int, profile: Optional[Dict[str, Any]]) -> None:
+        if not self._fresh(profile_id, started, profile):
+            return
+        if profile is None:
+            self.local.set(profile_id, _ABSENT, ttl=PROFILE_NEGATIVE_TTL)
+        else:
+            self.local.set(profile_id, profile)
+
+    async def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        cached = self.local.get(profile_id)
+        if cached is not None:
+            return cached if cached is not _ABSENT else None
+        return await self._flight.do(profile_id, lambda: self._load(profile_id))
+
+    def peek_version(self, profile_id: str) -> Optional[int]:
+        """Version of the locally cached profile, or ``None`` if this instance holds none."""
+        cached = self.local.peek(profile_id)
+        if not cached:
+            return None
+        return cached.get("version")
+
+    async def _load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        started = self._evictions
+        if self._redis is not None:
+            try:
+                profile = self._decode(await self._redis.get(self._key(profile_id)))
+            except Exception as exc:
+                logger.warning("Redis read failed for profile %s: %s", profile_id, exc)
+                profile = None
+            if profile is not None:
+                self._fill_local(profile_id, started, profile)
+                return profile
+
+        self.db_reads += 1
+        profile = await asyncio.to_thread(store.fetch_profile, profile_id)
+        self._fill_local(profile_id, started, profile)
+        if profile is not None and self._redis is not None:
+            try:
+                await self._redis.set(self._key(profile_id), json.dumps(profile), ex=PROFILE_REDIS_TTL, nx=True)
+            except Exception as exc:
+                logger.warning("Redis fill failed for profile %s: %s", profile_id, exc)
+        return profile
+
+    async def get_many(self, profile_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Profiles for ``profile_ids``; unknown ids are absent from the result.
+
+        Local hits are answered in place, the rest cost one Redis ``MGET`` and
+        at most one ``IN (...)`` query, whatever the number of ids.
+        """
+        started = self._evictions
+        found: Dict[str, Dict[str, Any]] = {}
+        misses: List[str] = []
+        for profile_id in dict.fromkeys(profile_ids):
+            cached = self.local.get(profile_id)
+            if cached is None:
+                misses.append(profile_id)
+            elif cached is not _ABSENT:
+                found[profile_id] = cached
+        if not misses:
+            return found
+
+        if self._redis is not None:
+            try:
+                raws = await self._redis.mget([self._key(pid) for pid in misses])
+            except Exception as exc:
+                logger.warning("Redis bulk read failed for %d profiles: %s", len(misses), exc)
+                raws = [None] * len(misses)
+            remaining = []
+            for profile_id, raw in zip(misses, raws):
+                profile = self._decode(raw)
+                if profile is None:
+                    remaining.append(profile_id)
+                    continue
+                found[profile_id] = profile
+                self._fill_local(profile_id, started, profile)
+            misses = remaining
+        if not misses:
+            return found
+
+        self.db_reads += 1
+        loaded = await asyncio.to_thread(store.fetch_profiles, misses)
+        for profile_id in misses:
+            profile = loaded.get(profile_id)
+            if profile is not None:
+                found[profile_id] = profile
+            self._fill_local(profile_id, started, profile)
+        if loaded and self._redis is not None:
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                for profile_id, profile in loaded.items():
+                    pipe.set(self._key(profile_id), json.dumps(profile), ex=PROFILE_REDIS_TTL, nx=True)
+                await pipe.execute()
+            except Exception as exc:
+                logger.warning("Redis bulk fill failed for %d profiles: %s", len(loaded), exc)
+        return found
+
+    async def invalidate(self, profile_id: str, version: Optional[int] = None) -> None:
+        """
+        Replace the shared entry with a tombstone (writer side) and drop the local one.
+
+        The tombstone keeps loads that read the previous row from filling
+        Redis for ``PROFILE_TOMBSTONE_TTL`` seconds.
+        """
+        self.evict_local(profile_id, version)
+        if self._redis is not None:
+            await self._redis.set(self._key(profile_id), json.dumps({"tombstone": version}), ex=PROFILE_TOMBSTONE_TTL)
+
+    def evict_local(self, profile_id: str, version: Optional[int] = None) -> None:
+        """
+        Drop only this instance's copy (invalidation consumer side).
+
+        Loads already in flight for the id finish for their callers but no
+        longer fill the local tier, nor does any later one returning a
+        version older than ``version``.
+        """
+        self._evictions += 1
+        previous = self._evicted.peek(profile_id)
+        if previous is not None and previous[1] is not None and (version is None or previous[1] > version):
+            version = previous[1]
+        self._evicted.set(profile_id, (self._evictions, version))
+        self.local.evict(profile_id)
+        self._flight.forget(profile_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "local_entries": len(self.local),
+            "local_hits": self.local.hits,
+            "local_misses": self.local.misses,
+            "db_reads": self.db_reads,
+        }
@@ -0,0 +1,70 @@
+"""
+Profile change events on Redpanda.
+
+Every write records a ``profile.v1.ProfileChanged`` (``{"id", "version"}``,
+JSON or binary per ``EVENT_ENCODING``) for ``PROFILE_EVENTS_TOPIC`` in the
+transactional outbox (see ``store.upsert_profile``) and the outbox relay
+publishes it. Each API instance runs its own consumer (no consumer group,
+starting at the log end) so every instance sees every event and evicts its
+in-process copy, remembering the event's version so a load still in flight
+cannot put an older row back. The shared Redis entry is not touched here:
+the writer already replaced it with a short-lived tombstone that keeps
+stale fills out (see ``cache.ProfileCache.invalidate``).
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, List, Optional
+
+from services.common.codec import UnknownSchema, decode_record
+from services.common.consumer import BatchConsumer
+
+from cache import ProfileCache
+
+logger = logging.getLogger(__name__)
+
+KAFKA_BROKERS = os.getenv("KAFKA_BROKERS", "")
+PROFILE_EVENTS_TOPIC = os.getenv("PROFILE_EVENTS_TOPIC", "profile.changed")
+
+
+class InvalidationBus:
+    """Applies profile change events to this instance's local cache."""
+
+    def __init__(self, cache: ProfileCache, brokers: str = KAFKA_BROKERS, topic: str = PROFILE_EVENTS_TOPIC) -> None:
+        self.cache = cache
+        self.brokers = brokers
+        self.topic = topic
+        self.consumer: Optional[BatchConsumer] = None
+
+    async def start(self, client: Any = None) -> None:
+        if not self.brokers and client is None:
+            logger.warning("KAFKA_BROKERS not set; profile invalidations stay local to this instance")
+            return
+        consumer = BatchConsumer(
+            [self.topic], self._evict, group_id=None, brokers=self.brokers, client=client,
+            auto_offset_reset="latest", on_error="skip",
+        )
+        try:
+            await consumer.start()
+        except Exception as exc:
+            logger.warning("Redpanda unavailable, profile invalidations stay local: %s", exc)
+            return
+        self.consumer = consumer
+
+    async def stop(self) -> None:
+        if self.consumer is not None:
+            await self.consumer.stop()
+            self.consumer = None
+
+    async def _evict(self, records: List[Any]) -> None:
+        for message in records:
+            try:
+                event = decode_record(message)
+                profile_id = event.get("id")
+                if not profile_id:
+                    raise KeyError("id")
+                version = event.get("version")
+                self.cache.evict_local(str(profile_id), int(version) if version is not None else None)
+            except (ValueError, KeyError, TypeError, UnknownSchema) as exc:
+                logger.warning("Ignoring malformed profile event at offset %s: %s", message.offset, exc)
@@ -1,14 +1,80 @@
 import os
+import asyncio
 import base64
 import json
-from fastapi import FastAPI, HTTPException, Request
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
 
-from services.common.auth import decode_token
+from fastapi import Depends, FastAPI, HTTPException, Request
+from pydantic import BaseModel, Field
+
+from services.common.auth import decode_token, require_authenticated, require_roles
+from services.common.httpcache import ResponseCacheMiddleware, cacheable
+from services.common.profiler import install as install_profiler
+from services.common.ratelimit import is_client_token
 from services.common.userinfo import extract_user_info
 
+import store
+from cache import ProfileCache
+from events import InvalidationBus
+
+logger = logging.getLogger(__name__)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
+REDIS_URL = os.getenv("REDIS_URL", "")
+PROFILE_BATCH_MAX = int(os.getenv("PROFILE_BATCH_MAX", "1000"))
+
+# KYC / risk fields are maintained by ops, not by the profile owner
+require_profile_admin = require_roles(["admin", "ops_user"])
+# Everyone else only reads their own profile
+PROFILE_READ_ALL_ROLES = {"admin", "ops_user", "service"}
+# Client-credentials callers (e.g. the payment service) that read any profile
+PROFILE_SERVICE_CLIENTS = frozenset(filter(None, os.getenv("PROFILE_SERVICE_CLIENTS", "").split(",")))
+
+cache = ProfileCache()
+bus = InvalidationBus(cache)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.to_thread(store.create_schema)
+    except Exception as exc:
+        logger.warning("Profile schema not ensured at startup: %s", exc)
+
+    redis_client = None
+    if REDIS_URL:
+        import redis.asyncio as redis
+
+        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        cache.use_redis(redis_client)
+    await bus.start()
+
+    yield
+
+    await bus.stop()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
+app = FastAPI(title=SERVICE_NAME, lifespan=lifespan)
+app.add_middleware(ResponseCacheMiddleware)
+install_profiler(app)
+
+
+class ProfileBatchRequest(BaseModel):
+    ids: List[str] = Field(..., max_length=PROFILE_BATCH_MAX)
+
 
-app = FastAPI(title=SERVICE_NAME)
+class ProfileUpdate(BaseModel):
+    user_sub: Optional[str] = None
+    full_name: Optional[str] = None
+    email: Optional[str] = None
+    country: Optional[str] = None
+    kyc_status: Optional[str] = None
+    kyc_level: Optional[int] = None
+    risk_rating: Optional[str] = None
 
 
 def decode_jwt_header(request: Request) -> dict:
@@ -36,6 +102,17 @@ def decode_jwt_header(request: Request) -> dict:
     return {}
 
 
+def reads_any_profile(user: Dict[str, Any]) -> bool:
+    if PROFILE_READ_ALL_ROLES.intersection(user.get("roles", [])):
+        return True
+    return is_client_token(user) and user.get("client_id") in PROFILE_SERVICE_CLIENTS
+
+
+def owns_profile(user: Dict[str, Any], profile_id: str, profile: Dict[str, Any]) -> bool:
+    sub = user.get("sub")
+    return bool(sub) and (profile_id == sub or profile.get("user_sub") == sub)
+
+
 @app.get("/health")
 def health(request: Request) -> dict:
     """Liveness probe with user info."""
@@ -70,3 +147,68 @@ def health(request: Request) -> dict:
 def readiness() -> dict[str, str]:
     """Readiness probe for upstream load balancers."""
     return {"status": "ready", "service": SERVICE_NAME}
+
+
+@app.get("/profiles/cache/stats")
+def cache_stats(user: Dict[str, Any] = Depends(require_profile_admin)) -> dict:
+    """Hit/miss counters of this instance's in-process tier and invalidation consumer lag."""
+    stats = cache.stats()
+    if bus.consumer is not None:
+        stats["invalidations"] = bus.consumer.metrics()
+    return stats
+
+
+@app.post("/profiles/batch")
+async def get_profiles(body: ProfileBatchRequest, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """
+    Bulk GetProfiles: many profiles in one call.
+
+    Served through the same cache tiers as single reads (one Redis ``MGET``
+    and at most one database query for the misses). Unknown ids are listed
+    under ``missing`` rather than failing the batch; so are profiles the
+    caller may not read.
+    """
+    found = await cache.get_many(body.ids)
+    if not reads_any_profile(user):
+        found = {pid: profile for pid, profile in found.items() if owns_profile(user, pid, profile)}
+    missing = [pid for pid in dict.fromkeys(body.ids) if pid not in found]
+    return {"profiles": found, "missing": missing}
+
+
+@app.get("/profiles/{profile_id}")
+@cacheable(ttl=5, version=lambda params: cache.peek_version(params["profile_id"]))
+async def get_profile(profile_id: str, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """
+    Profile / KYC record, served from the in-process cache, then Redis, then
+    CockroachDB. Concurrent misses for the same id share one lookup.
+
+    Tagged with an ETag from the profile version: a poll with a current
+    ``If-None-Match`` is a 304 straight from the local cache tier.
+    """
+    profile = await cache.get(profile_id)
+    # Other users' profiles are reported as missing, not forbidden
+    if profile is None or not (reads_any_profile(user) or owns_profile(user, profile_id, profile)):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@app.put("/profiles/{profile_id}")
+async def put_profile(
+    profile_id: str,
+    body: ProfileUpdate,
+    user: Dict[str, Any] = Depends(require_profile_admin),
+) -> dict:
+    """
+    Create or update a profile.
+
+    The change event is committed with the row (transactional outbox) and
+    relayed to every instance, which evicts its local copy; the shared Redis
+    entry is replaced with a tombstone here right after commit.
+    """
+    fields = body.model_dump(exclude_unset=True)
+    profile = await asyncio.to_thread(store.upsert_profile, profile_id, fields)
+    try:
+        await cache.invalidate(profile_id, profile.get("version"))
+    except Exception as exc:
+        logger.warning("Redis invalidation failed for profile %s: %s", profile_id, exc)
+    return profile
@@ -0,0 +1,81 @@
+"""
+Profile / KYC persistence in CockroachDB.
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import Column, DateTime, Integer, String, Table, select
+from sqlalchemy.dialects.postgresql import insert
+
+from services.common.db import connection, get_engine, metadata, transaction
+from services.common.codec import ProfileChanged
+from services.common.outbox import add_event, outbox_events
+
+PROFILE_EVENTS_TOPIC = os.getenv("PROFILE_EVENTS_TOPIC", "profile.changed")
+
+profiles = Table(
+    "profiles",
+    metadata,
+    Column("id", String(64), primary_key=True),
+    Column("user_sub", String(128), index=True),
+    Column("full_name", String(256)),
+    Column("email", String(256)),
+    Column("country", String(2)),
+    Column("kyc_status", String(32), nullable=False, default="pending"),
+    Column("kyc_level", Integer, nullable=False, default=0),
+    Column("risk_rating", String(16), nullable=False, default="unrated"),
+    Column("version", Integer, nullable=False, default=1),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+)
+
+# Fields a client may set; the rest are managed here
+WRITABLE_FIELDS = ("user_sub", "full_name", "email", "country", "kyc_status", "kyc_level", "risk_rating")
+
+
+def create_schema() -> None:
+    metadata.create_all(get_engine(), tables=[profiles, outbox_events])
+
+
+def _as_dict(row: Any) -> Dict[str, Any]:
+    data = dict(row._mapping)
+    for key in ("created_at", "updated_at"):
+        if isinstance(data.get(key), datetime):
+            data[key] = data[key].isoformat()
+    return data
+
+
+def fetch_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    with connection() as conn:
+        row = conn.execute(select(profiles).where(profiles.c.id == profile_id)).first()
+    return _as_dict(row) if row is not None else None
+
+
+def fetch_profiles(profile_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Profiles by id in one query; missing ids are simply absent."""
+    ids = list(dict.fromkeys(profile_ids))
+    if not ids:
+        return {}
+    with connection() as conn:
+        rows = conn.execute(select(profiles).where(profiles.c.id.in_(ids))).all()
+    return {row.id: _as_dict(row) for row in rows}
+
+
+def upsert_profile(profile_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Create or update a profile, bumping its version; the change event commits with it."""
+    now = datetime.now(timezone.utc)
+    values = {k: v for k, v in fields.items() if k in WRITABLE_FIELDS}
+    stmt = insert(profiles).values(id=profile_id, created_at=now, updated_at=now, version=1, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[profiles.c.id],
+        set_={**values, "updated_at": now, "version": profiles.c.version + 1},
+    ).returning(*profiles.c)
+    with transaction() as conn:
+        row = conn.execute(stmt).one()
+        add_event(conn, PROFILE_EVENTS_TOPIC, "profile.changed",
+                  ProfileChanged(id=row.id, version=row.version), key=row.id)
+    return _as_dict(row)
+
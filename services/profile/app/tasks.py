@@ -1,12 +1,15 @@
+import logging
 import time
 
 from celery_app import celery_app
 
+logger = logging.getLogger(__name__)
+
 
 @celery_app.task(name="tasks.echo")
 def echo(msg):
     """Echo a message back."""
-    print(f"[PROFILE WORKER] Echo: {msg}")
+    logger.info("Echo: %s", msg)
     return msg
 
 
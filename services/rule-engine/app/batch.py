@@ -0,0 +1,233 @@
+"""
+Vectorized batch screening for bulk payouts.
+
+Rows are loaded once into columnar arrays - a float64 array for numeric
+tests and an integer code array (values factorized through a dict) for
+equality / membership tests. Every compiled rule then becomes a NumPy mask
+over the batch. The single-transaction discrimination index is reused: a rule
+keyed on ``field == value`` only looks at the rows carrying that value
+(pre-grouped by code), so most rules touch a handful of rows, not all of them.
+Identical conditions shared by many rules are computed once.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rules import ACTIONS, CompiledRule, Condition, RuleSet, index_key
+
+_SEVERITY = {action: rank for rank, action in enumerate(ACTIONS)}
+_MISSING = object()
+
+
+class _Column:
+    """One field of the batch in vectorizable form."""
+
+    def __init__(self, values: Sequence[Any]) -> None:
+        n = len(values)
+        self.raw = values
+        self.has = np.fromiter((v is not _MISSING for v in values), dtype=bool, count=n)
+        self.notnull = self.has & np.fromiter((v is not None for v in values), dtype=bool, count=n)
+
+        self.lookup: Dict[Any, int] = {}
+        codes = np.full(n, -1, dtype=np.int64)
+        numeric = np.full(n, np.nan)
+        for i, v in enumerate(values):
+            if v is _MISSING:
+                continue
+            try:
+                codes[i] = self.lookup.setdefault(v, len(self.lookup))
+            except TypeError:
+                pass  # unhashable: never equal to a rule constant
+            if isinstance(v, (int, float)):
+                numeric[i] = float(v)
+        self.codes = codes
+        self.numeric = numeric
+        self._groups: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def code(self, value: Any) -> int:
+        try:
+            return self.lookup.get(value, -2)
+        except TypeError:
+            return -2
+
+    def rows_with(self, values: Iterable[Any]) -> np.ndarray:
+        """Row indices whose value is any of ``values`` (grouped once, then sliced)."""
+        if self._groups is None:
+            order = np.argsort(self.codes, kind="stable")
+            self._groups = (order, self.codes[order])
+        order, sorted_codes = self._groups
+        parts = []
+        for value in values:
+            code = self.code(value)
+            if code < 0:
+                continue
+            lo, hi = np.searchsorted(sorted_codes, [code, code + 1])
+            parts.append(order[lo:hi])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0]
+
+
+class ColumnarBatch:
+    """Rows pivoted into columns for the fields a ruleset reads."""
+
+    def __init__(self, columns: Mapping[str, Sequence[Any]], size: int) -> None:
+        self.size = size
+        self.columns = {name: _Column(values) for name, values in columns.items()}
+        self._empty = _Column([_MISSING] * size)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Mapping[str, Any]], fields: Iterable[str]) -> "ColumnarBatch":
+        return cls({f: [row.get(f, _MISSING) for row in rows] for f in fields}, len(rows))
+
+    @classmethod
+    def from_columns(cls, columns: Mapping[str, Sequence[Any]], fields: Iterable[str]) -> "ColumnarBatch":
+        sizes = {len(v) for v in columns.values()}
+        if len(sizes) > 1:
+            raise ValueError("All columns must have the same length")
+        size = sizes.pop() if sizes else 0
+        return cls({f: columns[f] if f in columns else [_MISSING] * size for f in fields}, size)
+
+    def column(self, name: str) -> _Column:
+        return self.columns.get(name, self._empty)
+
+
+def _mask(batch: ColumnarBatch, cond: Condition, rows: Optional[np.ndarray]) -> np.ndarray:
+    """Vectorized equivalent of ``rules._compile_condition`` over ``rows`` (None = all)."""
+    col = batch.column(cond.field)
+
+    def take(arr: np.ndarray) -> np.ndarray:
+        return arr if rows is None else arr[rows]
+
+    op = cond.op
+    if op == "exists":
+        return take(col.has)
+    if op == "not_exists":
+        return ~take(col.has)
+    if op == "==":
+        return take(col.notnull) & (take(col.codes) == col.code(cond.value))
+    if op == "!=":
+        return take(col.notnull) & (take(col.codes) != col.code(cond.value))
+    if op in ("in", "not_in"):
+        codes = [c for c in (col.code(v) for v in cond.value) if c >= 0]
+        member = np.isin(take(col.codes), codes)
+        return member if op == "in" else take(col.has) & ~member
+    if op in (">", ">=", "<", "<="):
+        values = take(col.numeric)
+        with np.errstate(invalid="ignore"):
+            if op == ">":
+                return values > cond.value
+            if op == ">=":
+                return values >= cond.value
+            if op == "<":
+                return values < cond.value
+            return values <= cond.value
+
+    # "contains" has no columnar form; fall back per row
+    raw = col.raw if rows is None else [col.raw[i] for i in rows]
+
+    def contains(v: Any) -> bool:
+        try:
+            return v is not _MISSING and v is not None and cond.value in v
+        except TypeError:
+            return False
+    return np.fromiter((contains(v) for v in raw), dtype=bool, count=len(raw))
+
+
+def _referenced_fields(ruleset: RuleSet) -> List[str]:
+    return sorted({cond.field for rule in ruleset.rules for cond in rule.conditions})
+
+
+def _rule_rows(batch: ColumnarBatch, rule: CompiledRule, cache: Dict[Condition, np.ndarray]) -> np.ndarray:
+    """Indices of the rows ``rule`` matches."""
+    key = index_key(rule.conditions)
+    if key is not None and rule.conditions[key].op in ("==", "in"):
+        cond = rule.conditions[key]
+        values = [cond.value] if cond.op == "==" else cond.value
+        rows = batch.column(cond.field).rows_with(values)
+        for i, other in enumerate(rule.conditions):
+            if i == key or not len(rows):
+                continue
+            rows = rows[_mask(batch, other, rows)]
+        return rows
+
+    mask = np.ones(batch.size, dtype=bool)
+    for cond in rule.conditions:
+        full = cache.get(cond)
+        if full is None:
+            full = cache[cond] = _mask(batch, cond, None)
+        mask &= full
+    return np.flatnonzero(mask)
+
+
+def screen(ruleset: RuleSet, batch: ColumnarBatch) -> Tuple[np.ndarray, List[List[str]]]:
+    """
+    Evaluate every rule over the batch.
+
+    Returns:
+        ``(actions, matched)``: per-row action names and matched rule ids in
+        definition order
+    """
+    hit_rows: List[np.ndarray] = []
+    hit_rules: List[np.ndarray] = []
+    cache: Dict[Condition, np.ndarray] = {}
+
+    for position, rule in enumerate(ruleset.rules):
+        rows = _rule_rows(batch, rule, cache)
+        if len(rows):
+            hit_rows.append(rows)
+            hit_rules.append(np.full(len(rows), position, dtype=np.int64))
+
+    severity = np.zeros(batch.size, dtype=np.int8)
+    matched: List[List[str]] = [[] for _ in range(batch.size)]
+    if hit_rows:
+        # Group hits by row (rule order preserved within a row)
+        all_rows = np.concatenate(hit_rows)
+        all_rules = np.concatenate(hit_rules)
+        order = np.lexsort((all_rules, all_rows))
+        all_rows, all_rules = all_rows[order], all_rules[order]
+
+        counts = np.bincount(all_rows, minlength=batch.size)
+        hit = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[hit]
+        rule_severity = np.array([_SEVERITY[r.action] for r in ruleset.rules], dtype=np.int8)
+        severity[hit] = np.maximum.reduceat(rule_severity[all_rules], starts)
+
+        ids = np.asarray([r.id for r in ruleset.rules], dtype=object)[all_rules].tolist()
+        bounds = np.cumsum(counts).tolist()
+        lo = 0
+        for row, hi in enumerate(bounds):
+            if hi != lo:
+                matched[row] = ids[lo:hi]
+            lo = hi
+
+    actions = np.asarray(ACTIONS, dtype=object)[severity]
+    return actions, matched
+
+
+def screen_rows(
+    ruleset: RuleSet,
+    rows: Optional[Sequence[Mapping[str, Any]]] = None,
+    columns: Optional[Mapping[str, Sequence[Any]]] = None,
+    id_field: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Screen row- or column-oriented input and return one decision per row."""
+    fields = _referenced_fields(ruleset)
+    if columns is not None:
+        batch = ColumnarBatch.from_columns(columns, fields)
+        ids = columns.get(id_field) if id_field else None
+    else:
+        rows = rows or []
+        batch = ColumnarBatch.from_rows(rows, fields)
+        ids = [row.get(id_field) for row in rows] if id_field else None
+
+    actions, matched = screen(ruleset, batch)
+    results = []
+    for i in range(batch.size):
+        item = {"row": i, "action": actions[i], "matched_rules": matched[i]}
+        if ids is not None:
+            item["id"] = ids[i]
+        results.append(item)
+    return results
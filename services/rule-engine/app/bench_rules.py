@@ -0,0 +1,95 @@
+"""
+Latency benchmark: one transaction against a compiled 10k-rule set.
+
+Usage (inside the rule-engine container):
+    python bench_rules.py [rules] [iterations]
+
+Target: p99 below 1 ms.
+"""
+import random
+import sys
+import time
+
+from rules import RuleSet
+
+COUNTRIES = [f"C{i:03d}" for i in range(200)]
+MCCS = [f"{5000 + i}" for i in range(400)]
+CHANNELS = ["web", "app", "pos", "api"]
+CURRENCIES = ["USD", "EUR", "GBP", "INR", "AED", "JPY"]
+
+
+def make_rules(count: int, rng: random.Random) -> list:
+    rules = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.45:
+            when = [
+                {"field": "merchant_id", "op": "==", "value": f"M{rng.randrange(20000)}"},
+                {"field": "amount", "op": ">", "value": rng.randrange(100, 100000)},
+            ]
+        elif kind < 0.70:
+            when = [
+                {"field": "mcc", "op": "in", "value": rng.sample(MCCS, 3)},
+                {"field": "channel", "op": "==", "value": rng.choice(CHANNELS)},
+                {"field": "amount", "op": ">=", "value": rng.randrange(1000, 500000)},
+            ]
+        elif kind < 0.90:
+            when = [
+                {"field": "country", "op": "==", "value": rng.choice(COUNTRIES)},
+                {"field": "currency", "op": "!=", "value": rng.choice(CURRENCIES)},
+            ]
+        elif kind < 0.995:
+            when = [{"field": "amount", "op": ">", "value": rng.randrange(1_000_000, 50_000_000)}]
+        else:
+            # No indexable test: always evaluated
+            when = [{"field": "note", "op": "contains", "value": rng.choice(["test", "crypto", "gift"])}]
+        rules.append({"id": f"R{i}", "action": rng.choice(["flag", "review", "block"]), "when": when})
+    return rules
+
+
+def make_txn(rng: random.Random) -> dict:
+    return {
+        "merchant_id": f"M{rng.randrange(20000)}",
+        "mcc": rng.choice(MCCS),
+        "channel": rng.choice(CHANNELS),
+        "country": rng.choice(COUNTRIES),
+        "currency": rng.choice(CURRENCIES),
+        "amount": rng.randrange(1, 10_000_000),
+        "device_risk": rng.random(),
+        "note": "payout batch",
+    }
+
+
+def main(rule_count: int = 10_000, iterations: int = 20_000) -> None:
+    rng = random.Random(7)
+    definitions = make_rules(rule_count, rng)
+
+    start = time.perf_counter()
+    ruleset = RuleSet.compile(definitions)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    txns = [make_txn(rng) for _ in range(iterations)]
+    for txn in txns[:1000]:
+        ruleset.evaluate(txn)  # warm-up
+
+    samples = []
+    evaluated = 0
+    for txn in txns:
+        t0 = time.perf_counter()
+        decision = ruleset.evaluate(txn)
+        samples.append(time.perf_counter() - t0)
+        evaluated += decision.evaluated
+    samples.sort()
+
+    def pct(p: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * p))] * 1e6
+
+    print(f"rules={len(ruleset)} compile={compile_ms:.0f}ms iterations={iterations}")
+    print(f"avg rules evaluated per txn={evaluated / iterations:.1f}")
+    print(f"p50={pct(0.50):.1f}us p99={pct(0.99):.1f}us max={samples[-1] * 1e6:.1f}us")
+    print("PASS" if pct(0.99) < 1000 else "FAIL", "(target p99 < 1000us)")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*args)
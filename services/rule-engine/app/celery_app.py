@@ -1,7 +1,12 @@
 import os
 from celery import Celery
+from celery.signals import setup_logging
 from kombu import Queue
 
+from services.common.logs import configure_logging
+from services.common.profiler import install_celery as install_profiler
+from services.common.taskstats import install as install_task_accounting
+
 redis_password = os.getenv("REDIS_PASSWORD", "")
 default_broker = (
     f"redis://:{redis_password}@redis:6379/0" if redis_password else "redis://redis:6379/0"
@@ -26,3 +31,12 @@ celery_app.conf.update(
     task_queues=(Queue(queue_name),),
     broker_connection_retry_on_startup=True,
 )
+
+install_profiler()
+install_task_accounting(celery_app)
+
+
+@setup_logging.connect
+def _setup_logging(**_kwargs):
+    """Log through the shared queue-backed JSON pipeline instead of Celery's handlers."""
+    configure_logging()
@@ -1,14 +1,82 @@
 import os
+import asyncio
 import base64
 import json
-from fastapi import FastAPI, HTTPException, Request
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional
 
-from services.common.auth import decode_token
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+from services.common.auth import decode_token, get_current_user, require_authenticated, require_roles
+from services.common.profiler import install as install_profiler
 from services.common.userinfo import extract_user_info
 
+from batch import screen_rows
+from celery_app import celery_app
+from registry import REDIS_URL, RulesetStore, VersionConflict, compile_document, load_bundled, registry, watch
+from rules import RuleError
+from velocity import VelocityCounters, feature_names
+
+logger = logging.getLogger(__name__)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
 
-app = FastAPI(title=SERVICE_NAME)
+# Risk/ops teams manage rulesets
+require_rules_admin = require_roles(["admin", "ops_user"])
+
+store: Optional[RulesetStore] = None
+counters: Optional[VelocityCounters] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global store, counters
+    bundled = load_bundled()
+    registry.activate(await asyncio.to_thread(compile_document, bundled))
+
+    sync_task = None
+    redis_client = None
+    if REDIS_URL:
+        import redis.asyncio as redis
+
+        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        store = RulesetStore(redis_client)
+        counters = VelocityCounters(redis_client)
+        try:
+            active, _ = await store.pointers()
+            if active is None:
+                # First pod up publishes the bundled ruleset for everyone
+                await store.point("active", await store.put(bundled))
+        except Exception as exc:
+            logger.warning("Ruleset store unavailable, serving bundled ruleset: %s", exc)
+        sync_task = asyncio.create_task(watch(registry, store))
+
+    yield
+
+    if sync_task is not None:
+        sync_task.cancel()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
+app = FastAPI(title=SERVICE_NAME, lifespan=lifespan)
+install_profiler(app)
+
+
+class BatchScreenRequest(BaseModel):
+    """Rows as objects (``rows``) or already columnar (``columns``)."""
+
+    rows: Optional[List[Dict[str, Any]]] = None
+    columns: Optional[Dict[str, List[Any]]] = None
+    id_field: Optional[str] = None
+
+
+class RulesetDocument(BaseModel):
+    version: str
+    rules: List[Dict[str, Any]]
+    mode: Literal["active", "shadow"] = "shadow"
 
 
 def decode_jwt_header(request: Request) -> dict:
@@ -70,3 +138,155 @@ def health(request: Request) -> dict:
 def readiness() -> dict[str, str]:
     """Readiness probe for upstream load balancers."""
     return {"status": "ready", "service": SERVICE_NAME}
+
+
+@app.post("/evaluate")
+async def evaluate(
+    txn: Dict[str, Any],
+    background_tasks: BackgroundTasks,
+    record: bool = True,
+    user: Dict[str, Any] = Depends(require_authenticated),
+) -> dict:
+    """
+    Evaluate fraud / AML / limit rules against one payment.
+
+    Velocity counters declared by the ruleset are updated and read in one
+    Redis round trip and exposed to rules as ``<counter>_count`` /
+    ``<counter>_amount``; ``record=false`` only reads them (near-cache first).
+
+    Returns the highest-severity action (allow, flag, review, block), the
+    ids of every rule that matched and the ruleset version that decided.
+    A shadow ruleset, if set, is replayed after the response is sent.
+    """
+    ruleset = registry.active
+    if ruleset.velocity:
+        owned = feature_names(ruleset.velocity)
+        txn = {k: v for k, v in txn.items() if k not in owned}
+    if ruleset.velocity and counters is not None:
+        try:
+            if record:
+                features = await counters.record(ruleset.velocity, txn)
+            else:
+                features = await counters.peek(ruleset.velocity, txn)
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+        except Exception as exc:
+            # Velocity rules simply do not fire; every other rule still runs
+            logger.warning("Velocity counters unavailable: %s", exc)
+            features = {}
+        txn = {**txn, **features}
+
+    decision, latency = registry.evaluate(txn, ruleset)
+    if registry.shadow is not None:
+        background_tasks.add_task(registry.evaluate_shadow, txn, decision, latency)
+    return decision.as_dict()
+
+
+@app.post("/evaluate/batch")
+async def evaluate_batch(body: BatchScreenRequest, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """
+    Screen a bulk payout batch in one call.
+
+    Every rule runs as a vectorized mask over all rows; returns one decision
+    per row (in input order) with the ids of the rules that matched. Velocity
+    counters are not updated by batch screening.
+    """
+    if body.rows is None and body.columns is None:
+        raise HTTPException(status_code=422, detail="Provide rows or columns")
+    ruleset = registry.active
+    try:
+        results = await asyncio.to_thread(screen_rows, ruleset, body.rows, body.columns, body.id_field)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {"ruleset_version": ruleset.version, "count": len(results), "results": results}
+
+
+@app.post("/evaluate/batch/async", status_code=202)
+def evaluate_batch_async(body: BatchScreenRequest, user: Dict[str, Any] = Depends(require_authenticated)) -> dict:
+    """Queue a batch for the rule-engine workers; poll ``/evaluate/batch/{task_id}``."""
+    if body.rows is None and body.columns is None:
+        raise HTTPException(status_code=422, detail="Provide rows or columns")
+    result = celery_app.send_task(
+        "rule_engine.screen_batch",
+        kwargs={"rows": body.rows, "columns": body.columns, "id_field": body.id_field},
+    )
+    return {"task_id": result.id}
+
+
+@app.get("/evaluate/batch/{task_id}")
+def evaluate_batch_result(task_id: str, user: Dict[str, Any] = Depends(get_current_user)) -> dict:
+    """Status, and once finished the decisions, of a queued batch."""
+    result = celery_app.AsyncResult(task_id)
+    if not result.ready():
+        return {"task_id": task_id, "status": result.status}
+    if result.failed():
+        return {"task_id": task_id, "status": result.status, "error": str(result.result)}
+    return {"task_id": task_id, "status": result.status, **result.result}
+
+
+@app.get("/rules")
+def list_rules(user: Dict[str, Any] = Depends(get_current_user)) -> dict:
+    """Rules in the active ruleset."""
+    ruleset = registry.active
+    return {
+        "version": ruleset.version,
+        "count": len(ruleset),
+        "rules": [{"id": r.id, "action": r.action, "description": r.description} for r in ruleset.rules],
+    }
+
+
+@app.get("/rulesets")
+def ruleset_status(user: Dict[str, Any] = Depends(require_rules_admin)) -> dict:
+    """Active and shadow versions with the shadow comparison so far."""
+    return registry.shadow_stats.as_dict()
+
+
+@app.put("/rulesets")
+async def publish_ruleset(doc: RulesetDocument, user: Dict[str, Any] = Depends(require_rules_admin)) -> dict:
+    """
+    Compile and publish a ruleset version without restarting pods.
+
+    ``mode="shadow"`` (default) evaluates it alongside the active ruleset;
+    ``mode="active"`` swaps it in directly. Other pods pick it up via Redis.
+    A version is immutable: republishing it with different rules is a 409.
+    """
+    body = {"version": doc.version, "rules": doc.rules}
+    try:
+        ruleset = await asyncio.to_thread(compile_document, body)
+    except RuleError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    if store is not None:
+        try:
+            await store.put(body)
+        except VersionConflict as exc:
+            raise HTTPException(status_code=409, detail=str(exc))
+        await store.point(doc.mode, ruleset.version)
+    if doc.mode == "active":
+        registry.activate(ruleset)
+    else:
+        registry.set_shadow(ruleset)
+    return {"version": ruleset.version, "mode": doc.mode, "rules": len(ruleset)}
+
+
+@app.post("/rulesets/shadow/promote")
+async def promote_shadow(user: Dict[str, Any] = Depends(require_rules_admin)) -> dict:
+    """Make the shadow ruleset active."""
+    candidate = registry.shadow
+    if candidate is None:
+        raise HTTPException(status_code=404, detail="No shadow ruleset")
+    if store is not None:
+        await store.point("active", candidate.version)
+        await store.point("shadow", None)
+    registry.activate(candidate)
+    registry.set_shadow(None)
+    return {"active": candidate.version}
+
+
+@app.delete("/rulesets/shadow")
+async def clear_shadow(user: Dict[str, Any] = Depends(require_rules_admin)) -> dict:
+    """Stop shadow evaluation."""
+    if store is not None:
+        await store.point("shadow", None)
+    registry.set_shadow(None)
+    return {"shadow": None}
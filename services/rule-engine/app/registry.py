@@ -0,0 +1,264 @@
+"""
+Versioned, hot-swappable rulesets.
+
+The evaluation path reads ``registry.active`` exactly once per decision and
+never takes a lock: new versions are compiled off the request path and then
+published by rebinding a single attribute, which is atomic in CPython. In-flight
+evaluations finish on the ruleset they started with.
+
+Rulesets are shared between pods through Redis::
+
+    rule-engine:rulesets:v:<version> JSON document {"version", "rules"}
+    rule-engine:rulesets:active      version currently serving decisions
+    rule-engine:rulesets:shadow      candidate evaluated alongside (optional)
+
+Each pod polls the two pointers and compiles any version it has not loaded yet.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Mapping, Optional, Tuple
+
+from rules import Decision, RuleError, RuleSet
+from velocity import parse_specs
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+RULESET_PATH = os.getenv(
+    "RULESET_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rulesets", "default.json")
+)
+RULESET_POLL_SECONDS = float(os.getenv("RULESET_POLL_SECONDS", "5"))
+_KEY_PREFIX = "rule-engine:rulesets"
+
+
+def document_version(doc: Any) -> str:
+    """Version declared by a ruleset document, or a content hash for bare rule lists."""
+    if isinstance(doc, Mapping) and doc.get("version"):
+        return str(doc["version"])
+    digest = hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()
+    return f"sha256:{digest[:12]}"
+
+
+def load_bundled(path: str = RULESET_PATH) -> Dict[str, Any]:
+    """Ruleset document shipped with the image."""
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def compile_document(doc: Any) -> RuleSet:
+    """
+    Compile ``{"version": ..., "rules": [...], "velocity": [...]}`` (or a bare
+    list of rules). Velocity counters travel with the rules that read them.
+    """
+    if not isinstance(doc, Mapping):
+        return RuleSet.compile(doc, version=document_version(doc))
+    try:
+        velocity = parse_specs(doc.get("velocity"))
+    except ValueError as exc:
+        raise RuleError(str(exc)) from None
+    ruleset = RuleSet.compile(doc.get("rules", []), version=document_version(doc))
+    ruleset.velocity = velocity
+    return ruleset
+
+
+class ShadowStats:
+    """Agreement and latency comparison between active and shadow rulesets."""
+
+    def __init__(self, samples: int = 10_000) -> None:
+        self._lock = threading.Lock()
+        self._samples = samples
+        self.reset(None, None)
+
+    def reset(self, active: Optional[str], shadow: Optional[str]) -> None:
+        with self._lock:
+            self.active_version = active
+            self.shadow_version = shadow
+            self.total = 0
+            self.agree = 0
+            self.transitions: Counter = Counter()
+            self.active_latency: Deque[float] = deque(maxlen=self._samples)
+            self.shadow_latency: Deque[float] = deque(maxlen=self._samples)
+
+    def record(self, active: Decision, active_secs: float, shadow: Decision, shadow_secs: float) -> None:
+        with self._lock:
+            if (active.version, shadow.version) != (self.active_version, self.shadow_version):
+                return  # comparison belongs to a pairing that has since changed
+            self.total += 1
+            if active.action == shadow.action and active.matched == shadow.matched:
+                self.agree += 1
+            if active.action != shadow.action:
+                self.transitions[f"{active.action}->{shadow.action}"] += 1
+            self.active_latency.append(active_secs)
+            self.shadow_latency.append(shadow_secs)
+
+    @staticmethod
+    def _percentiles(samples: Deque[float]) -> Dict[str, Optional[float]]:
+        ordered = sorted(samples)
+        if not ordered:
+            return {"p50_us": None, "p99_us": None}
+        return {
+            "p50_us": round(ordered[len(ordered) // 2] * 1e6, 1),
+            "p99_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6, 1),
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active_version": self.active_version,
+                "shadow_version": self.shadow_version,
+                "evaluations": self.total,
+                "agreement": (self.agree / self.total) if self.total else None,
+                "action_changes": dict(self.transitions),
+                "active_latency": self._percentiles(self.active_latency),
+                "shadow_latency": self._percentiles(self.shadow_latency),
+            }
+
+
+class RulesetRegistry:
+    """Holds the active and (optional) shadow ruleset references."""
+
+    def __init__(self) -> None:
+        self.active: RuleSet = RuleSet()
+        self.shadow: Optional[RuleSet] = None
+        self.shadow_stats = ShadowStats()
+        self._swap_lock = threading.Lock()  # serialises writers only
+
+    def activate(self, ruleset: RuleSet) -> None:
+        with self._swap_lock:
+            previous, self.active = self.active, ruleset
+            self.shadow_stats.reset(ruleset.version, self.shadow.version if self.shadow else None)
+        logger.info("Activated ruleset %s (%d rules, was %s)", ruleset.version, len(ruleset), previous.version)
+
+    def set_shadow(self, ruleset: Optional[RuleSet]) -> None:
+        with self._swap_lock:
+            self.shadow = ruleset
+            self.shadow_stats.reset(self.active.version, ruleset.version if ruleset else None)
+        logger.info("Shadow ruleset set to %s", ruleset.version if ruleset else None)
+
+    def evaluate(self, txn: Mapping[str, Any], ruleset: Optional[RuleSet] = None) -> Tuple[Decision, float]:
+        """
+        Evaluate on ``ruleset`` (default: the active one, read once); returns
+        the decision and its latency.
+        """
+        ruleset = ruleset if ruleset is not None else self.active
+        start = time.perf_counter()
+        decision = ruleset.evaluate(txn)
+        return decision, time.perf_counter() - start
+
+    def evaluate_shadow(self, txn: Mapping[str, Any], decision: Decision, latency: float) -> None:
+        """Replay ``txn`` on the shadow ruleset and record the comparison."""
+        shadow = self.shadow
+        if shadow is None:
+            return
+        start = time.perf_counter()
+        shadow_decision = shadow.evaluate(txn)
+        self.shadow_stats.record(decision, latency, shadow_decision, time.perf_counter() - start)
+
+
+class VersionConflict(Exception):
+    """A ruleset version was published again with different content."""
+
+
+def _canonical(doc: Any) -> str:
+    return json.dumps(doc, sort_keys=True, separators=(",", ":"))
+
+
+class RulesetStore:
+    """Redis-backed ruleset documents and active/shadow pointers."""
+
+    def __init__(self, redis_client: Any) -> None:
+        self._redis = redis_client
+
+    async def put(self, doc: Mapping[str, Any]) -> str:
+        """
+        Store ``doc`` under its version. Versions are immutable: pods compare
+        version strings only, so changed rules must get a new version.
+
+        Raises:
+            VersionConflict: If the version is stored with different content
+        """
+        version = document_version(doc)
+        key = f"{_KEY_PREFIX}:v:{version}"
+        encoded = _canonical(doc)
+        if not await self._redis.set(key, encoded, nx=True):
+            stored = await self._redis.get(key)
+            if stored is None or _canonical(json.loads(stored)) != encoded:
+                raise VersionConflict(f"Ruleset version {version} already exists with different rules")
+        return version
+
+    async def get(self, version: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(f"{_KEY_PREFIX}:v:{version}")
+        return json.loads(raw) if raw else None
+
+    async def point(self, slot: str, version: Optional[str]) -> None:
+        if version is None:
+            await self._redis.delete(f"{_KEY_PREFIX}:{slot}")
+        else:
+            await self._redis.set(f"{_KEY_PREFIX}:{slot}", version)
+
+    async def pointers(self) -> Tuple[Optional[str], Optional[str]]:
+        active, shadow = await self._redis.mget(f"{_KEY_PREFIX}:active", f"{_KEY_PREFIX}:shadow")
+        return active, shadow
+
+
+async def load_version(store: RulesetStore, version: str) -> Optional[RuleSet]:
+    """Fetch and compile a stored version off the event loop."""
+    doc = await store.get(version)
+    if doc is None:
+        logger.warning("Ruleset %s is referenced but not stored", version)
+        return None
+    return await asyncio.to_thread(compile_document, doc)
+
+
+async def watch(registry: RulesetRegistry, store: RulesetStore, interval: float = RULESET_POLL_SECONDS) -> None:
+    """Keep this pod's registry in line with the pointers in Redis."""
+    rejected: set = set()
+    while True:
+        version = None
+        try:
+            active, shadow = await store.pointers()
+            if active and active != registry.active.version and active not in rejected:
+                version = active
+                ruleset = await load_version(store, active)
+                if ruleset is not None:
+                    registry.activate(ruleset)
+            current_shadow = registry.shadow.version if registry.shadow else None
+            if shadow != current_shadow and shadow not in rejected:
+                version = shadow
+                registry.set_shadow(await load_version(store, shadow) if shadow else None)
+        except asyncio.CancelledError:
+            raise
+        except RuleError as exc:
+            # Never retry a document that does not compile; keep serving the old one
+            rejected.add(version)
+            logger.error("Ruleset %s rejected: %s", version, exc)
+        except Exception as exc:
+            logger.warning("Ruleset sync failed: %s", exc)
+        await asyncio.sleep(interval)
+
+
+def active_ruleset_sync(redis_client: Any, current: Optional[RuleSet]) -> RuleSet:
+    """
+    Blocking variant for Celery workers: one GET of the active pointer per
+    call, recompiling only when the version has moved.
+    """
+    version = redis_client.get(f"{_KEY_PREFIX}:active") if redis_client is not None else None
+    if current is not None and (version is None or version == current.version):
+        return current
+    if version is not None:
+        raw = redis_client.get(f"{_KEY_PREFIX}:v:{version}")
+        if raw:
+            return compile_document(json.loads(raw))
+    return compile_document(load_bundled())
+
+
+# Process-wide registry used by the API and workers
+registry = RulesetRegistry()
@@ -0,0 +1,320 @@
+"""
+Rule DSL and compiled evaluator for fraud / AML / limit checks.
+
+A rule is a plain mapping (JSON or YAML friendly)::
+
+    {
+        "id": "AML-001",
+        "description": "Sanctioned destination country",
+        "action": "block",                  # block | review | flag
+        "when": [
+            {"field": "country", "op": "in", "value": ["IR", "KP"]},
+            {"field": "amount", "op": ">=", "value": 0}
+        ]
+    }
+
+All conditions of a rule must hold (AND); express OR as separate rules.
+
+Rules are compiled once into closures and filed into a discrimination index
+keyed by the fields they test: equality tests become hash buckets
+(``field -> value -> rules``), numeric thresholds become sorted arrays that
+are bisected, and only rules with neither land in the always-evaluated
+bucket. Evaluating a transaction therefore touches only the rules that can
+possibly match it.
+"""
+from __future__ import annotations
+
+import bisect
+import operator
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+Predicate = Callable[[Mapping[str, Any]], bool]
+
+# Highest severity wins when several rules match
+ACTIONS = ("allow", "flag", "review", "block")
+_SEVERITY = {action: rank for rank, action in enumerate(ACTIONS)}
+
+_COMPARE = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+_THRESHOLD_OPS = (">", ">=", "<", "<=")
+OPERATORS = tuple(_COMPARE) + ("in", "not_in", "contains", "exists", "not_exists")
+
+_MISSING = object()
+
+
+class RuleError(ValueError):
+    """Raised when a rule definition cannot be compiled."""
+
+
+@dataclass(frozen=True)
+class Condition:
+    field: str
+    op: str
+    value: Any = None
+
+
+@dataclass
+class CompiledRule:
+    """A rule with its residual predicate (conditions not covered by the index)."""
+
+    id: str
+    action: str
+    description: str
+    conditions: Tuple[Condition, ...]
+    residual: Optional[Predicate] = None
+
+    def matches(self, txn: Mapping[str, Any]) -> bool:
+        return self.residual is None or self.residual(txn)
+
+
+@dataclass
+class Decision:
+    """Outcome of evaluating one transaction."""
+
+    action: str
+    matched: List[str] = field(default_factory=list)
+    evaluated: int = 0
+    version: str = ""
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "action": self.action,
+            "matched_rules": self.matched,
+            "rules_evaluated": self.evaluated,
+            "ruleset_version": self.version,
+        }
+
+
+# --------------------------------------------------------------------- compile
+
+
+def _parse_condition(raw: Mapping[str, Any], rule_id: str) -> Condition:
+    try:
+        fname, op = raw["field"], raw["op"]
+    except KeyError as exc:
+        raise RuleError(f"Rule {rule_id}: condition missing {exc.args[0]!r}") from None
+    if op not in OPERATORS:
+        raise RuleError(f"Rule {rule_id}: unknown operator {op!r}")
+
+    value = raw.get("value")
+    if op in ("in", "not_in"):
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            raise RuleError(f"Rule {rule_id}: {op!r} needs a list value")
+        value = frozenset(value)
+    elif op in _THRESHOLD_OPS and not isinstance(value, (int, float)):
+        raise RuleError(f"Rule {rule_id}: {op!r} needs a numeric value")
+    return Condition(fname, op, value)
+
+
+def _compile_condition(cond: Condition) -> Predicate:
+    """Turn one condition into a closure over its constants."""
+    fname, value = cond.field, cond.value
+
+    if cond.op == "exists":
+        return lambda txn: txn.get(fname, _MISSING) is not _MISSING
+    if cond.op == "not_exists":
+        return lambda txn: txn.get(fname, _MISSING) is _MISSING
+    if cond.op in ("in", "not_in"):
+        negate = cond.op == "not_in"
+
+        def member(txn: Mapping[str, Any]) -> bool:
+            v = txn.get(fname, _MISSING)
+            if v is _MISSING:
+                return False
+            try:
+                return (v in value) != negate
+            except TypeError:
+                return negate
+        return member
+    if cond.op == "contains":
+        def contains(txn: Mapping[str, Any]) -> bool:
+            v = txn.get(fname)
+            try:
+                return v is not None and value in v
+            except TypeError:
+                return False
+        return contains
+
+    compare = _COMPARE[cond.op]
+
+    def check(txn: Mapping[str, Any]) -> bool:
+        v = txn.get(fname, _MISSING)
+        if v is _MISSING or v is None:
+            return False
+        try:
+            return compare(v, value)
+        except TypeError:
+            return False
+
+    return check
+
+
+def _conjunction(predicates: Sequence[Predicate]) -> Optional[Predicate]:
+    if not predicates:
+        return None
+    if len(predicates) == 1:
+        return predicates[0]
+    if len(predicates) == 2:
+        first, second = predicates
+        return lambda txn: first(txn) and second(txn)
+    preds = tuple(predicates)
+    return lambda txn: all(p(txn) for p in preds)
+
+
+def parse_rule(raw: Mapping[str, Any]) -> Tuple[str, str, str, Tuple[Condition, ...]]:
+    rule_id = str(raw.get("id") or "").strip()
+    if not rule_id:
+        raise RuleError("Rule without an id")
+    action = raw.get("action", "flag")
+    if action not in _SEVERITY or action == "allow":
+        raise RuleError(f"Rule {rule_id}: action must be one of flag, review, block")
+    when = raw.get("when") or []
+    if not isinstance(when, list):
+        raise RuleError(f"Rule {rule_id}: 'when' must be a list of conditions")
+    conditions = tuple(_parse_condition(c, rule_id) for c in when)
+    return rule_id, action, str(raw.get("description", "")), conditions
+
+
+# ----------------------------------------------------------------------- index
+
+
+class _ThresholdIndex:
+    """Rules keyed by one numeric threshold on one field, for one operator."""
+
+    def __init__(self, op: str, entries: List[Tuple[float, CompiledRule]]) -> None:
+        entries.sort(key=lambda e: e[0])
+        self.op = op
+        self.thresholds = [t for t, _ in entries]
+        self.rules = [r for _, r in entries]
+
+    def candidates(self, value: Any) -> List[CompiledRule]:
+        try:
+            if self.op == ">":    # t < v
+                return self.rules[:bisect.bisect_left(self.thresholds, value)]
+            if self.op == ">=":   # t <= v
+                return self.rules[:bisect.bisect_right(self.thresholds, value)]
+            if self.op == "<":    # t > v
+                return self.rules[bisect.bisect_right(self.thresholds, value):]
+            return self.rules[bisect.bisect_left(self.thresholds, value):]  # "<=": t >= v
+        except TypeError:
+            return []
+
+
+def index_key(conditions: Sequence[Condition]) -> Optional[int]:
+    """Pick the condition the index will discriminate on (equality first)."""
+    for i, cond in enumerate(conditions):
+        if cond.op in ("==", "in") and _hashable(cond.value):
+            return i
+    for i, cond in enumerate(conditions):
+        if cond.op in _THRESHOLD_OPS:
+            return i
+    return None
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class RuleSet:
+    """
+    Immutable compiled ruleset.
+
+    Build once with :meth:`compile`; :meth:`evaluate` is then lock-free and
+    safe to share across threads and coroutines.
+    """
+
+    def __init__(self, version: str = "empty") -> None:
+        self.version = version
+        self.velocity: Tuple[Any, ...] = ()  # velocity.VelocitySpec counters the rules read
+        self.rules: List[CompiledRule] = []
+        self._order: Dict[str, int] = {}
+        self._equality: Dict[str, Dict[Any, List[CompiledRule]]] = {}
+        self._thresholds: Dict[str, List[_ThresholdIndex]] = {}
+        self._always: List[CompiledRule] = []
+
+    @classmethod
+    def compile(cls, definitions: Iterable[Mapping[str, Any]], version: str = "unversioned") -> "RuleSet":
+        """
+        Compile rule definitions into an indexed ruleset.
+
+        Raises:
+            RuleError: On duplicate ids or malformed rules
+        """
+        ruleset = cls(version)
+        pending_thresholds: Dict[Tuple[str, str], List[Tuple[float, CompiledRule]]] = {}
+
+        for raw in definitions:
+            rule_id, action, description, conditions = parse_rule(raw)
+            if rule_id in ruleset._order:
+                raise RuleError(f"Duplicate rule id: {rule_id}")
+
+            key = index_key(conditions)
+            residual = [_compile_condition(c) for i, c in enumerate(conditions) if i != key]
+            rule = CompiledRule(rule_id, action, description, conditions, _conjunction(residual))
+            ruleset._order[rule_id] = len(ruleset.rules)
+            ruleset.rules.append(rule)
+
+            if key is None:
+                ruleset._always.append(rule)
+                continue
+
+            cond = conditions[key]
+            if cond.op == "==":
+                ruleset._equality.setdefault(cond.field, {}).setdefault(cond.value, []).append(rule)
+            elif cond.op == "in":
+                buckets = ruleset._equality.setdefault(cond.field, {})
+                for value in cond.value:
+                    buckets.setdefault(value, []).append(rule)
+            else:
+                pending_thresholds.setdefault((cond.field, cond.op), []).append((cond.value, rule))
+
+        for (fname, op), entries in pending_thresholds.items():
+            ruleset._thresholds.setdefault(fname, []).append(_ThresholdIndex(op, entries))
+        return ruleset
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def candidates(self, txn: Mapping[str, Any]) -> List[CompiledRule]:
+        """Rules whose index key is satisfied by ``txn``."""
+        found: List[CompiledRule] = list(self._always)
+        for fname, buckets in self._equality.items():
+            value = txn.get(fname, _MISSING)
+            if value is _MISSING:
+                continue
+            try:
+                bucket = buckets.get(value)
+            except TypeError:
+                continue
+            if bucket:
+                found.extend(bucket)
+        for fname, indexes in self._thresholds.items():
+            value = txn.get(fname)
+            if value is None:
+                continue
+            for index in indexes:
+                found.extend(index.candidates(value))
+        return found
+
+    def evaluate(self, txn: Mapping[str, Any]) -> Decision:
+        """Evaluate a transaction and return the highest-severity decision."""
+        candidates = self.candidates(txn)
+        matched = [rule for rule in candidates if rule.matches(txn)]
+        if not matched:
+            return Decision("allow", [], len(candidates), self.version)
+
+        # Candidates arrive grouped by index bucket; report in definition order
+        matched.sort(key=lambda r: self._order[r.id])
+        action = max((r.action for r in matched), key=_SEVERITY.__getitem__)
+        return Decision(action, [r.id for r in matched], len(candidates), self.version)
@@ -1,12 +1,31 @@
+import logging
 import time
 
+from batch import screen_rows
 from celery_app import celery_app
+from registry import REDIS_URL, active_ruleset_sync
+
+logger = logging.getLogger(__name__)
+
+_redis = None
+_ruleset = None
+
+
+def _active_ruleset():
+    """Active ruleset for this worker process, refreshed when the version moves."""
+    global _redis, _ruleset
+    if _redis is None and REDIS_URL:
+        import redis
+
+        _redis = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    _ruleset = active_ruleset_sync(_redis, _ruleset)
+    return _ruleset
 
 
 @celery_app.task(name="tasks.echo")
 def echo(msg):
     """Echo a message back."""
-    print(f"[RULE-ENGINE WORKER] Echo: {msg}")
+    logger.info("Echo: %s", msg)
     return msg
 
 
@@ -21,3 +40,11 @@ def slow(seconds):
     """Sleep for the provided duration and return it."""
     time.sleep(seconds)
     return seconds
+
+
+@celery_app.task(name="rule_engine.screen_batch")
+def screen_batch(rows=None, columns=None, id_field=None):
+    """Vectorized screening of a bulk payout batch on the active ruleset."""
+    ruleset = _active_ruleset()
+    results = screen_rows(ruleset, rows, columns, id_field)
+    return {"ruleset_version": ruleset.version, "count": len(results), "results": results}
@@ -0,0 +1,237 @@
+"""
+Sliding-window velocity counters backed by Redis.
+
+Each counter (e.g. "count/amount per card per 10 minutes") is split into
+fixed time buckets. A bucket is one small Redis hash ``{c: count, a: amount}``
+that expires shortly after it leaves the window, so memory per key is bounded
+by ``window / bucket + 1`` hashes no matter how many events arrive - unlike a
+sorted set of raw events.
+
+The window total is approximated the usual way: the buckets fully inside the
+window plus the oldest bucket weighted by the fraction still overlapping it.
+
+All counters touched by one transaction are read and incremented in a single
+pipelined round trip. Read-only checks are served from a short-lived
+in-process near-cache.
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+VELOCITY_CACHE_SECONDS = float(os.getenv("VELOCITY_CACHE_SECONDS", "1"))
+VELOCITY_CACHE_SIZE = int(os.getenv("VELOCITY_CACHE_SIZE", "50000"))
+_KEY_PREFIX = "rule-engine:vel"
+
+
+@dataclass(frozen=True)
+class VelocitySpec:
+    """
+    One windowed aggregate.
+
+    Exposed to rules as ``<name>_count`` and ``<name>_amount``.
+    """
+
+    name: str
+    key_field: str
+    window_seconds: int
+    bucket_seconds: int
+    amount_field: str = "amount"
+
+    @property
+    def buckets(self) -> int:
+        return self.window_seconds // self.bucket_seconds
+
+    @classmethod
+    def parse(cls, raw: Mapping[str, Any]) -> "VelocitySpec":
+        try:
+            spec = cls(
+                name=str(raw["name"]),
+                key_field=str(raw["key_field"]),
+                window_seconds=int(raw["window_seconds"]),
+                bucket_seconds=int(raw.get("bucket_seconds") or max(1, int(raw["window_seconds"]) // 10)),
+                amount_field=str(raw.get("amount_field", "amount")),
+            )
+        except (KeyError, TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid velocity spec {raw!r}: {exc}") from None
+        if spec.bucket_seconds <= 0 or spec.window_seconds % spec.bucket_seconds:
+            raise ValueError(f"Velocity {spec.name}: window must be a multiple of bucket_seconds")
+        return spec
+
+
+def parse_specs(raw: Optional[Iterable[Mapping[str, Any]]]) -> Tuple[VelocitySpec, ...]:
+    specs = tuple(VelocitySpec.parse(item) for item in (raw or ()))
+    names = [s.name for s in specs]
+    if len(names) != len(set(names)):
+        raise ValueError("Duplicate velocity counter name")
+    return specs
+
+
+def feature_names(specs: Iterable[VelocitySpec]) -> frozenset:
+    """Fields the counters own; callers must not be able to supply them."""
+    return frozenset(f"{spec.name}_{kind}" for spec in specs for kind in ("count", "amount"))
+
+
+def _bucket_layout(spec: VelocitySpec, now: float) -> Tuple[int, float]:
+    """Current bucket index and the weight of the oldest (partial) bucket."""
+    current = int(now // spec.bucket_seconds)
+    elapsed = (now - current * spec.bucket_seconds) / spec.bucket_seconds
+    return current, 1.0 - elapsed
+
+
+def _bucket_key(spec: VelocitySpec, subject: str, index: int) -> str:
+    return f"{_KEY_PREFIX}:{spec.name}:{subject}:{index}"
+
+
+def _aggregate(spec: VelocitySpec, rows: Sequence[Sequence[Optional[str]]], oldest_weight: float) -> Tuple[float, float]:
+    """Sum buckets oldest-first, weighting the oldest one."""
+    count = amount = 0.0
+    for i, (c, a) in enumerate(rows):
+        weight = oldest_weight if i == 0 else 1.0
+        count += weight * int(c or 0)
+        amount += weight * int(a or 0)
+    return count, amount
+
+
+def minor_units(value: Any) -> int:
+    """
+    An amount in integer minor units; ``None`` counts as 0.
+
+    Raises:
+        ValueError: If the amount is fractional or not a number
+    """
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool):
+        raise ValueError(f"Amount must be integer minor units, got {value!r}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    raise ValueError(f"Amount must be integer minor units, got {value!r}")
+
+
+class VelocityCounters:
+    """Pipelined Redis velocity counters with a read-only near-cache."""
+
+    def __init__(self, redis_client: Any, cache_seconds: float = VELOCITY_CACHE_SECONDS,
+                 cache_size: int = VELOCITY_CACHE_SIZE) -> None:
+        self._redis = redis_client
+        self._cache_seconds = cache_seconds
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Tuple[float, float]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def _subjects(specs: Sequence[VelocitySpec], txn: Mapping[str, Any]) -> List[Tuple[VelocitySpec, str]]:
+        subjects = []
+        for spec in specs:
+            value = txn.get(spec.key_field)
+            if value is not None and value != "":
+                subjects.append((spec, str(value)))
+        return subjects
+
+    @staticmethod
+    def _features(values: Dict[str, Tuple[float, float]]) -> Dict[str, Any]:
+        features: Dict[str, Any] = {}
+        for name, (count, amount) in values.items():
+            features[f"{name}_count"] = math.ceil(count - 1e-9)
+            features[f"{name}_amount"] = math.ceil(amount - 1e-9)
+        return features
+
+    async def record(self, specs: Sequence[VelocitySpec], txn: Mapping[str, Any],
+                     now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Count ``txn`` in every applicable window and return the windowed
+        totals (including this transaction) as rule features.
+
+        Raises:
+            ValueError: If a counted amount is not integer minor units
+        """
+        now = time.time() if now is None else now
+        subjects = self._subjects(specs, txn)
+        if not subjects:
+            return {}
+        # Validate before counting anything
+        amounts = [minor_units(txn.get(spec.amount_field)) for spec, _ in subjects]
+
+        pipe = self._redis.pipeline(transaction=False)
+        layouts = []
+        for (spec, subject), amount in zip(subjects, amounts):
+            current, weight = _bucket_layout(spec, now)
+            layouts.append(weight)
+            key = _bucket_key(spec, subject, current)
+            pipe.hincrby(key, "c", 1)
+            pipe.hincrby(key, "a", amount)
+            pipe.expire(key, spec.window_seconds + 2 * spec.bucket_seconds)
+            for index in range(current - spec.buckets, current + 1):
+                pipe.hmget(_bucket_key(spec, subject, index), "c", "a")
+        replies = await pipe.execute()
+
+        values: Dict[str, Tuple[float, float]] = {}
+        pos = 0
+        for (spec, subject), weight in zip(subjects, layouts):
+            pos += 3  # hincrby, hincrby, expire
+            rows = replies[pos:pos + spec.buckets + 1]
+            pos += spec.buckets + 1
+            values[spec.name] = _aggregate(spec, rows, weight)
+            self._cache_put((spec.name, subject), values[spec.name], now)
+        return self._features(values)
+
+    async def peek(self, specs: Sequence[VelocitySpec], txn: Mapping[str, Any],
+                   now: Optional[float] = None) -> Dict[str, Any]:
+        """Windowed totals without counting ``txn``; near-cache first, then one round trip."""
+        now = time.time() if now is None else now
+        subjects = self._subjects(specs, txn)
+        values: Dict[str, Tuple[float, float]] = {}
+        misses: List[Tuple[VelocitySpec, str]] = []
+        for spec, subject in subjects:
+            cached = self._cache_get((spec.name, subject), now)
+            if cached is None:
+                misses.append((spec, subject))
+            else:
+                values[spec.name] = cached
+
+        if misses:
+            pipe = self._redis.pipeline(transaction=False)
+            layouts = []
+            for spec, subject in misses:
+                current, weight = _bucket_layout(spec, now)
+                layouts.append(weight)
+                for index in range(current - spec.buckets, current + 1):
+                    pipe.hmget(_bucket_key(spec, subject, index), "c", "a")
+            replies = await pipe.execute()
+
+            pos = 0
+            for (spec, subject), weight in zip(misses, layouts):
+                rows = replies[pos:pos + spec.buckets + 1]
+                pos += spec.buckets + 1
+                values[spec.name] = _aggregate(spec, rows, weight)
+                self._cache_put((spec.name, subject), values[spec.name], now)
+        return self._features(values)
+
+    # --------------------------------------------------------------- near-cache
+
+    def _cache_get(self, key: Tuple[str, str], now: float) -> Optional[Tuple[float, float]]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[0] < now:
+                return None
+            self._cache.move_to_end(key)
+            return entry[1]
+
+    def _cache_put(self, key: Tuple[str, str], value: Tuple[float, float], now: float) -> None:
+        if self._cache_seconds <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = (now + self._cache_seconds, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
@@ -0,0 +1,150 @@
+"""
+Keyset-paginated wallet history.
+
+A page is "the ``limit`` newest movements older than the cursor", where the
+cursor is the ``(created_at, id)`` of the previous page's last row, base64url
+encoded so clients treat it as opaque. The query seeks straight to that
+position in ``wallet_movements_history_idx`` (which stores every listed
+field), so page 500 costs the same as page 1 - unlike ``OFFSET``, which reads
+and discards every row before the page.
+
+Movements are append-only and new ones normally sort before the head, but
+``created_at`` comes from the writer's clock and is fixed before commit, so a
+skewed writer or a slow transaction can still land a row just behind a cursor
+already handed out. Pages after a cursor older than
+``WALLET_HISTORY_SETTLE_SECONDS`` (the clock offset plus commit latency we
+tolerate) no longer change and are cached in Redis for
+``WALLET_HISTORY_CACHE_TTL`` seconds; the first page and pages after more
+recent cursors are always read from the database. With prefetch enabled - per request
+(``?prefetch=true``) or by default (``WALLET_HISTORY_PREFETCH``) - the next
+page is loaded into the cache in the background while the client renders the
+current one, so a scroll is usually a cache hit.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Set, Tuple
+
+import store
+
+logger = logging.getLogger(__name__)
+
+WALLET_HISTORY_PAGE_SIZE = int(os.getenv("WALLET_HISTORY_PAGE_SIZE", "50"))
+WALLET_HISTORY_MAX_PAGE = int(os.getenv("WALLET_HISTORY_MAX_PAGE", "200"))
+WALLET_HISTORY_CACHE_TTL = int(os.getenv("WALLET_HISTORY_CACHE_TTL", "60"))
+# How old a cursor must be before the page after it is cached (max clock offset + commit time)
+WALLET_HISTORY_SETTLE_SECONDS = float(os.getenv("WALLET_HISTORY_SETTLE_SECONDS", "30"))
+WALLET_HISTORY_PREFETCH = os.getenv("WALLET_HISTORY_PREFETCH", "false").lower() in ("1", "true", "yes")
+_KEY_PREFIX = "wallet:history:v1"
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor was not issued by ``encode_cursor``."""
+
+
+def encode_cursor(created_at: datetime, movement_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), movement_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, movement_id = json.loads(raw)
+        position = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+    if not isinstance(movement_id, str):
+        raise InvalidCursor("Invalid cursor")
+    return position, movement_id
+
+
+def settled(cursor: str) -> bool:
+    """Whether no movement can still be committed after ``cursor`` (its page is cacheable)."""
+    position, _ = decode_cursor(cursor)
+    if position.tzinfo is None:
+        position = position.replace(tzinfo=timezone.utc)
+    return position < datetime.now(timezone.utc) - timedelta(seconds=WALLET_HISTORY_SETTLE_SECONDS)
+
+
+def load_page(account_id: str, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+    """One page from the database; ``next_cursor`` is ``None`` on the last page."""
+    after = decode_cursor(cursor) if cursor else None
+    rows = store.history_page(account_id, limit + 1, after)
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]["created_at"], items[-1]["id"]) if len(rows) > limit else None
+    for item in items:
+        item["created_at"] = item["created_at"].isoformat()
+    return {"items": items, "next_cursor": next_cursor}
+
+
+class HistoryPages:
+    """Pages of wallet history, read through Redis for cursor pages, with background prefetch."""
+
+    def __init__(self, redis_client: Any = None, ttl: int = WALLET_HISTORY_CACHE_TTL) -> None:
+        self._redis = redis_client
+        self.ttl = ttl
+        self._prefetching: Set[str] = set()
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def use_redis(self, redis_client: Any) -> None:
+        self._redis = redis_client
+
+    @staticmethod
+    def _key(account_id: str, cursor: str, limit: int) -> str:
+        return f"{_KEY_PREFIX}:{account_id}:{limit}:{cursor}"
+
+    async def get(self, account_id: str, cursor: Optional[str], limit: int) -> Dict[str, Any]:
+        """
+        Raises:
+            InvalidCursor: If ``cursor`` is malformed
+        """
+        if not cursor or self._redis is None or not settled(cursor):
+            return await asyncio.to_thread(load_page, account_id, cursor, limit)
+
+        key = self._key(account_id, cursor, limit)
+        try:
+            raw = await self._redis.get(key)
+        except Exception as exc:
+            logger.warning("Redis read failed for wallet history of %s: %s", account_id, exc)
+            raw = None
+        if raw is not None:
+            return json.loads(raw)
+        page = await asyncio.to_thread(load_page, account_id, cursor, limit)
+        await self._fill(key, page)
+        return page
+
+    async def _fill(self, key: str, page: Dict[str, Any]) -> None:
+        try:
+            await self._redis.set(key, json.dumps(page), ex=self.ttl)
+        except Exception as exc:
+            logger.warning("Redis fill failed for wallet history %s: %s", key, exc)
+
+    def prefetch(self, account_id: str, cursor: str, limit: int) -> None:
+        """Load the page after ``cursor`` into the cache in the background (no-op if it is not cached)."""
+        if self._redis is None or not settled(cursor):
+            return
+        key = self._key(account_id, cursor, limit)
+        if key in self._prefetching:
+            return
+        self._prefetching.add(key)
+
+        async def run() -> None:
+            try:
+                if await self._redis.exists(key):
+                    return
+                page = await asyncio.to_thread(load_page, account_id, cursor, limit)
+                await self._fill(key, page)
+            except Exception as exc:
+                logger.warning("Wallet history prefetch failed for %s: %s", account_id, exc)
+            finally:
+                self._prefetching.discard(key)
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -1,14 +1,52 @@
 import os
+import asyncio
 import base64
 import json
-from fastapi import FastAPI, HTTPException, Request
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
 
-from services.common.auth import decode_token
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+
+from services.common.auth import decode_token, require_authenticated
+from services.common.profiler import install as install_profiler
 from services.common.userinfo import extract_user_info
 
+import store
+from history import (
+    WALLET_HISTORY_MAX_PAGE, WALLET_HISTORY_PAGE_SIZE, WALLET_HISTORY_PREFETCH, HistoryPages, InvalidCursor,
+)
+
+logger = logging.getLogger(__name__)
+
 SERVICE_NAME = os.getenv("SERVICE_NAME", "svc-unknown")
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+history = HistoryPages()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.to_thread(store.create_schema)
+    except Exception as exc:
+        logger.warning("Wallet schema not ensured at startup: %s", exc)
+
+    redis_client = None
+    if REDIS_URL:
+        import redis.asyncio as redis
 
-app = FastAPI(title=SERVICE_NAME)
+        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        history.use_redis(redis_client)
+
+    yield
+
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
+app = FastAPI(title=SERVICE_NAME, lifespan=lifespan)
+install_profiler(app)
 
 
 def decode_jwt_header(request: Request) -> dict:
@@ -70,3 +108,30 @@ def health(request: Request) -> dict:
 def readiness() -> dict[str, str]:
     """Readiness probe for upstream load balancers."""
     return {"status": "ready", "service": SERVICE_NAME}
+
+
+@app.get("/wallets/{account_id}/history")
+async def wallet_history(
+    account_id: str,
+    limit: int = Query(WALLET_HISTORY_PAGE_SIZE, ge=1, le=WALLET_HISTORY_MAX_PAGE),
+    cursor: Optional[str] = Query(None, max_length=512),
+    prefetch: bool = WALLET_HISTORY_PREFETCH,
+    user: Dict[str, Any] = Depends(require_authenticated),
+) -> dict:
+    """
+    Movements of a wallet, newest first, ``limit`` at a time.
+
+    Pass the response's ``next_cursor`` as ``cursor`` for the next page; it
+    is ``null`` on the last one. Each page is an index seek from the cursor,
+    so deep pages are as fast as the first. With ``prefetch=true`` the
+    following page is loaded into the cache while this one is returned.
+    """
+    if account_id != user.get("sub") and "admin" not in user.get("roles", []):
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    try:
+        page = await history.get(account_id, cursor, limit)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if prefetch and page["next_cursor"]:
+        history.prefetch(account_id, page["next_cursor"], limit)
+    return page